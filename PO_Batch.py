@@ -0,0 +1,265 @@
+#  ------------------------------------------------------------------------
+#  File Name   : PO_Batch.py
+#  Description : Runs pulse-sequence files without the GUI
+#  Developer   : Dr. Kosuke Ohgo
+#  ULR         : https://github.com/ohgo1977/PO_GUI_Python
+#
+#  Usage:
+#    python PO_Batch.py INEPT.json
+#    python PO_Batch.py sequences/ -o results/ -n 4
+#    python PO_Batch.py sequences/ --optimize
+#    python PO_Batch.py HSQC.json --observe Sx,Sy --verify
+#
+#  A sequence file is JSON, for example
+#    {
+#      "spin_label": ["I", "S"],
+#      "rho": "Iz + Sz",
+#      "simp": "simplify",
+#      "steps": [
+#        {"pulse": "I", "phase": "x", "angle": "pi/2"},
+#        {"cs": "I", "angle": "oI*t"},
+#        {"jc": "IS", "angle": "pi*JIS*t"},
+#        {"pulse": "S", "phase": "f", "angle": "b"}
+#      ]
+#    }
+#  spin_label, rho and simp have the same defaults as PO_GUI.
+#  The phases x, y, -x and -y use rho.pulse, other phases rho.pulse_phshift.
+#  "simp" also accepts lazy, lazy-TR8, lazy-fu and race as in PO_GUI.
+#  "optimize": true (or --optimize) fuses consecutive CS/JC steps and removes
+#  rotations by multiples of 2*pi before the run (PO_Optimize.py).
+#  "observe": ["Ix"] (or --observe Ix) drops the terms that cannot become Ix
+#  in the remaining steps before each step (PO_Prune.py). "verify": true
+#  (or --verify) also runs the sequence without pruning and compares Ix.
+#  "cycle": {"phases": {"0": ["x", "y", "-x", "-y"]}, "receiver": ["x", "-x"]}
+#  runs a phase cycle (PO_Cycle.py). The keys of "phases" are indices of pulse
+#  steps; the steps from the first cycled pulse on become one phase_cycle
+#  operation, the receiver-weighted sum of all cycle steps.
+#  The result is written in the format of the Save button of PO_GUI.
+#
+#  MIT License, Copyright (c) 2023 Kosuke Ohgo. See LICENSE for details.
+#  ------------------------------------------------------------------------
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import time
+from multiprocessing.connection import wait
+
+from PO_Cycle import phase_angle
+from PO_Engine import CallProcess, Lazy_simp, PO_namespace, apply_operation
+
+Quadrature_phases = ['x', 'y', '-x', '-y']
+
+def as_list(v):
+    return list(v) if isinstance(v, (list, tuple)) else [v]
+
+def build_operation(step, table):
+    # Operation of PO_Engine from one step of a sequence file.
+    if 'pulse' in step:
+        spins = as_list(step['pulse'])
+        phases = as_list(step.get('phase', 'x'))
+        angles = [table.parse(str(v)) for v in as_list(step.get('angle', 'pi/2'))]
+        if all(ph in Quadrature_phases for ph in phases):
+            return ('pulse', (spins, phases, angles))
+        # Mixed phases: x, y, -x, -y become 0, pi/2, pi, 3*pi/2 for pulse_phshift.
+        return ('pulse_phshift', (spins, [phase_angle(v) if v in Quadrature_phases else table.parse(str(v))
+                                          for v in phases], angles))
+    elif 'cs' in step:
+        return ('cs', (as_list(step['cs']), [table.parse(str(v)) for v in as_list(step['angle'])]))
+    elif 'jc' in step:
+        return ('jc', (as_list(step['jc']), [table.parse(str(v)) for v in as_list(step['angle'])]))
+    elif 'simplify' in step:
+        return ('simplify', (step['simplify'],))
+    raise ValueError('Unknown step: ' + json.dumps(step))
+
+def build_cycle(ops, cycle, spin_label, simp, table):
+    # ops with the steps from the first cycled pulse on replaced by one
+    # ('phase_cycle', (steps, simp)) operation.
+    from PO_Cycle import Quadrature_phases, expand_cycle
+
+    def parse(ph):
+        return ph if ph in Quadrature_phases else table.parse(str(ph))
+    tables = dict((int(ii), [parse(ph) for ph in as_list(phases)]) for ii, phases in cycle.get('phases', {}).items())
+    for ii in tables:
+        if ops[ii][0] not in ('pulse', 'pulse_phshift'):
+            raise ValueError('Step ' + str(ii) + ' of the cycle is not a pulse')
+    receiver = [parse(ph) for ph in as_list(cycle.get('receiver', 'x'))]
+    start = min(tables) if len(tables) > 0 else len(ops)
+    steps = [(step_ops, rec, list(spin_label), n) for step_ops, rec, n in
+             expand_cycle(ops[start:], dict((ii - start, t) for ii, t in tables.items()), receiver)]
+    return ops[:start] + [('phase_cycle', (steps, simp))]
+
+def read_sequence(file):
+    with open(file) as fob:
+        seq = json.load(fob)
+    seq.setdefault('spin_label', ['I', 'S'])
+    seq.setdefault('rho', ' + '.join(SL + 'z' for SL in seq['spin_label']))
+    seq.setdefault('simp', 'simplify')
+    seq.setdefault('steps', [])
+    seq.setdefault('optimize', False)
+    seq.setdefault('observe', [])
+    seq.setdefault('verify', False)
+    return seq
+
+def run_sequence(seq, final_state=False):
+    # Returns (text of the Save button, list of seconds per step, number of
+    # operations removed by the optimization), and the final rho if final_state.
+    simp = seq['simp']
+    PO_simp = simp
+    final = None
+    racer = None
+    if simp.startswith('lazy'):
+        PO_simp = Lazy_simp
+        final = simp[5:] if len(simp) > 5 else 'simplify'
+    elif simp == 'race':
+        from PO_Race import Racer
+        PO_simp = Lazy_simp
+        racer = Racer()
+    table = PO_namespace(seq['spin_label'], PO_simp)
+    rho = table.parse(seq['rho'])
+    ops = [build_operation(step, table) for step in seq['steps']]
+    if 'cycle' in seq:
+        ops = build_cycle(ops, seq['cycle'], seq['spin_label'], PO_simp, table)
+    saved = 0
+    if seq.get('optimize', False):
+        from PO_Optimize import optimize_sequence
+        ops, saved = optimize_sequence(ops)
+    if final is not None:
+        ops.append(('simplify', (final,)))
+    pruner = None
+    if len(seq.get('observe', [])) > 0:
+        from PO_Prune import Pruner
+        pruner = Pruner(seq['spin_label'], seq['observe'], ops)
+
+    segments = [str(rho.logs)]
+    timing = []
+    for ii, op in enumerate(ops):
+        t0 = time.perf_counter()
+        if pruner is not None:
+            rho = pruner.prune(rho, ii)
+        new_rho = apply_operation(rho, op)
+        if racer is not None and op[0] != 'simplify':
+            from PO_Race import race_simplify
+            new_rho = race_simplify(new_rho, racer)
+        timing.append(time.perf_counter() - t0)
+        segments.append(new_rho.logs[len(rho.logs):])
+        rho = new_rho
+    text = 'Simplification: ' + simp + '\n' + 'Initial Density Operator: ' + '\n'.join(segments)
+    if pruner is not None:
+        text = 'Observable: ' + ', '.join(seq['observe']) + ' (' + str(pruner.dropped) + ' terms pruned)\n' + text
+        if seq.get('verify', False):
+            check_pruning(seq, rho)
+    if final_state:
+        return text, timing, saved, rho
+    return text, timing, saved
+
+def check_pruning(seq, rho):
+    # Compare the observable of the pruned result rho with the unpruned run.
+    from PO_Prune import same_observable
+    text, timing, saved, full = run_sequence(dict(seq, observe=[]), final_state=True)
+    if not same_observable(rho, full, seq['spin_label'], seq['observe']):
+        raise RuntimeError('Pruned result does not match the unpruned result')
+
+def run_file(file, out_dir=None, options=None):
+    # Run one sequence file and write its log next to it (or into out_dir).
+    # options override the settings of the file (optimize, observe, verify).
+    t0 = time.perf_counter()
+    try:
+        seq = read_sequence(file)
+        seq.update(options or {})
+        text, timing, saved = run_sequence(seq)
+        error = ''
+    except Exception as e:
+        text, timing, saved, error = None, [], 0, repr(e)
+    base = os.path.splitext(os.path.basename(file))[0]
+    out_file = os.path.join(out_dir or os.path.dirname(file), base + '.txt')
+    if text is not None:
+        with open(out_file, 'w') as fob:
+            fob.write(text)
+    return {'file': file, 'output': out_file if text is not None else '', 'seconds': time.perf_counter() - t0,
+            'steps': len(timing), 'saved': saved, 'step_seconds': timing, 'error': error}
+
+def map_processes(func, args_list, processes=None):
+    # [func(*args) for args in args_list], each call in a fresh process, at
+    # most processes at a time. PO.create() is class state, so each call
+    # needs its own process. The processes are not daemonic (unlike the
+    # workers of multiprocessing.Pool), so a race (simp "race") can start
+    # its own processes.
+    processes = processes or os.cpu_count() or 1
+    results = [None]*len(args_list)
+    todo = list(enumerate(args_list))[::-1]
+    running = {} # connection -> (index, CallProcess)
+    while len(todo) > 0 or len(running) > 0:
+        while len(todo) > 0 and len(running) < processes:
+            ii, args = todo.pop()
+            call = CallProcess(func, args, daemon=False)
+            running[call.conn] = (ii, call)
+        for conn in wait(list(running)):
+            ii, call = running.pop(conn)
+            status, value = call.recv()
+            if status != 'done':
+                for jj, other in running.values():
+                    other.terminate()
+                raise RuntimeError(value)
+            results[ii] = value
+    return results
+
+def run_files(files, out_dir=None, processes=None, options=None):
+    # One fresh process per file (map_processes).
+    return map_processes(run_file, [(file, out_dir, options) for file in files], processes)
+
+def find_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, f) for f in sorted(os.listdir(path)) if f.endswith('.json'))
+        else:
+            files.append(path)
+    return files
+
+def write_timing(results, file):
+    with open(file, 'w', newline='') as fob:
+        writer = csv.writer(fob)
+        writer.writerow(['file', 'seconds', 'steps', 'saved', 'step_seconds', 'error'])
+        for r in results:
+            writer.writerow([r['file'], '%.4f' % r['seconds'], r['steps'], r['saved'],
+                             ' '.join('%.4f' % t for t in r['step_seconds']), r['error']])
+
+def main():
+    parser = argparse.ArgumentParser(description='Run PO_GUI pulse-sequence files without the GUI.')
+    parser.add_argument('paths', nargs='+', help='Sequence files (.json) or directories of them')
+    parser.add_argument('-o', '--out', default=None, help='Output directory (default: next to each file)')
+    parser.add_argument('-n', '--processes', type=int, default=None, help='Number of processes (default: CPU count)')
+    parser.add_argument('--optimize', action='store_true', help='Fuse CS/JC steps and remove identity rotations')
+    parser.add_argument('--observe', default=None, help='Observable, e.g. Ix or Sx,Sy: prune the other terms')
+    parser.add_argument('--verify', action='store_true', help='Compare the pruned result with the unpruned one')
+    args = parser.parse_args()
+
+    options = {}
+    if args.optimize:
+        options['optimize'] = True
+    if args.observe is not None:
+        options['observe'] = args.observe.split(',')
+    if args.verify:
+        options['verify'] = True
+
+    files = find_files(args.paths)
+    if args.out is not None and not os.path.isdir(args.out):
+        os.makedirs(args.out)
+    t0 = time.perf_counter()
+    if len(files) == 1 or args.processes == 1:
+        results = [run_file(file, args.out, options) for file in files]
+    else:
+        results = run_files(files, args.out, args.processes, options)
+    for r in results:
+        status = 'Error: ' + r['error'] if r['error'] else r['output']
+        saved = ' (%d operations saved)' % r['saved'] if r['saved'] > 0 else ''
+        print('%8.3f s  %s -> %s%s' % (r['seconds'], r['file'], status, saved))
+    print('Total: %.3f s for %d files' % (time.perf_counter() - t0, len(files)))
+    write_timing(results, os.path.join(args.out or '.', 'PO_Batch_timing.csv'))
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    main()
@@ -0,0 +1,211 @@
+#  ------------------------------------------------------------------------
+#  File Name   : PO_Benchmark.py
+#  Description : Benchmark of canonical pulse sequences for PO_GUI
+#                Runs the operations of the GUI (pulse, pulse_phshift, cs, jc)
+#                for 2 to 5 spins and each simplification method, and
+#                compares the timing with a stored baseline.
+#  Developer   : Dr. Kosuke Ohgo
+#  ULR         : https://github.com/ohgo1977/PO_GUI_Python
+#
+#  Usage:
+#    python PO_Benchmark.py --save-baseline baseline.json
+#    python PO_Benchmark.py --baseline baseline.json --threshold 0.2
+#    python PO_Benchmark.py -s INEPT HSQC --spins 2 3 --simp simplify -r 5
+#  The exit status is 1 when a case is slower than the baseline by more
+#  than the threshold (median total time).
+#
+#  MIT License, Copyright (c) 2023 Kosuke Ohgo. See LICENSE for details.
+#  ------------------------------------------------------------------------
+
+import argparse
+import csv
+import json
+import multiprocessing
+import platform
+import sys
+import time
+
+from PO_Batch import map_processes, run_sequence
+from PO_Engine import state_size, term_items
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+Spin_labels = ['I', 'S', 'K', 'L', 'M']
+
+####### Sequences #######
+# I and S are the coupled pair of each sequence (e.g. 1H and 13C). The other
+# spins are passive and coupled to I with J 'pi*JIK*d' during each delay d.
+# The steps have the format of PO_Batch.py.
+def pulse(spins, phase, angle):
+    return {'pulse': spins, 'phase': [phase]*len(spins), 'angle': [angle]*len(spins)}
+
+def delay(spin_label, angle, d='d'):
+    # J evolution of the IS pair by angle, and of the passive couplings for d.
+    steps = [{'jc': 'IS', 'angle': angle}]
+    for SL in spin_label[2:]:
+        steps.append({'jc': 'I' + SL, 'angle': 'pi*JI' + SL + '*' + d})
+    return steps
+
+def spin_echo(spin_label):
+    return ([pulse(['I'], 'x', 'pi/2'), {'cs': 'I', 'angle': 'oI*d'}] + delay(spin_label, 'pi*JIS*d') +
+            [pulse(['I'], 'x', 'pi'), {'cs': 'I', 'angle': 'oI*d'}] + delay(spin_label, 'pi*JIS*d'))
+
+def INEPT(spin_label):
+    # tau = 1/(4J)
+    return ([pulse(['I'], 'x', 'pi/2')] + delay(spin_label, 'pi/4') + [pulse(['I', 'S'], 'x', 'pi')] +
+            delay(spin_label, 'pi/4') + [pulse(['I'], 'y', 'pi/2'), pulse(['S'], 'x', 'pi/2')])
+
+def refocused_INEPT(spin_label):
+    return (INEPT(spin_label) + delay(spin_label, 'pi/4', 'd2') + [pulse(['I', 'S'], 'x', 'pi')] +
+            delay(spin_label, 'pi/4', 'd2'))
+
+def HSQC(spin_label):
+    # INEPT, t1 on S with a 180 on I, reverse INEPT
+    return (INEPT(spin_label) +
+            [{'cs': 'S', 'angle': 'oS*t1/2'}, pulse(['I'], 'x', 'pi'), {'cs': 'S', 'angle': 'oS*t1/2'},
+             pulse(['I', 'S'], 'x', 'pi/2')] +
+            delay(spin_label, 'pi/4') + [pulse(['I', 'S'], 'x', 'pi')] + delay(spin_label, 'pi/4'))
+
+def HMQC(spin_label):
+    # tau = 1/(2J)
+    return ([pulse(['I'], 'x', 'pi/2')] + delay(spin_label, 'pi/2') +
+            [pulse(['S'], 'x', 'pi/2'), {'cs': 'S', 'angle': 'oS*t1/2'}, pulse(['I'], 'x', 'pi'),
+             {'cs': 'S', 'angle': 'oS*t1/2'}, pulse(['S'], 'x', 'pi/2')] + delay(spin_label, 'pi/2'))
+
+def DQF(spin_label):
+    # DQF-COSY: 90(ph1) - t1 - 90(ph1) - 90(x), run with DQF_cycle.
+    return ([pulse(['I', 'S'], 'x', 'pi/2'), {'cs': ['I', 'S'], 'angle': ['oI*t1', 'oS*t1']}] +
+            delay(spin_label, 'pi*JIS*t1', 't1') +
+            [pulse(['I', 'S'], 'x', 'pi/2'), pulse(['I', 'S'], 'x', 'pi/2')])
+
+def DQF_cycle(spin_label):
+    # Double-quantum filter: ph1 = x y -x -y on the first two pulses,
+    # receiver x -x x -x (the "cycle" of PO_Batch.py, 4 steps).
+    steps = DQF(spin_label)
+    phases = ['x', 'y', '-x', '-y']
+    return {'phases': {0: phases, len(steps) - 2: phases}, 'receiver': ['x', '-x', 'x', '-x']}
+
+Sequences = {'spin_echo': spin_echo, 'INEPT': INEPT, 'refocused_INEPT': refocused_INEPT,
+             'HSQC': HSQC, 'HMQC': HMQC, 'DQF': DQF}
+Cycles = {'DQF': DQF_cycle} # Sequences run as a phase cycle
+####### Sequences #######
+
+####### Run #######
+def percentile(values, q):
+    import numpy as np
+    return float(np.percentile(values, q)) if len(values) > 0 else None
+
+def run_case(name, nspin, simp):
+    # One run in a fresh process. Returns the step times, the peak memory
+    # growth (ru_maxrss: kB on Linux, bytes on macOS) and the size of the final state.
+    spin_label = Spin_labels[:nspin]
+    seq = {'spin_label': spin_label, 'rho': spin_label[0] + 'z', 'simp': simp,
+           'steps': Sequences[name](spin_label)}
+    if name in Cycles:
+        seq['cycle'] = Cycles[name](spin_label)
+    mem0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource is not None else None
+    t0 = time.perf_counter()
+    text, timing, saved, rho = run_sequence(seq, final_state=True)
+    total = time.perf_counter() - t0
+    mem1 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource is not None else None
+    return {'total': total, 'steps': timing, 'terms': len(term_items(rho)), 'size': int(state_size(rho)),
+            'peak_kb': mem1 - mem0 if mem0 is not None else None}
+
+def case_key(name, nspin, simp):
+    return name + '/' + str(nspin) + '/' + simp
+
+def run_benchmark(names, spins, simps, repeat=3, processes=None):
+    # Returns {key: summary}. Each run is a fresh process (map_processes),
+    # so PO.create() and the memory of one case do not affect the next.
+    cases = [(name, nspin, simp) for name in names for nspin in spins for simp in simps]
+    runs = map_processes(run_case, [case for case in cases for ii in range(repeat)], processes)
+    results = {}
+    for ii, (name, nspin, simp) in enumerate(cases):
+        case_runs = runs[ii*repeat:(ii+1)*repeat]
+        totals = [r['total'] for r in case_runs]
+        steps = [t for r in case_runs for t in r['steps']]
+        peaks = [r['peak_kb'] for r in case_runs if r['peak_kb'] is not None]
+        results[case_key(name, nspin, simp)] = {
+            'sequence': name, 'spins': nspin, 'simp': simp, 'runs': repeat,
+            'total_p50': percentile(totals, 50), 'total_max': max(totals),
+            'step_p50': percentile(steps, 50), 'step_p90': percentile(steps, 90), 'step_p99': percentile(steps, 99),
+            'peak_kb': max(peaks) if len(peaks) > 0 else None,
+            'terms': case_runs[-1]['terms'], 'size': case_runs[-1]['size']}
+    return results
+####### Run #######
+
+####### Baseline #######
+def environment():
+    import sympy
+    return {'python': platform.python_version(), 'sympy': sympy.__version__, 'machine': platform.machine(),
+            'time': time.strftime('%Y-%m-%d %H:%M:%S')}
+
+def save_baseline(results, file):
+    with open(file, 'w') as fob:
+        json.dump({'environment': environment(), 'results': results}, fob, indent=1)
+
+def compare_baseline(results, file, threshold=0.2):
+    # Returns a list of (key, baseline s, current s, ratio, regression) for the
+    # cases in both. regression: median total time above (1 + threshold)*baseline.
+    with open(file) as fob:
+        baseline = json.load(fob)['results']
+    rows = []
+    for key, r in results.items():
+        if key not in baseline or not baseline[key]['total_p50']:
+            continue
+        ratio = r['total_p50']/baseline[key]['total_p50']
+        rows.append((key, baseline[key]['total_p50'], r['total_p50'], ratio, ratio > 1 + threshold))
+    return rows
+####### Baseline #######
+
+Columns = ['sequence', 'spins', 'simp', 'runs', 'total_p50', 'total_max', 'step_p50', 'step_p90', 'step_p99',
+           'peak_kb', 'terms', 'size']
+
+def write_csv(results, file):
+    with open(file, 'w', newline='') as fob:
+        writer = csv.DictWriter(fob, fieldnames=Columns)
+        writer.writeheader()
+        for r in results.values():
+            writer.writerow(r)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of canonical pulse sequences for PO_GUI.')
+    parser.add_argument('-s', '--sequences', nargs='+', default=list(Sequences), choices=list(Sequences))
+    parser.add_argument('--spins', nargs='+', type=int, default=[2, 3, 4, 5], choices=[2, 3, 4, 5])
+    parser.add_argument('--simp', nargs='+', default=['simplify', 'TR8', 'fu'], help='Simplification methods')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='Runs of each case')
+    parser.add_argument('-n', '--processes', type=int, default=None, help='Number of processes (default: CPU count)')
+    parser.add_argument('-o', '--out', default=None, help='CSV file of the results')
+    parser.add_argument('--save-baseline', default=None, help='Write the results as a baseline (JSON)')
+    parser.add_argument('--baseline', default=None, help='Compare with this baseline (JSON)')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Allowed slowdown against the baseline (0.2 = 20 %%)')
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    results = run_benchmark(args.sequences, args.spins, args.simp, args.repeat, args.processes)
+    print('%-16s %5s %-9s %9s %9s %9s %9s %9s %6s %8s' %
+          ('sequence', 'spins', 'simp', 'total', 'step p50', 'step p90', 'step p99', 'peak kB', 'terms', 'size'))
+    for r in results.values():
+        print('%-16s %5d %-9s %9.3f %9.4f %9.4f %9.4f %9s %6d %8d' %
+              (r['sequence'], r['spins'], r['simp'], r['total_p50'], r['step_p50'], r['step_p90'], r['step_p99'],
+               r['peak_kb'], r['terms'], r['size']))
+    print('Total: %.1f s' % (time.perf_counter() - t0))
+    if args.out is not None:
+        write_csv(results, args.out)
+    if args.save_baseline is not None:
+        save_baseline(results, args.save_baseline)
+
+    status = 0
+    if args.baseline is not None:
+        for key, base, now, ratio, regression in compare_baseline(results, args.baseline, args.threshold):
+            print('%-30s %9.3f s -> %9.3f s  x%.2f%s' % (key, base, now, ratio, '  REGRESSION' if regression else ''))
+            if regression:
+                status = 1
+    sys.exit(status)
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    main()
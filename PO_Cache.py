@@ -0,0 +1,172 @@
+#  ------------------------------------------------------------------------
+#  File Name   : PO_Cache.py
+#  Description : Persistent result cache for the operations of PO_GUI
+#                In-memory LRU backed by an SQLite file.
+#  Developer   : Dr. Kosuke Ohgo
+#  ULR         : https://github.com/ohgo1977/PO_GUI_Python
+#
+#  MIT License, Copyright (c) 2023 Kosuke Ohgo. See LICENSE for details.
+#  ------------------------------------------------------------------------
+
+import collections
+import copy
+import hashlib
+import os
+import pickle
+import queue
+import sqlite3
+import threading
+import time
+
+from PO_Engine import term_items
+
+Cache_format = 3 # Change when the key or the stored value changes
+
+def canonical(v):
+    # Text of an angle, a phase or a coefficient that does not depend on the session.
+    if isinstance(v, str):
+        return repr(v)
+    try:
+        import sympy
+        return sympy.srepr(sympy.sympify(v))
+    except Exception:
+        return repr(v)
+
+def cache_key(rho, op, simp, spin_label):
+    # sha256 of the incoming rho, the operation with its spins and angles/phases,
+    # PO.simp and the spin labels of PO.create(). PO objects do not carry their
+    # spin labels, so the caller (CalcEngine, PO_Server) passes them.
+    method, args = op
+    terms = sorted((axis, canonical(coef)) for axis, coef in term_items(rho))
+    text = repr((Cache_format, simp, tuple(spin_label), terms, method,
+                 [[canonical(v) for v in a] for a in args]))
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class ResultCache(object):
+    # get() and put() take the incoming rho, the operation and the spin labels.
+    # The stored value is the result with only the log segment of the operation,
+    # so a hit can be appended to any rho.logs.
+    def __init__(self, file, simp, mem_entries=256, disk_bytes=256*2**20):
+        self.file = file
+        self.simp = simp
+        self.mem_entries = mem_entries
+        self.disk_bytes = disk_bytes
+        self.mem = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        folder = os.path.dirname(file)
+        if len(folder) > 0 and not os.path.isdir(folder):
+            os.makedirs(folder)
+        self.db = sqlite3.connect(file)
+        self.db.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, size INTEGER, atime REAL)')
+        self.db.commit()
+
+    def get(self, rho, op, spin_label):
+        # Result of op applied to rho, or None.
+        try:
+            key = cache_key(rho, op, self.simp, spin_label)
+        except (AttributeError, TypeError):
+            return None
+        if key in self.mem:
+            self.mem.move_to_end(key)
+            value = self.mem[key]
+        else:
+            row = self.db.execute('SELECT value FROM cache WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.db.execute('UPDATE cache SET atime = ? WHERE key = ?', (time.time(), key))
+            self.db.commit()
+            value = pickle.loads(row[0])
+            self._keep(key, value)
+        self.hits += 1
+        result = copy.copy(value)
+        result.logs = rho.logs + value.logs
+        return result
+
+    def put(self, rho, op, result, spin_label):
+        try:
+            key = cache_key(rho, op, self.simp, spin_label)
+        except (AttributeError, TypeError):
+            return
+        value = copy.copy(result)
+        value.logs = result.logs[len(rho.logs):]
+        blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        self.db.execute('INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)', (key, blob, len(blob), time.time()))
+        self._evict_disk()
+        self.db.commit()
+        self._keep(key, value)
+
+    def _keep(self, key, value):
+        self.mem[key] = value
+        self.mem.move_to_end(key)
+        while len(self.mem) > self.mem_entries:
+            self.mem.popitem(last=False)
+
+    def _evict_disk(self):
+        # Remove the least recently used entries above disk_bytes.
+        total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM cache').fetchone()[0]
+        if total <= self.disk_bytes:
+            return
+        for key, size in self.db.execute('SELECT key, size FROM cache ORDER BY atime').fetchall():
+            if total <= self.disk_bytes:
+                break
+            self.db.execute('DELETE FROM cache WHERE key = ?', (key,))
+            self.mem.pop(key, None)
+            total -= size
+            self.evictions += 1
+
+    def stats(self):
+        entries, size = self.db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache').fetchone()
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'entries': entries, 'bytes': size}
+
+    def close(self):
+        self.db.close()
+
+class CacheThread(object):
+    # ResultCache on its own thread, for CalcEngine. The keys (srepr of all
+    # coefficients), pickling and the SQLite writes do not run on the caller's
+    # thread (the Tk mainloop). get() returns a queue that receives the result
+    # or None; put() does not wait.
+    def __init__(self, file, simp, mem_entries=256, disk_bytes=256*2**20):
+        self.requests = queue.Queue()
+        self.thread = threading.Thread(target=self._main, args=(file, simp, mem_entries, disk_bytes), daemon=True)
+        self.thread.start()
+
+    def _main(self, file, simp, mem_entries, disk_bytes):
+        cache = ResultCache(file, simp, mem_entries, disk_bytes)
+        while True:
+            request = self.requests.get()
+            if request is None:
+                break
+            method, args, reply = request
+            try:
+                value = getattr(cache, method)(*args)
+            except Exception as e: # The evaluation goes on without the cache
+                print('PO_Cache: ' + method + ' failed (' + repr(e) + ')')
+                value = None
+            if reply is not None:
+                reply.put(value)
+        cache.close()
+
+    def _call(self, method, *args):
+        reply = queue.Queue()
+        self.requests.put((method, args, reply))
+        return reply
+
+    def get(self, rho, op, spin_label):
+        return self._call('get', rho, op, spin_label)
+
+    def put(self, rho, op, result, spin_label):
+        self.requests.put(('put', (rho, op, result, spin_label), None))
+
+    def stats(self):
+        return self._call('stats').get()
+
+    def close(self):
+        # Pending puts are written first.
+        if self.thread.is_alive():
+            self.requests.put(None)
+            self.thread.join()
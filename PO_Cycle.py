@@ -0,0 +1,115 @@
+#  ------------------------------------------------------------------------
+#  File Name   : PO_Cycle.py
+#  Description : Phase cycling for PO_GUI
+#                Expands phase tables into cycle steps, evaluates them on a
+#                process pool (PO_Engine.PoolWorker in PO_GUI) and sums them
+#                with the receiver phases.
+#  Developer   : Dr. Kosuke Ohgo
+#  ULR         : https://github.com/ohgo1977/PO_GUI_Python
+#
+#  MIT License, Copyright (c) 2023 Kosuke Ohgo. See LICENSE for details.
+#  ------------------------------------------------------------------------
+
+import collections
+import math
+
+from PO_Engine import apply_operation, merge_terms, mp_context, op_label, scale_state
+
+Quadrature_phases = ['x', 'y', '-x', '-y']
+
+def phase_angle(phase):
+    # Receiver phase in rad. x, y, -x, -y or an expression.
+    import sympy
+    if phase in Quadrature_phases:
+        return Quadrature_phases.index(phase)*sympy.pi/2
+    return phase
+
+def set_phase(op, phase):
+    # Pulse operation op with a new phase ('x', 'y', '-x', '-y' or an expression).
+    method, args = op
+    sp_cell, q_cell = args[0], args[2]
+    if phase in Quadrature_phases:
+        return ('pulse', (sp_cell, [phase]*len(sp_cell), q_cell))
+    return ('pulse_phshift', (sp_cell, [phase]*len(sp_cell), q_cell))
+
+def expand_cycle(ops, tables, receiver):
+    # ops: operations after the common prefix.
+    # tables: dict of index in ops -> list of phases (pulses only).
+    # receiver: list of receiver phases.
+    # Step k uses table[k % len(table)]; the number of steps is the least
+    # common multiple of the table lengths. Identical steps are merged.
+    # Returns a list of (operations, receiver phase, count).
+    nstep = 1
+    for t in list(tables.values()) + [receiver]:
+        nstep = nstep*len(t)//math.gcd(nstep, len(t))
+    count = collections.OrderedDict()
+    for k in range(nstep):
+        step_ops = tuple(set_phase(op, tables[ii][k % len(tables[ii])]) if ii in tables else op
+                         for ii, op in enumerate(ops))
+        key = (repr(step_ops), repr(receiver[k % len(receiver)]))
+        if key not in count:
+            count[key] = [step_ops, receiver[k % len(receiver)], 0]
+        count[key][2] += 1
+    return [(list(step_ops), rec, n) for step_ops, rec, n in count.values()]
+
+def run_step(rho, ops, receiver, spin_label):
+    # One cycle step. The receiver phase rotates all spins about z by -phase.
+    for op in ops:
+        rho = apply_operation(rho, op)
+    angle = phase_angle(receiver)
+    if angle != 0:
+        for SL in spin_label:
+            rho = apply_operation(rho, ('cs', ([SL], [-angle])))
+    return rho
+
+def _run_step(args):
+    return run_step(*args)
+
+def sum_steps(rho, steps, results, simp):
+    # Receiver-weighted sum of the cycle steps (not divided by the number of steps).
+    nstep = sum(n for ops, rec, spin_label, n in steps)
+    parts = [scale_state(r, n) if n > 1 else r for r, (ops, rec, spin_label, n) in zip(results, steps)]
+    total = merge_terms(parts, simp) if len(parts) > 1 else parts[0]
+    total.logs = rho.logs + '\nPhase cycle: sum of ' + str(nstep) + ' steps, receiver ' + \
+        ' '.join(str(rec) for ops, rec, spin_label, n in steps) + '\n' + str(total)
+    return total
+
+def run_steps(rho, steps, simp):
+    # Serial version (replay of a ('phase_cycle', (steps, simp)) operation).
+    # steps: list of (operations, receiver phase, spin labels, count).
+    results = [run_step(rho, ops, rec, spin_label) for ops, rec, spin_label, n in steps]
+    return sum_steps(rho, steps, results, simp)
+
+def cycle_operation(ops, tables, receiver, spin_label, simp):
+    # ('phase_cycle', (steps, simp)) operation for PO_Engine (see expand_cycle).
+    steps = [(step_ops, rec, list(spin_label), n) for step_ops, rec, n in expand_cycle(ops, tables, receiver)]
+    return ('phase_cycle', (steps, simp))
+
+def run_phase_cycle(rho, ops, tables, receiver, spin_label, simp, processes=None):
+    # Evaluate all cycle steps concurrently, starting from rho (the state after
+    # the common prefix), for scripts. Returns (operation, result) where operation
+    # can be replayed with PO_Engine.apply_operation.
+    op = cycle_operation(ops, tables, receiver, spin_label, simp)
+    steps = op[1][0]
+    ctx, need_init = mp_context()
+    if need_init:
+        from PO_Engine import init_PO
+        pool = ctx.Pool(processes, initializer=init_PO, initargs=(spin_label, simp))
+    else:
+        pool = ctx.Pool(processes)
+    try:
+        results = pool.map(_run_step, [(rho, step_ops, rec, sl) for step_ops, rec, sl, n in steps], chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+    return op, sum_steps(rho, steps, results, simp)
+
+def cycle_label(ops, tables, receiver):
+    # Text of a phase cycle, e.g. pulse(I, {x y -x -y}, pi/2) ... receiver {x -x}
+    text = []
+    for ii, op in enumerate(ops):
+        if ii in tables:
+            text.append(op_label(set_phase(op, '{' + ' '.join(str(p) for p in tables[ii]) + '}')))
+        else:
+            text.append(op_label(op))
+    return ', '.join(text) + ', receiver {' + ' '.join(str(p) for p in receiver) + '}'
@@ -0,0 +1,700 @@
+#  ------------------------------------------------------------------------
+#  File Name   : PO_Engine.py
+#  Description : Evaluation engine for PO_GUI
+#                Runs rho.pulse, rho.pulse_phshift, rho.cs and rho.jc
+#                outside of the Tk event handlers.
+#  Developer   : Dr. Kosuke Ohgo
+#  ULR         : https://github.com/ohgo1977/PO_GUI_Python
+#
+#  MIT License, Copyright (c) 2023 Kosuke Ohgo. See LICENSE for details.
+#  ------------------------------------------------------------------------
+
+import collections
+import copy
+import multiprocessing
+import queue
+import sys
+import threading
+import time
+
+# An operation is a tuple of (method name, arguments), for example
+# ('pulse', (['I'], ['x'], [pi/2])) or ('jc', (['IS'], [pi*JIS*t])).
+# The method names are the ones CalcGui exposes as buttons (Operation_dispatch).
+# ('simplify', (method,)) simplifies all coefficients (lazy simplification).
+
+# PO.simp in the lazy simplification mode. PO only knows simplify, TR8
+# and fu, so it leaves the coefficients of each operation as they are.
+Lazy_simp = 'none'
+
+def apply_operation(rho, op):
+    # Apply one operation to rho and return the new density operator.
+    method, args = op
+    try:
+        func = Operation_dispatch[method]
+    except KeyError:
+        raise ValueError('Unknown operation: ' + str(method))
+    return func(rho, *args)
+
+def run_job(rho, op):
+    # apply_operation on a worker. The expression size of the result is
+    # measured there too (result.expr_size), so that PO_GUI and PO_History
+    # do not have to walk the coefficients on the Tk thread.
+    result = apply_operation(rho, op)
+    profile = getattr(result, 'profile', None)
+    if profile is not None and 'ops_out' in profile:
+        result.expr_size = profile['ops_out']
+    else:
+        result.expr_size = state_size(result)
+    return result
+
+def init_PO(spin_label, simp):
+    # Prepare the PO class in a fresh interpreter (worker process).
+    from PO import PO
+    PO.create(spin_label)
+    PO.simp = simp
+
+def simp_expr(expr, method):
+    # Same methods as PO.simp. Other methods (Lazy_simp) return expr.
+    import sympy
+    if method == 'simplify':
+        return sympy.simplify(expr)
+    elif method == 'TR8':
+        from sympy.simplify.fu import TR8
+        return TR8(expr)
+    elif method == 'fu':
+        return sympy.fu(expr)
+    return expr
+
+class SymbolTable(dict):
+    # Namespace for eval() of angles, phases and density operators.
+    # Undefined names become SymPy symbols. Parsed texts are kept in an LRU
+    # cache, so 'pi/2' or 'pi*JIS*t' are compiled only once.
+    def __init__(self, *args, cache_size=512):
+        dict.__init__(self, *args)
+        self.cache_size = cache_size
+        self.parsed = collections.OrderedDict()
+
+    def __missing__(self, name):
+        import sympy
+        if name.startswith('__'):
+            raise KeyError(name)
+        sym = sympy.Symbol(name)
+        self[name] = sym
+        return sym
+
+    def parse(self, text):
+        key = text.replace(' ', '')
+        if key in self.parsed:
+            self.parsed.move_to_end(key)
+            return self.parsed[key]
+        value = eval(compile(key, '<PO_GUI>', 'eval'), {'__builtins__': {}}, self)
+        self.parsed[key] = value
+        if len(self.parsed) > self.cache_size:
+            self.parsed.popitem(last=False)
+        return value
+
+def PO_namespace(spin_label, simp, create=True):
+    # SymbolTable with pi and the operators created by PO.create(spin_label).
+    # create=False when PO.create() has already been called.
+    import sympy
+    import PO as PO_module
+    if create:
+        PO_module.PO.create(spin_label)
+    PO_module.PO.simp = simp
+    table = SymbolTable()
+    table['pi'] = sympy.pi
+    table.update((k, v) for k, v in vars(PO_module).items() if not k.startswith('_'))
+    return table
+
+def op_label(op):
+    # Short text for an operation, e.g. pulse(I, x, pi/2)
+    method, args = op
+    return method + '(' + ', '.join(a if isinstance(a, str) else ', '.join(str(v) for v in a) for a in args) + ')'
+
+# Direct dispatch of the operations
+Operation_dispatch = {
+    'pulse': lambda rho, sp_cell, ph_cell, q_cell: rho.pulse(sp_cell, ph_cell, q_cell),
+    'pulse_phshift': lambda rho, sp_cell, ph_cell, q_cell: rho.pulse_phshift(sp_cell, ph_cell, q_cell),
+    'cs': lambda rho, sp_cell, q_cell: rho.cs(sp_cell, q_cell),
+    'jc': lambda rho, sp_cell, q_cell: rho.jc(sp_cell, q_cell),
+    'simplify': lambda rho, method: simplify_state(rho, method),
+    'phase_cycle': lambda rho, steps, simp: _phase_cycle(rho, steps, simp),
+    'profile': lambda rho, op: _profile(rho, op),
+}
+
+def _profile(rho, op):
+    from PO_Profile import profile_operation
+    return profile_operation(rho, op)
+
+def _phase_cycle(rho, steps, simp):
+    from PO_Cycle import run_steps
+    return run_steps(rho, steps, simp)
+
+####### Terms #######
+# A PO object stores one row of rho.axis (one code per spin) and one entry
+# of rho.coef for each product-operator term.
+# Codes of rho.axis: 0: E (no operator on this spin), 1: x, 2: y, 3: z, 4: p, 5: m
+Axis_label = {0: '', 1: 'x', 2: 'y', 3: 'z', 4: 'p', 5: 'm'}
+
+def term_label(axis, spin_label):
+    # e.g. (1, 3) and ['I', 'S'] -> 'IxSz', (0, 0) -> 'E'
+    label = ''.join(SL + Axis_label[code] for SL, code in zip(spin_label, axis) if code != 0)
+    return label if len(label) > 0 else 'E'
+
+def term_items(rho):
+    # List of (axis tuple, coefficient)
+    return [(tuple(int(v) for v in rho.axis[ii]), rho.coef[ii]) for ii in range(len(rho.coef))]
+
+def from_terms(template, items):
+    # New PO object with the spin setting of template and the given terms.
+    if hasattr(type(template), 'from_terms'): # e.g. PO_Sparse.SparsePO
+        return template.from_terms(items)
+    obj = copy.deepcopy(template)
+    if len(items) == 0: # Keep an empty state as a single zero term.
+        items = [(tuple(0 for v in template.axis[0]), 0)]
+    axis = [list(a) for a, c in items]
+    coef = [c for a, c in items]
+    if isinstance(template.axis, list):
+        obj.axis = axis
+    else:
+        import numpy as np
+        obj.axis = np.array(axis, dtype=np.asarray(template.axis).dtype)
+    if isinstance(template.coef, list):
+        obj.coef = coef
+    else:
+        import sympy
+        obj.coef = sympy.Matrix(coef)
+    return obj
+
+def split_terms(rho):
+    # One PO object per product-operator term of rho.
+    return [from_terms(rho, [item]) for item in term_items(rho)]
+
+def merge_terms(parts, method):
+    # Sum of PO objects. Coefficients collected from several parts are simplified again.
+    acc = collections.OrderedDict()
+    count = collections.Counter()
+    for part in parts:
+        for axis, coef in term_items(part):
+            acc[axis] = acc.get(axis, 0) + coef
+            count[axis] += 1
+    items = []
+    for axis, coef in acc.items():
+        if count[axis] > 1:
+            coef = simp_expr(coef, method)
+        if coef != 0:
+            items.append((axis, coef))
+    return from_terms(parts[0], items)
+
+def simplify_state(rho, method):
+    # rho with all coefficients simplified by method.
+    items = []
+    for axis, coef in term_items(rho):
+        coef = simp_expr(coef, method)
+        if coef != 0:
+            items.append((axis, coef))
+    result = from_terms(rho, items)
+    result.logs = rho.logs + '\nSimplification: ' + method + '\n' + str(result)
+    return result
+
+def segment_head(rho, result, op):
+    # Log segment of op (result = op applied to rho) without the text of the
+    # state that PO writes at its end, to log another form of the same state.
+    segment = result.logs[len(rho.logs):]
+    text = str(result)
+    if segment.endswith(text):
+        return segment[:len(segment) - len(text)]
+    return '\n' + op_label(op) + '\n'
+
+def strip_logs(rho):
+    # Shallow copy of rho without the cumulative logs.
+    # The terms (axis, coef) are shared with rho, not copied.
+    state = copy.copy(rho)
+    state.logs = ''
+    return state
+
+def numeric_coef(rho):
+    # True for numeric coefficient arrays (PO_Sparse), which have no expressions.
+    kind = getattr(getattr(rho.coef, 'dtype', None), 'kind', None)
+    return kind is not None and kind in 'iufc'
+
+def state_size(rho):
+    # Expression size of rho (sum of count_ops of the coefficients).
+    import sympy
+    if numeric_coef(rho):
+        return 0
+    return sum(sympy.count_ops(coef) for axis, coef in term_items(rho))
+
+# Estimated memory of a term, and of one operation of a SymPy coefficient.
+Term_bytes = 200
+Op_bytes = 100
+
+def state_bytes(rho):
+    # Estimated memory of rho for the History budget: term count and
+    # expr_size (from the worker), or the arrays of numeric states.
+    if numeric_coef(rho):
+        return 2*rho.coef.nbytes # Keys and coefficients
+    size = getattr(rho, 'expr_size', None)
+    if size is None:
+        size = state_size(rho)
+    return Term_bytes*len(rho.coef) + Op_bytes*int(size)
+
+def scale_state(rho, factor):
+    # factor*rho, term by term.
+    return from_terms(rho, [(axis, factor*coef) for axis, coef in term_items(rho)])
+
+# Numeric coefficients (floats, e.g. PO_Sparse) closer than this are the same.
+Same_tolerance = 1e-9
+
+def same_coef(c1, c2):
+    # True if c1 - c2 simplifies to 0. Float(0.0) == 0 is False in SymPy.
+    import sympy
+    d = sympy.simplify(c1 - c2)
+    if d.is_zero:
+        return True
+    return bool(d.is_number and d.has(sympy.Float) and abs(complex(d)) < Same_tolerance)
+
+def same_state(rho1, rho2):
+    # True if rho1 - rho2 simplifies to 0 term by term.
+    d1 = dict(term_items(rho1))
+    d2 = dict(term_items(rho2))
+    return all(same_coef(d1.get(axis, 0), d2.get(axis, 0)) for axis in set(d1) | set(d2))
+####### Terms #######
+
+####### Parallel #######
+def apply_operation_parallel(rho, op, pool, simp):
+    # Rotations are linear in rho: rotate each term on its own core and sum.
+    # pool is a multiprocessing.Pool. Blocking version of PoolWorker.
+    parts = pool.starmap(apply_operation, [(term, op) for term in split_terms(rho)])
+    return _merge_result(rho, op, parts, simp)
+
+def check_parallel(rho, op, pool, simp):
+    # Compare the parallel path with the serial path.
+    return same_state(apply_operation_parallel(rho, op, pool, simp), apply_operation(rho, op))
+
+def _merge_result(rho, op, parts, simp, serial=None):
+    # Sum of the parts, logged with the segment PO writes for op.
+    # If the serial result (verify) differs, it is returned instead, and
+    # result.warning reports the mismatch (removed by CalcEngine).
+    result = merge_terms(parts, simp)
+    result.logs = rho.logs + segment_head(rho, parts[0], op) + str(result)
+    if serial is not None and not same_state(result, serial):
+        serial.warning = 'parallel result of ' + op_label(op) + ' does not match the serial result (serial result kept)'
+        result = serial
+    result.expr_size = state_size(result)
+    return result
+
+def _merge_cycle(rho, op, parts, simp, serial=None):
+    # Receiver-weighted sum of the steps of a ('phase_cycle', (steps, simp)) operation.
+    from PO_Cycle import sum_steps
+    steps, cycle_simp = op[1]
+    result = sum_steps(rho, steps, parts, cycle_simp)
+    result.expr_size = state_size(result)
+    return result
+####### Parallel #######
+
+####### Workers #######
+def mp_context():
+    # fork keeps the PO state (PO.create, PO.simp, symbols) of the parent.
+    # Returns the context and whether a new process must call init_PO.
+    if 'fork' in multiprocessing.get_all_start_methods() and sys.platform.startswith('linux'):
+        return multiprocessing.get_context('fork'), False
+    return multiprocessing.get_context('spawn'), True
+
+def _process_main(conn, spin_label, simp, need_init):
+    if need_init:
+        init_PO(spin_label, simp)
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if job is None:
+            break
+        rho, op = job
+        try:
+            conn.send(('done', run_job(rho, op)))
+        except Exception as e:
+            conn.send(('error', repr(e)))
+
+class ProcessWorker(object):
+    # One persistent worker process. terminate() kills a runaway simplification.
+    def __init__(self, spin_label, simp):
+        self.spin_label = spin_label
+        self.simp = simp
+        ctx, need_init = mp_context()
+        self.conn, child_conn = ctx.Pipe()
+        self.proc = ctx.Process(target=_process_main,
+                                args=(child_conn, spin_label, simp, need_init),
+                                daemon=True)
+        self.proc.start()
+        child_conn.close()
+
+    def send(self, rho, op):
+        self.conn.send((rho, op))
+
+    def poll(self):
+        return self.conn.poll()
+
+    def recv(self):
+        try:
+            return self.conn.recv()
+        except EOFError:
+            return ('error', 'Worker process exited')
+
+    def terminate(self):
+        if self.proc.is_alive():
+            self.proc.terminate()
+        self.proc.join(1)
+        self.conn.close()
+
+    def close(self):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.proc.join(1)
+        if self.proc.is_alive():
+            self.proc.terminate()
+
+class PoolWorker(object):
+    # Term-parallel worker. Each term of rho is rotated and simplified on
+    # a pool process, and the results are merged on the pool as well.
+    # verify=True also runs the serial path; on a mismatch the serial result is kept.
+    # The steps of a phase cycle run on the pool in the same way.
+    def __init__(self, spin_label, simp, processes, verify=False):
+        self.simp = simp
+        self.verify = verify
+        ctx, need_init = mp_context()
+        if need_init:
+            self.pool = ctx.Pool(processes, initializer=init_PO, initargs=(spin_label, simp))
+        else:
+            self.pool = ctx.Pool(processes)
+        self.parts = None
+        self.serial = None
+        self.merged = None
+
+    def send(self, rho, op):
+        self.rho = rho
+        self.op = op
+        self.merge = _merge_result
+        if op[0] == 'phase_cycle':
+            from PO_Cycle import run_step
+            self.parts = [self.pool.apply_async(run_step, (rho, ops, rec, spin_label))
+                          for ops, rec, spin_label, n in op[1][0]]
+            self.serial = self.merged = None
+            self.merge = _merge_cycle
+            return
+        terms = split_terms(rho)
+        if len(terms) < 2:
+            self.parts = None
+            self.merged = self.pool.apply_async(run_job, (rho, op))
+            return
+        self.parts = [self.pool.apply_async(apply_operation, (term, op)) for term in terms]
+        self.serial = self.pool.apply_async(apply_operation, (rho, op)) if self.verify else None
+        self.merged = None
+
+    def poll(self):
+        if self.merged is None:
+            waiting = self.parts + ([self.serial] if self.serial is not None else [])
+            if not all(r.ready() for r in waiting):
+                return False
+            try:
+                parts = [r.get() for r in self.parts]
+                serial = self.serial.get() if self.serial is not None else None
+            except Exception:
+                self.merged = self.parts[0] # Raises again in recv()
+                for r in self.parts:
+                    if not r.successful():
+                        self.merged = r
+                return True
+            self.merged = self.pool.apply_async(self.merge, (self.rho, self.op, parts, self.simp, serial))
+        return self.merged.ready()
+
+    def recv(self):
+        merged = self.merged
+        self.parts = self.serial = self.merged = None
+        try:
+            return ('done', merged.get())
+        except Exception as e:
+            return ('error', repr(e))
+
+    def terminate(self):
+        self.pool.terminate()
+        self.pool.join()
+
+    def close(self):
+        self.pool.close()
+        self.pool.terminate()
+
+class ThreadWorker(object):
+    # Fallback worker thread. A thread cannot be killed, so terminate()
+    # abandons the running job and its result is discarded.
+    def __init__(self, spin_label=None, simp=None):
+        self.jobs = queue.Queue()
+        self.results = queue.Queue()
+        self.abandoned = False
+        self.thread = threading.Thread(target=self._main, daemon=True)
+        self.thread.start()
+
+    def _main(self):
+        while True:
+            job = self.jobs.get()
+            if job is None or self.abandoned:
+                break
+            rho, op = job
+            try:
+                self.results.put(('done', self.apply(rho, op)))
+            except Exception as e:
+                self.results.put(('error', repr(e)))
+
+    def apply(self, rho, op):
+        return run_job(rho, op)
+
+    def send(self, rho, op):
+        self.jobs.put((rho, op))
+
+    def poll(self):
+        return not self.results.empty()
+
+    def recv(self):
+        return self.results.get()
+
+    def terminate(self):
+        self.abandoned = True
+        self.jobs.put(None)
+
+    def close(self):
+        self.terminate()
+
+def _call_main(conn, func, args):
+    try:
+        conn.send(('done', func(*args)))
+    except Exception as e:
+        conn.send(('error', repr(e)))
+    conn.close()
+
+class CallProcess(object):
+    # func(*args) in a new process, e.g. one sequence file of PO_Batch.py.
+    # daemon=False lets func start processes of its own (a race of
+    # PO_Race.py); the workers of multiprocessing.Pool cannot.
+    def __init__(self, func, args, daemon=True):
+        ctx = mp_context()[0]
+        self.conn, child_conn = ctx.Pipe(duplex=False)
+        self.proc = ctx.Process(target=_call_main, args=(child_conn, func, args), daemon=daemon)
+        self.proc.start()
+        child_conn.close()
+
+    def poll(self):
+        return self.conn.poll()
+
+    def recv(self):
+        try:
+            reply = self.conn.recv()
+        except EOFError:
+            reply = None
+        self.proc.join()
+        self.conn.close()
+        if reply is None:
+            reply = ('error', 'Process exited with code ' + str(self.proc.exitcode))
+        return reply
+
+    def terminate(self):
+        if self.proc.is_alive():
+            self.proc.terminate()
+        self.proc.join(1)
+        self.conn.close()
+
+class CallThread(object):
+    # CallProcess on a thread, without processes. terminate() abandons func.
+    def __init__(self, func, args):
+        self.results = queue.Queue()
+        self.thread = threading.Thread(target=self._main, args=(func, args), daemon=True)
+        self.thread.start()
+
+    def _main(self, func, args):
+        try:
+            self.results.put(('done', func(*args)))
+        except Exception as e:
+            self.results.put(('error', repr(e)))
+
+    def poll(self):
+        return not self.results.empty()
+
+    def recv(self):
+        return self.results.get()
+
+    def terminate(self):
+        pass
+####### Workers #######
+
+####### Engine #######
+class CalcEngine(object):
+    # Job queue in front of a worker.
+    # Jobs are applied in order, each one to the result of the previous job.
+    # poll() is called from the Tk mainloop (app.after) and never blocks.
+    # parallel > 0 rotates the terms of rho on a pool of that many processes.
+    # cache (PO_Cache.CacheThread) is looked up before a job goes to the worker.
+    # racer (PO_Race.Racer) races the simplification methods on each result.
+    # profile = True measures each job (PO_Profile.py); the records go to profiles.
+    # server: address of PO_Server.py ('' for the default one). Without a
+    # server, or when it is not running, the jobs run in-process.
+    def __init__(self, spin_label, simp, rho, use_process=True, parallel=0, verify=False, cache=None, racer=None,
+                 server=None):
+        self.spin_label = spin_label
+        self.simp = simp
+        self.rho = strip_logs(rho) # State the next job is applied to
+        self.use_process = use_process
+        self.parallel = parallel
+        self.verify = verify
+        self.cache = cache
+        self.racer = racer
+        self.server = server
+        self.jobs = collections.deque()
+        self.submit_times = collections.deque()
+        self.running = None
+        self.lookup = None # (op, reply queue) of the cache lookup of the next job
+        self.profile = False
+        self.profiles = []
+        self.warnings = [] # Mismatches of the term-parallel and the serial result (verify)
+        self.worker = self._new_worker()
+
+    def _new_worker(self):
+        if self.server is not None:
+            from PO_Server import ServerWorker
+            try:
+                return ServerWorker(self.spin_label, self.simp, self.server or None, use_process=self.use_process)
+            except (OSError, EOFError, ValueError) as e:
+                print('PO_Engine: server is not available (' + repr(e) + '), evaluating in-process.')
+                self.server = None
+        if self.racer is not None:
+            from PO_Race import RaceWorker, SerialRaceWorker
+            if self.use_process:
+                try:
+                    return RaceWorker(self.spin_label, self.simp, self.racer)
+                except (OSError, ValueError) as e:
+                    print('PO_Engine: worker process is not available (' + repr(e) + ').')
+            # self.simp is Lazy_simp in race mode: the results must still be simplified.
+            print('PO_Engine: no race without processes, simplifying with ' + self.racer.candidates()[0][0] + '.')
+            return SerialRaceWorker(self.spin_label, self.simp, self.racer)
+        if self.use_process and self.parallel > 0:
+            try:
+                return PoolWorker(self.spin_label, self.simp, self.parallel, self.verify)
+            except (OSError, ValueError) as e:
+                print('PO_Engine: process pool is not available (' + repr(e) + ').')
+        if self.use_process:
+            try:
+                return ProcessWorker(self.spin_label, self.simp)
+            except (OSError, ValueError) as e:
+                print('PO_Engine: worker process is not available (' + repr(e) + '), using a thread.')
+                self.use_process = False
+        return ThreadWorker(self.spin_label, self.simp)
+
+    def submit(self, op):
+        self.jobs.append(op)
+        self.submit_times.append(time.perf_counter())
+        self._start_next()
+
+    def busy(self):
+        return self.running is not None or self.lookup is not None or len(self.jobs) > 0
+
+    def pending(self):
+        return len(self.jobs) + (self.running is not None) + (self.lookup is not None)
+
+    def _start_next(self):
+        while self.running is None and self.lookup is None and len(self.jobs) > 0:
+            op = self.jobs.popleft()
+            self.running_submit = self.submit_times.popleft()
+            self.running_start = time.perf_counter()
+            if self.cache is not None: # Answered on the cache thread, checked by poll()
+                self.lookup = (op, self.cache.get(self.rho, op, self.spin_label))
+            else:
+                self._send(op)
+
+    def _send(self, op):
+        self.running = op
+        self.running_rho = self.rho
+        if self.profile and not isinstance(self.worker, PoolWorker):
+            self.worker.send(self.rho, ('profile', (op,)))
+        else:
+            self.worker.send(self.rho, op)
+
+    def _check_lookup(self, finished):
+        # False while the cache thread is still looking the job up.
+        op, reply = self.lookup
+        try:
+            result = reply.get_nowait()
+        except queue.Empty:
+            return False
+        self.lookup = None
+        if result is None:
+            self._send(op)
+        else:
+            self.rho = strip_logs(result)
+            finished.append((op, 'done', result))
+            if self.profile:
+                self._add_profile(op, {'compute': 0.0, 'cache': 'hit'})
+        return True
+
+    def poll(self):
+        # Return a list of (op, status, result). status is 'done' or 'error'.
+        finished = []
+        while True:
+            if self.lookup is not None:
+                if not self._check_lookup(finished):
+                    break
+            elif self.running is not None and self.worker.poll():
+                status, result = self.worker.recv()
+                op = self.running
+                self.running = None
+                if status == 'done':
+                    record = getattr(result, 'profile', None)
+                    if record is not None:
+                        del result.profile
+                    if self.profile:
+                        self._add_profile(op, record or {})
+                    warning = getattr(result, 'warning', None)
+                    if warning is not None:
+                        del result.warning
+                        self.warnings.append(warning)
+                    if self.cache is not None:
+                        self.cache.put(self.running_rho, op, result, self.spin_label)
+                    self.rho = strip_logs(result) # Results carry only the log segment of their job
+                else:
+                    self.jobs.clear() # Later jobs depend on the failed one.
+                    self.submit_times.clear()
+                finished.append((op, status, result))
+            else:
+                break
+            self._start_next()
+        return finished
+
+    def _add_profile(self, op, record):
+        now = time.perf_counter()
+        record = dict(record, op=op_label(op), queue=self.running_start - self.running_submit,
+                      wall=now - self.running_submit)
+        self.profiles.append(record)
+
+    def cancel(self):
+        # Drop queued jobs and kill the running one.
+        self.jobs.clear()
+        self.submit_times.clear()
+        self.lookup = None # Its answer is dropped
+        if self.running is not None:
+            self.running = None
+            self.worker.terminate()
+            self.worker = self._new_worker()
+
+    def reset(self, rho):
+        # Used by Undo and Clear.
+        self.cancel()
+        self.rho = strip_logs(rho)
+
+    def close(self):
+        self.jobs.clear()
+        self.running = None
+        self.lookup = None
+        self.worker.close()
+        if self.cache is not None:
+            self.cache.close()
+####### Engine #######
@@ -32,6 +32,28 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 #
+# Version 1.3.0
+#  Pulse, CS and JC operations run on a background worker (PO_Engine.py).
+#  The window stays responsive, and a running operation can be cancelled.
+#  Parallel_workers > 0 rotates and simplifies the terms of rho on a process pool.
+#  Spin Dynamics display appends or removes only the segment of the last step.
+#  rho_cell stores per-step operations and log segments (PO_History.py).
+#  Older states are spilled to disk or recomputed within History_budget.
+#  Undo keeps the branch: Redo, < and > switch between branches without recomputation.
+#  Results are cached in Cache_file and reused across sessions (PO_Cache.py).
+#  Lazy simplification (lazy, lazy-TR8, lazy-fu) and the Simplify button.
+#  race: simplify, TR8 and fu race under Race_budget for each operation (PO_Race.py).
+#  check_symbols() and exec() were replaced by a symbol table with cached parsing.
+#  Session setup in a window while PO and SymPy are imported in the background.
+#  Numeric sweep of rho over parameter grids, exported as .npz/.npy (PO_Numeric.py).
+#  Acquire: FID and spectrum of the observed spins from rho, 1D or 2D (t1/t2).
+#  Phase Cycle: phase tables for the pulses, summed with the receiver phases (PO_Cycle.py).
+#  Sessions (.pogui) save the history with its states; Open in the setup window restores it.
+#  Journal_switch = 1 streams each step to a journal file (PO_Journal.py); Open replays it.
+#  Profile: per-operation phase times, terms, count_ops and memory, CSV/JSON export (PO_Profile.py).
+#  Backend numeric: sparse NumPy states with the values of the symbols, for 8-10 spins (PO_Sparse.py).
+#  Server_switch = 1 sends the operations to a shared local compute service (PO_Server.py).
+#
 # Version 1.2.0 on 8/23/2023
 #  A default value of rho_str is automatically generated from the values in SpinLabel
 #
@@ -44,103 +66,365 @@
 # Version 1.0.0 on 8/18/2023
 
 # Version Information
-ver_str = 'version 1.2.0'
+ver_str = 'version 1.3.0'
 print('PO_GUI, ', ver_str)
 
+import os
+import threading
+import time
+t_start = time.perf_counter()
+
 # Import GUI library
 import tkinter as tk
 from tkinter import ttk
 from tkinter import filedialog
 
-# Function to create undefined symbols. 
-def check_symbols(val):
-    # Replacing operators, parenthesis, and decimal point to comma. 
-    val = val.replace('*',',')
-    val = val.replace('/',',')
-    val = val.replace('+',',')
-    val = val.replace('-',',')
-    val = val.replace('.',',')
-    val = val.replace('(',',')
-    val = val.replace(')',',')
+# Evaluation engine
+from PO_Engine import CalcEngine, CallProcess, CallThread, Lazy_simp, PO_namespace, op_label
+from PO_History import History
+from PO_Journal import Journal, read_journal, replay
+from PO_Profile import Profile_fields, Profiler
+from PO_Cache import CacheThread
+from PO_Race import Racer
+
+# Settings
+Setup_dialog = 1 # 1: session setup in a window, 0: input() on the console
+Simp_methods = ['simplify', 'TR8', 'fu', 'lazy', 'lazy-TR8', 'lazy-fu', 'race']
+
+# Backend: symbolic (PO) or numeric (PO_Sparse.py). The numeric backend needs
+# a value for each symbol of the angles, e.g. oI=2*pi*100, JIS=140, t=1e-3.
+Backends = ['symbolic', 'numeric']
+
+# Lazy simplification: operations are not simplified until Simplify is clicked,
+# the result is saved, or the size of rho exceeds Lazy_threshold.
+Lazy_threshold = 2000 # count_ops of all coefficients
+
+# Adaptive simplification: simplify, TR8 and fu race in separate processes.
+Race_methods = ['simplify', 'TR8', 'fu']
+Race_budget = 30.0 # s per operation
+Race_pick = 'first' # 'first' or 'smallest'
+
+# History of rho
+History_budget = 64*2**20 # Bytes of full states kept in memory
+History_spill = True # True: older states are spilled to disk, False: recomputed on demand
+
+# Engine
+Engine_process = True # False: use a worker thread instead of a worker process
+Parallel_workers = 0 # > 0: term-parallel evaluation on this number of processes
+Parallel_verify = False # True: compare the term-parallel result with the serial one
+Poll_interval = 50 # ms
+
+# Compute service (python PO_Server.py). Without a running server, operations run in-process.
+Server_switch = 0 # 1: send the operations to PO_Server
+Server_address = None # Unix socket path or 'host:port', None: ~/.PO_GUI/server.sock
+
+# Result Cache
+Cache_switch = 1 # 1: reuse results of identical operations across sessions
+Cache_file = os.path.join(os.path.expanduser('~'), '.PO_GUI', 'cache.sqlite')
+Cache_mem_entries = 256 # Results kept in memory
+Cache_disk_bytes = 256*2**20 # Size of Cache_file
+
+# Journal
+Journal_switch = 0 # 1: write each step to a journal file as it is produced
+Journal_dir = os.path.join(os.path.expanduser('~'), '.PO_GUI', 'journal')
+Journal_interval = 2.0 # s between writes (fsync) of the journal
+Disp_max_chars = 200000 # With the journal, Spin Dynamics keeps only the last characters
+
+####### Session #######
+def default_rho_str(SpinLabel):
+    rho_str_ini = ''
+    for ii in range(len(SpinLabel)):
+        rho_str_ini = rho_str_ini + SpinLabel[ii] + 'z'
+        if ii < len(SpinLabel) -1:
+            rho_str_ini = rho_str_ini + ' + '
+        elif ii == len(SpinLabel) -1:
+            break
+    return rho_str_ini
+
+def default_values(SpinLabel):
+    # Values of the default CS and JC angles for the numeric backend
+    values = ['o' + SL + '=2*pi*100' for SL in SpinLabel]
+    for ii, SL1 in enumerate(SpinLabel):
+        for jj, SL2 in enumerate(SpinLabel):
+            if jj > ii:
+                values.append('J' + SL1[-1] + SL2[-1] + '=140')
+    return ', '.join(values + ['t=1e-3'])
+
+def console_setup():
+    # Input Parameters (Setup_dialog = 0)
+    simp = input('Enter Method for Simplification (' + ', '.join(Simp_methods) + ', Default: simplify): ')
+    val = input('Enter Spin Labels Separated by Commas (Default: I,S): ')
+    if len(val) == 0:
+        val = 'I,S'
+    rho_str_ini = default_rho_str(val.replace(' ','').split(','))
+    rho_str = input('Enter Initial Density Operator (Default: ' +  rho_str_ini + '):')
+    return simp, val, rho_str
+
+def setup_session(simp_in, val, rho_str_in, history=None, journal_file=None, backend='symbolic', values=''):
+    # Define the parameters used by CalcGui. Imports PO and SymPy.
+    # history: History of a session file (the initial density operator is not parsed).
+    # journal_file: journal to replay.
+    # backend: 'symbolic' or 'numeric', values: values of the symbols for 'numeric'.
+    global simp, Lazy_switch, Lazy_method, PO_simp, Race_switch, Backend, Values
+    global SpinLabel, rho_str, table, rho, rho_cell
+    global FA, PH, CS, JC_pair, JC, JC_label
+
+    simp = simp_in
+    if len(simp) == 0:
+        simp = 'simplify'
+    print('Simplification: ', simp)
+
+    Lazy_switch = 0
+    Lazy_method = simp
+    PO_simp = simp
+    if simp.startswith('lazy'):
+        Lazy_switch = 1
+        Lazy_method = simp[5:] if len(simp) > 5 else 'simplify'
+        PO_simp = Lazy_simp
+
+    Race_switch = 0
+    if simp == 'race':
+        Race_switch = 1
+        Lazy_method = 'simplify'
+        PO_simp = Lazy_simp
+
+    if len(val) == 0:
+        val = 'I,S'
     val = val.replace(' ','')
-    sym_list = val.split(',') # Splitting to commponents separted by comma.
-
-    # Creating new symbolic parameters
-    for varname in sym_list:
-        if varname != 'pi' and varname != '' and not varname.isnumeric() and varname not in globals():
-            cmd_s = varname + " = symbols('" + varname + "')"
-            exec(cmd_s, locals(), globals())
-
-# Input Parameters
-simp = input('Enter Method for Simplification (simplify, TR8, fu, Default: simplify): ')
-if len(simp) == 0:
-    simp = 'simplify'
-print('Simplification: ', simp)
-
-val = input('Enter Spin Labels Separated by Commas (Default: I,S): ')
-if len(val) == 0:
-    val = 'I,S'
-val = val.replace(' ','')
-print('Spin Labels: ', val)
-SpinLabel = val.split(',')
-
-rho_str_ini = ''
-for ii in range(len(SpinLabel)):
-    rho_str_ini = rho_str_ini + SpinLabel[ii] + 'z'
-    if ii < len(SpinLabel) -1:
-        rho_str_ini = rho_str_ini + ' + '
-    elif ii == len(SpinLabel) -1:
-        break
-rho_str = input('Enter Initial Density Operator (Default: ' +  rho_str_ini + '):')
-if len(rho_str) == 0:
-    rho_str = rho_str_ini
-
-# Import Product Operator
-from PO import *
-PO.create(SpinLabel)
-from PO import * # Need this line to access Ix, Iy, ... created by PO.create().
-
-# This line should be after PO.create()
-check_symbols(rho_str)
-
-# Initial Density Operator
-rho = 0 # Dummy to get rid of errors
-exec('rho = ' + rho_str, locals(), globals())
-print('Initial Density Operator:')
-print(rho)
-
-# Set the simplification method
-PO.simp = simp
-
-rho_cell = [rho]
-
-# Define Default Parameters as lists
-# Pulse
-FA = ['pi/4', 'pi/2', 'pi*3/4', 'pi', 'b']# Flip Angle
-PH = ['x', 'y', '-x', '-y', 'f']# Phase
-
-# Chemical Shift
-CS = ['pi/2', 'pi', 'q']# Angle
-for SL in SpinLabel:
-    CS_tmp = 'o' + SL + '*t'
-    CS.append(CS_tmp)
-
-# J-coupling
-JC_pair =[]
-for ii, SL1 in enumerate(SpinLabel):
-    for jj, SL2 in enumerate(SpinLabel):
-        if jj > ii:
-            JC_tmp = SL1 + SL2
-            JC_pair.append(JC_tmp)
-
-JC = ['pi/8', 'pi/4', 'pi/2', 'pi']# Angle
-for ii, SL1 in enumerate(SpinLabel):
-    for jj, SL2 in enumerate(SpinLabel):
-        if jj > ii:
-            JC_tmp = 'pi*J' + SL1[-1] + SL2[-1] + '*t'
-            JC.append(JC_tmp)
-
-JC_label = ['1/(8J)', '1/(4J)', '1/(2J)', '1/(J)']
+    print('Spin Labels: ', val)
+    SpinLabel = val.split(',')
+
+    rho_str = rho_str_in
+    if len(rho_str) == 0:
+        rho_str = default_rho_str(SpinLabel)
+
+    Backend = backend
+    Values = values
+    if Backend == 'numeric':
+        # Coefficients are floats: no simplification. NumPy is imported only here.
+        from PO_Sparse import parse_values, sparse_namespace
+        print('Backend: numeric (' + Values + ')')
+        Lazy_switch = 0
+        Race_switch = 0
+        PO_simp = Lazy_simp
+        table = sparse_namespace(SpinLabel, parse_values(Values))
+    else:
+        # Import Product Operator, PO.create(SpinLabel) and PO.simp
+        # Symbol table for rho, angles and phases. Undefined names become symbols.
+        table = PO_namespace(SpinLabel, PO_simp)
+
+    # History of rho
+    if history is None:
+        # Initial Density Operator
+        rho = table.parse(rho_str)
+        print('Initial Density Operator:')
+        print(rho)
+        if journal_file is None:
+            rho_cell = History(rho, budget=History_budget, spill=History_spill)
+        else:
+            rho_cell = replay(journal_file, rho, budget=History_budget, spill=History_spill)
+            print('Journal: ' + str(len(rho_cell.nodes)) + ' steps replayed')
+    else:
+        rho_cell = history
+        print('Session: ' + str(len(rho_cell.nodes)) + ' steps, ' + str(len(rho_cell)) + ' on the current branch')
+    # States missing after a replay are recomputed on CalcEngine, starting from the last stored one.
+    missing = rho_cell.missing()
+    rho = rho_cell.state(rho_cell.nodes[missing[0]].parent) if len(missing) > 0 else rho_cell[-1]
+
+    # Define Default Parameters as lists
+    # Pulse
+    FA = ['pi/4', 'pi/2', 'pi*3/4', 'pi', 'b']# Flip Angle
+    PH = ['x', 'y', '-x', '-y', 'f']# Phase
+
+    # Chemical Shift
+    CS = ['pi/2', 'pi', 'q']# Angle
+    for SL in SpinLabel:
+        CS_tmp = 'o' + SL + '*t'
+        CS.append(CS_tmp)
+
+    # J-coupling
+    JC_pair =[]
+    for ii, SL1 in enumerate(SpinLabel):
+        for jj, SL2 in enumerate(SpinLabel):
+            if jj > ii:
+                JC_tmp = SL1 + SL2
+                JC_pair.append(JC_tmp)
+
+    JC = ['pi/8', 'pi/4', 'pi/2', 'pi']# Angle
+    for ii, SL1 in enumerate(SpinLabel):
+        for jj, SL2 in enumerate(SpinLabel):
+            if jj > ii:
+                JC_tmp = 'pi*J' + SL1[-1] + SL2[-1] + '*t'
+                JC.append(JC_tmp)
+
+    JC_label = ['1/(8J)', '1/(4J)', '1/(2J)', '1/(J)']
+####### Session #######
+
+####### Setup Window #######
+def import_PO(result):
+    # Runs on a background thread while the setup window is shown.
+    t0 = time.perf_counter()
+    try:
+        import sympy
+        import PO
+    except Exception as e:
+        result['error'] = repr(e)
+    result['seconds'] = time.perf_counter() - t0
+
+class SetupGui(object):
+    # Simplification method, spin labels and initial density operator.
+    # PO and SymPy are imported in the background; CalcGui is built when
+    # both the import and the input are done.
+    def __init__(self, app):
+        app.title('PO_GUI '+ ver_str)
+        app.geometry('+10+10')
+        self.app = app
+        font_size = 10
+        padx_v=5
+        pady_v=5
+
+        self.import_result = {}
+        self.import_thread = threading.Thread(target=import_PO, args=(self.import_result,), daemon=True)
+        self.import_thread.start()
+
+        self.frame = ttk.LabelFrame(app, text='Session')
+        self.frame.grid(row=0, column=0, padx=padx_v, pady=pady_v)
+
+        label = tk.Label(self.frame, text='Simplification', font=('Helvetica', font_size))
+        label.grid(row=0, column=0, sticky=tk.W, padx=padx_v, pady=pady_v)
+        self.simp_var = tk.StringVar()
+        self.simp_var.set('simplify')
+        box = ttk.Combobox(self.frame, textvariable=self.simp_var, values=Simp_methods, width=28)
+        box.grid(row=0, column=1, padx=padx_v, pady=pady_v)
+
+        label = tk.Label(self.frame, text='Spin Labels', font=('Helvetica', font_size))
+        label.grid(row=1, column=0, sticky=tk.W, padx=padx_v, pady=pady_v)
+        self.val_var = tk.StringVar()
+        self.val_var.set('I,S')
+        self.val_var.trace_add('write', self.update_rho_str)
+        entry = tk.Entry(self.frame, textvariable=self.val_var, font=('Helvetica', font_size), width=30)
+        entry.grid(row=1, column=1, padx=padx_v, pady=pady_v)
+
+        label = tk.Label(self.frame, text='Initial Density Operator', font=('Helvetica', font_size))
+        label.grid(row=2, column=0, sticky=tk.W, padx=padx_v, pady=pady_v)
+        self.rho_var = tk.StringVar()
+        self.rho_var.set(default_rho_str(['I', 'S']))
+        entry = tk.Entry(self.frame, textvariable=self.rho_var, font=('Helvetica', font_size), width=30)
+        entry.grid(row=2, column=1, padx=padx_v, pady=pady_v)
+
+        label = tk.Label(self.frame, text='Backend', font=('Helvetica', font_size))
+        label.grid(row=3, column=0, sticky=tk.W, padx=padx_v, pady=pady_v)
+        self.backend_var = tk.StringVar()
+        self.backend_var.set(Backends[0])
+        box = ttk.Combobox(self.frame, textvariable=self.backend_var, values=Backends, width=28, state='readonly')
+        box.grid(row=3, column=1, padx=padx_v, pady=pady_v)
+
+        label = tk.Label(self.frame, text='Values (numeric)', font=('Helvetica', font_size))
+        label.grid(row=4, column=0, sticky=tk.W, padx=padx_v, pady=pady_v)
+        self.values_var = tk.StringVar()
+        self.values_var.set(default_values(['I', 'S']))
+        entry = tk.Entry(self.frame, textvariable=self.values_var, font=('Helvetica', font_size), width=30)
+        entry.grid(row=4, column=1, padx=padx_v, pady=pady_v)
+
+        self.status_var = tk.StringVar()
+        self.status_var.set('Loading PO and SymPy ...')
+        label = tk.Label(self.frame, textvariable=self.status_var, font=('Helvetica', font_size))
+        label.grid(row=5, column=0, sticky=tk.W, padx=padx_v, pady=pady_v)
+
+        button = tk.Button(self.frame, text='Start', font=('Helvetica', font_size), width=10, height=2)
+        button.grid(row=5, column=1, sticky=tk.E, padx=padx_v, pady=pady_v)
+        button.bind('<Button-1>', self.click_Start_button)
+
+        button = tk.Button(self.frame, text='Open', font=('Helvetica', font_size), width=10, height=2)
+        button.grid(row=5, column=1, sticky=tk.W, padx=padx_v, pady=pady_v)
+        button.bind('<Button-1>', self.click_Open_button)
+        self.session_file = None
+        app.bind('<Return>', self.click_Start_button)
+
+        self.started = False
+        app.after(0, self.report_first_window)
+        app.after(Poll_interval, self.check_import)
+
+    def report_first_window(self):
+        print('Time to first window: %.3f s' % (time.perf_counter() - t_start))
+
+    def update_rho_str(self, *args):
+        # The default initial density operator and values follow the spin labels.
+        SpinLabel = self.val_var.get().replace(' ','').split(',')
+        self.rho_var.set(default_rho_str(SpinLabel))
+        self.values_var.set(default_values(SpinLabel))
+
+    def check_import(self):
+        if self.import_thread.is_alive():
+            self.app.after(Poll_interval, self.check_import)
+            return
+        if 'error' in self.import_result:
+            self.status_var.set('Import failed')
+            print('Import of PO failed: ' + self.import_result['error'])
+            return
+        self.status_var.set('Ready')
+        print('Import of PO and SymPy: %.3f s' % self.import_result['seconds'])
+        if self.started:
+            self.start()
+
+    def click_Open_button(self, event):
+        # Session file saved by the Save button (.pogui)
+        if self.started:
+            return "break"
+        file = filedialog.askopenfilename(filetypes=[("PO_GUI session", ".pogui .pojournal")])
+        if len(file) == 0:
+            return "break"
+        self.session_file = file
+        self.click_Start_button(event)
+        return "break"
+
+    def click_Start_button(self, event):
+        if self.started:
+            return
+        self.started = True
+        if self.import_thread.is_alive():
+            self.status_var.set('Waiting for PO ...')
+        elif 'error' not in self.import_result:
+            self.start()
+
+    def start(self):
+        self.app.unbind('<Return>')
+        simp_in, val, rho_str_in = self.simp_var.get(), self.val_var.get(), self.rho_var.get()
+        backend, values = self.backend_var.get(), self.values_var.get()
+        history = None
+        journal_file = None
+        if self.session_file is not None and self.session_file.endswith('.pojournal'):
+            try:
+                settings = read_journal(self.session_file)[0]
+            except (OSError, ValueError) as e:
+                self.status_var.set('Cannot open the journal')
+                print('Cannot open ' + self.session_file + ': ' + repr(e))
+                self.started = False
+                self.session_file = None
+                return
+            simp_in, val, rho_str_in = settings['simp'], ','.join(settings['SpinLabel']), settings['rho_str']
+            backend, values = settings.get('backend', 'symbolic'), settings.get('values', '')
+            journal_file = self.session_file
+        elif self.session_file is not None:
+            t0 = time.perf_counter()
+            try:
+                history, settings = History.load(self.session_file, budget=History_budget, spill=History_spill)
+            except (OSError, ValueError, KeyError) as e:
+                self.status_var.set('Cannot open the session')
+                print('Cannot open ' + self.session_file + ': ' + repr(e))
+                self.started = False
+                self.session_file = None
+                return
+            simp_in, val, rho_str_in = settings['simp'], ','.join(settings['SpinLabel']), settings['rho_str']
+            backend, values = settings.get('backend', 'symbolic'), settings.get('values', '')
+            print('Session file loaded in %.3f s' % (time.perf_counter() - t0))
+        self.frame.destroy()
+        setup_session(simp_in, val, rho_str_in, history, journal_file, backend, values)
+        calc = CalcGui(self.app)
+        if self.session_file is not None:
+            CalcGui.update_Branch(calc)
+        print('Time to main window: %.3f s' % (time.perf_counter() - t_start))
+####### Setup Window #######
 
 
 class CalcGui(object):
@@ -148,10 +432,40 @@ class CalcGui(object):
 
         # Window Setting
         app.title('PO_GUI '+ ver_str) # Window Title
-        app.geometry('1150x700+10+10') # Window size and position, W x H + X + Y        
+        app.geometry('1150x720+10+10') # Window size and position, W x H + X + Y        
         app.lift()
         app.attributes('-topmost', True)
         app.after_idle(app.attributes, '-topmost', False)
+        self.app = app
+
+        # Evaluation Engine
+        self.cache = None
+        if Cache_switch == 1 and Backend == 'symbolic':
+            self.cache = CacheThread(Cache_file, simp, mem_entries=Cache_mem_entries, disk_bytes=Cache_disk_bytes)
+        self.racer = None
+        if Race_switch == 1:
+            self.racer = Racer(Race_methods, budget=Race_budget, pick=Race_pick)
+        self.engine = CalcEngine(SpinLabel, PO_simp, rho, use_process=Engine_process,
+                                 parallel=Parallel_workers, verify=Parallel_verify,
+                                 cache=self.cache, racer=self.racer,
+                                 server=(Server_address or '') if Server_switch == 1 else None)
+        self.polling = False
+        self.save_pending = False
+        self.step_t0 = time.perf_counter()
+        self.profiler = None # PO_Profile.Profiler while the Profile panel records
+        self.profile_gui = None
+        app.protocol('WM_DELETE_WINDOW', self.close_app)
+
+        # Journal
+        self.journal = None
+        if Journal_switch == 1:
+            file = os.path.join(Journal_dir, time.strftime('PO_GUI_%Y%m%d_%H%M%S.pojournal'))
+            self.journal = Journal(file, {'SpinLabel': SpinLabel, 'simp': simp, 'rho_str': rho_str,
+                                     'backend': Backend, 'values': Values}, Journal_interval)
+            self.journal.start(rho_cell)
+            rho_cell.journal = self.journal
+            print('Journal: ' + file)
+            app.after(int(Journal_interval*1000), self.flush_Journal)
 
         # Window Size
         PS_width = 500
@@ -163,7 +477,9 @@ class CalcGui(object):
         Disp_width = 600
         Disp_height = 500
         Edit_width = 500
-        Edit_height = 100
+        Numeric_width = 600
+        Numeric_height = 130
+        Edit_height = 130
 
         padx_v=5
         pady_v=5
@@ -177,6 +493,7 @@ class CalcGui(object):
         JC_font_size = 10
         Disp_font_size = 10
         Edit_font_size = 10
+        Numeric_font_size = 10
 
         # Switches
         PS_switch = 1
@@ -187,6 +504,7 @@ class CalcGui(object):
         global Disp_switch
         Disp_switch = 1
         Edit_switch = 1
+        Numeric_switch = 1
 
         ###### Pulse Section Starts #######
         if PS_switch == 1:
@@ -385,8 +703,8 @@ class CalcGui(object):
         if Disp_switch == 1:
 
             # Define
-            self.prev_logs = rho.logs
-            self.disp_logs = str(self.prev_logs) # Initilize self.disp_logs
+            self.disp_pending = [] # Segments waiting for the next idle rendering
+            self.disp_flush_id = None
 
             # LabelFrame for Display
             Disp_label_frame = ttk.LabelFrame(app, text='Spin Dynamics', width=Disp_width, height=Disp_height)
@@ -398,7 +716,7 @@ class CalcGui(object):
                                     width=Disp_text_width, height=Disp_text_height)
 
             self.Disp_text.propagate(False)
-            self.Disp_text.insert('1.0', 'Simplification: ' + simp + '\n' + 'Initial Density Operator: ' + rho.logs)
+            self.Disp_text.insert('1.0', 'Simplification: ' + simp + '\n' + 'Initial Density Operator: ' + rho_cell.logs())
             self.Disp_text.config(state='disabled')
             self.Disp_text.grid(row=0, column=0)
 
@@ -419,16 +737,79 @@ class CalcGui(object):
             button.grid(row=0, column=0, sticky='nsew')
             button.bind('<Button-1>', self.Undo_button)
 
-            button = tk.Button(Edit_label_frame, text='Clear', font=('Helvetica', Edit_font_size), width=6, height=3)
+            button = tk.Button(Edit_label_frame, text='Redo', font=('Helvetica', Edit_font_size), width=6, height=3)
             button.grid(row=0, column=1, sticky='nsew')
+            button.bind('<Button-1>', self.Redo_button)
+
+            button = tk.Button(Edit_label_frame, text='Clear', font=('Helvetica', Edit_font_size), width=6, height=3)
+            button.grid(row=0, column=2, sticky='nsew')
             button.bind('<Button-1>', self.Clear_button)
 
             button = tk.Button(Edit_label_frame, text='Save', font=('Helvetica', Edit_font_size), width=6, height=3)
-            button.grid(row=0, column=2, sticky='nsew')
+            button.grid(row=0, column=3, sticky='nsew')
             button.bind('<Button-1>', self.Save_button)
 
+            button = tk.Button(Edit_label_frame, text='Cancel', font=('Helvetica', Edit_font_size), width=6, height=3)
+            button.grid(row=0, column=4, sticky='nsew')
+            button.bind('<Button-1>', self.Cancel_button)
+
+            button = tk.Button(Edit_label_frame, text='Simplify', font=('Helvetica', Edit_font_size), width=6, height=3)
+            button.grid(row=0, column=5, sticky='nsew')
+            button.bind('<Button-1>', self.Simplify_button)
+
+            # Busy Indicator
+            self.Status_var = tk.StringVar()
+            self.Status_var.set('Ready')
+            label = tk.Label(Edit_label_frame, textvariable=self.Status_var, font=('Helvetica', Edit_font_size), width=16, anchor=tk.W)
+            label.grid(row=0, column=6, padx=padx_v)
+
+            # Branch of rho_cell
+            button = tk.Button(Edit_label_frame, text='<', font=('Helvetica', Edit_font_size), width=6)
+            button.grid(row=1, column=0, sticky='nsew')
+            button.bind('<Button-1>', self.Prev_Branch_button)
+
+            button = tk.Button(Edit_label_frame, text='>', font=('Helvetica', Edit_font_size), width=6)
+            button.grid(row=1, column=1, sticky='nsew')
+            button.bind('<Button-1>', self.Next_Branch_button)
+
+            self.Branch_var = tk.StringVar()
+            self.Branch_var.set('Branch 1/1')
+            label = tk.Label(Edit_label_frame, textvariable=self.Branch_var, font=('Helvetica', Edit_font_size), anchor=tk.W)
+            label.grid(row=1, column=2, columnspan=2, sticky='w', padx=padx_v)
+
+            self.Busy_bar = ttk.Progressbar(Edit_label_frame, mode='indeterminate', length=120)
+            self.Busy_bar.grid(row=1, column=4, columnspan=3, sticky='ew', pady=pady_v)
+
         ####### Edit Section Ends #######
 
+        ####### Numeric Section Starts #######
+        if Numeric_switch == 1:
+            Numeric_label_frame = ttk.LabelFrame(app, text='Numeric', width=Numeric_width, height=Numeric_height)
+            Numeric_label_frame.propagate(False)
+            Numeric_label_frame.grid(row=2, column=1, padx=padx_v, pady=pady_v, sticky=tk.NW)
+
+            button = tk.Button(Numeric_label_frame, text='Sweep', font=('Helvetica', Numeric_font_size), width=8, height=3)
+            button.grid(row=0, column=0, sticky='nsew')
+            button.bind('<Button-1>', self.Sweep_button)
+
+            button = tk.Button(Numeric_label_frame, text='Acquire', font=('Helvetica', Numeric_font_size), width=8, height=3)
+            button.grid(row=0, column=1, sticky='nsew')
+            button.bind('<Button-1>', self.Acquire_button)
+
+            button = tk.Button(Numeric_label_frame, text='Phase\nCycle', font=('Helvetica', Numeric_font_size), width=8, height=3)
+            button.grid(row=0, column=2, sticky='nsew')
+            button.bind('<Button-1>', self.PhaseCycle_button)
+
+            button = tk.Button(Numeric_label_frame, text='Profile', font=('Helvetica', Numeric_font_size), width=8, height=3)
+            button.grid(row=0, column=3, sticky='nsew')
+            button.bind('<Button-1>', self.Profile_button)
+
+        ####### Numeric Section Ends #######
+
+        # States of a replayed journal are recomputed on the engine like other operations.
+        self.recovering = []
+        CalcGui.load_State(self)
+
     ####### Pulse ####### 
     def click_FA_button(self, event):
         check = event.widget['text']
@@ -440,20 +821,18 @@ class CalcGui(object):
 
     def click_PULSE_button(self, event):
         FA_str = self.FA_var.get()
-        check_symbols(FA_str)
         PH_str = self.PH_var.get()
-        check_symbols(PH_str)
         check = event.widget['text']
 
+        t0 = time.perf_counter()
         if PH_str in PH[0:4]: # Quadrature Phase
-            cmd_s = 'rho = rho.pulse(["' + check + '"], ["' + PH_str + '"], [' + FA_str + '])'
+            op = ('pulse', ([check], [PH_str], [table.parse(FA_str)]))
         else: # Arbitrary phase 
-            cmd_s = 'rho = rho.pulse_phshift(["' + check + '"], [' + PH_str + '], [' + FA_str + '])'
+            op = ('pulse_phshift', ([check], [table.parse(PH_str)], [table.parse(FA_str)]))
+        if self.profiler is not None:
+            self.profiler.parse(time.perf_counter() - t0)
 
-        exec(cmd_s, locals(), globals())
-        rho_cell.append(rho)
-        
-        CalcGui.update_Disp_text(self)
+        CalcGui.submit_operation(self, op)
     ####### Pulse #######
 
     ####### Chemical Shift ####### 
@@ -463,14 +842,13 @@ class CalcGui(object):
 
     def click_CS_button(self, event):
         CS_str = self.CS_var.get()
-        check_symbols(CS_str)
         check = event.widget['text']
-        cmd_s = 'rho = rho.cs(["' + check + '"], [' + CS_str + '])'
+        t0 = time.perf_counter()
+        op = ('cs', ([check], [table.parse(CS_str)]))
+        if self.profiler is not None:
+            self.profiler.parse(time.perf_counter() - t0)
 
-        exec(cmd_s, locals(), globals())
-        rho_cell.append(rho)
-
-        CalcGui.update_Disp_text(self)
+        CalcGui.submit_operation(self, op)
     ####### Chemical Shift ####### 
 
     ####### J-coupling ####### 
@@ -480,67 +858,743 @@ class CalcGui(object):
 
     def click_JC_button(self, event):
         JC_str = self.JC_var.get()
-        check_symbols(JC_str)
         check = event.widget['text']
-        cmd_s = 'rho = rho.jc(["' + check + '"], [' + JC_str + '])'
-        exec(cmd_s, locals(), globals())
-        rho_cell.append(rho)
+        t0 = time.perf_counter()
+        op = ('jc', ([check], [table.parse(JC_str)]))
+        if self.profiler is not None:
+            self.profiler.parse(time.perf_counter() - t0)
 
-        CalcGui.update_Disp_text(self)
+        CalcGui.submit_operation(self, op)
     ####### J-coupling #######
 
+    ####### Engine #######
+    def submit_operation(self, op):
+        if not self.engine.busy():
+            idx = rho_cell.child(op)
+            if idx is not None: # Already calculated in another branch
+                segment = rho_cell.advance(idx)
+                CalcGui.load_State(self)
+                CalcGui.update_Disp_text(self, segment)
+                return
+        if not self.engine.busy():
+            self.step_t0 = time.perf_counter()
+        self.engine.submit(op)
+        CalcGui.update_Status(self)
+        if not self.polling:
+            self.polling = True
+            self.app.after(Poll_interval, self.poll_engine)
+
+    def poll_engine(self):
+        global rho
+        finished = self.engine.poll()
+        if self.profiler is not None and len(self.engine.profiles) > 0:
+            for record in self.engine.profiles:
+                self.profiler.add(record)
+            self.engine.profiles = []
+        for op, status, result in finished:
+            if status == 'done':
+                t0, self.step_t0 = self.step_t0, time.perf_counter()
+                if len(self.recovering) > 0: # State of a replayed step (already displayed)
+                    idx = self.recovering.pop(0)
+                    rho = rho_cell.fill(idx, result)
+                    continue
+                segment = rho_cell.append(op, result, self.step_t0 - t0)
+                rho = rho_cell[-1]
+                CalcGui.update_Disp_text(self, segment)
+                if Lazy_switch == 1 and op[0] != 'simplify' and not self.engine.busy():
+                    if result.expr_size > Lazy_threshold: # Measured on the worker
+                        CalcGui.submit_operation(self, ('simplify', (Lazy_method,)))
+            else:
+                if self.profiler is not None:
+                    self.profiler.reset()
+                print('Error in ' + op[0] + ': ' + result)
+                CalcGui.stop_Recovery(self)
+                self.Status_var.set('Error')
+                self.Busy_bar.stop()
+                self.polling = False
+                return
+        CalcGui.update_Status(self)
+        if len(self.engine.warnings) > 0: # Parallel_verify found a mismatch
+            for warning in self.engine.warnings:
+                print('Error: ' + warning)
+            self.Status_var.set('Error: ' + self.engine.warnings[-1])
+            self.engine.warnings = []
+        if self.profile_gui is not None and len(finished) > 0:
+            self.app.after_idle(self.profile_gui.refresh) # After the display
+        if self.engine.busy():
+            self.app.after(Poll_interval, self.poll_engine)
+        else:
+            self.polling = False
+            if self.save_pending:
+                self.save_pending = False
+                CalcGui.save_file(self)
+
+    def update_Status(self):
+        if self.engine.busy():
+            self.Status_var.set('Busy (' + str(self.engine.pending()) + ')')
+            self.Busy_bar.start(10)
+        else:
+            self.Status_var.set('Ready')
+            self.Busy_bar.stop()
+
+    def Cancel_button(self, event):
+        self.engine.cancel()
+        CalcGui.stop_Recovery(self)
+        if self.profiler is not None:
+            self.profiler.reset()
+        CalcGui.update_Status(self)
+        self.Status_var.set('Cancelled')
+
+    def stop_Recovery(self):
+        # Cancel or an error while replayed states are recomputed:
+        # the session continues from the last recomputed step.
+        global rho
+        if len(self.recovering) == 0:
+            return
+        # The engine holds the state of the last recomputed step.
+        parent = rho_cell.nodes[self.recovering[0]].parent
+        rho_cell.switch(parent, compute=False)
+        self.recovering = []
+        rho = self.engine.rho
+        if len(rho_cell.missing()) > 0:
+            rho = rho_cell.fill(parent, rho)
+        self.engine.reset(rho)
+        self.disp_pending = []
+        CalcGui.reset_Disp_text(self)
+        CalcGui.update_Branch(self)
+
+    def load_State(self):
+        # rho = current state of rho_cell. States dropped from memory (History_spill = 0)
+        # are recomputed on the engine from the last stored state, not on the Tk thread.
+        global rho
+        missing = rho_cell.missing()
+        if len(missing) == 0:
+            rho = rho_cell[-1]
+            self.engine.reset(rho)
+            return
+        rho = rho_cell.state(rho_cell.nodes[missing[0]].parent)
+        self.engine.reset(rho)
+        self.recovering = missing
+        for idx in missing:
+            self.engine.submit(rho_cell.nodes[idx].op)
+        CalcGui.update_Status(self)
+        if not self.polling:
+            self.polling = True
+            self.app.after(Poll_interval, self.poll_engine)
+
+    def close_app(self):
+        if self.cache is not None:
+            print('Cache: ', self.cache.stats())
+        if self.racer is not None:
+            print('Race: ', self.racer.stats())
+        self.engine.close()
+        if self.journal is not None:
+            self.journal.close()
+        rho_cell.close()
+        self.app.destroy()
+
+    def flush_Journal(self):
+        # Steps are written at least every Journal_interval even when idle.
+        if self.journal is not None and self.journal.fob is not None:
+            self.journal.flush()
+            self.app.after(int(Journal_interval*1000), self.flush_Journal)
+    ####### Engine #######
+
     ####### Display #######
-    def update_Disp_text(self):
+    def update_Disp_text(self, segment):
         if Disp_switch == 1:
-            new_logs = '\n' + rho.logs[len(self.prev_logs):]
-            self.disp_logs = self.disp_logs + new_logs
-            CalcGui.reset_Disp_text(self)
-            self.prev_logs = rho.logs
+            CalcGui.append_Disp_text(self, '\n' + segment)
+        CalcGui.update_Branch(self)
+
+    def update_Branch(self):
+        siblings = rho_cell.siblings()
+        self.Branch_var.set('Branch ' + str(siblings.index(rho_cell.current()) + 1) + '/' + str(len(siblings)))
+
+    def append_Disp_text(self, new_logs):
+        # Rendering is coalesced on idle when several steps land at once.
+        self.disp_pending.append(new_logs)
+        if self.disp_flush_id is None:
+            self.disp_flush_id = self.app.after_idle(self.flush_Disp_text)
+
+    def flush_Disp_text(self):
+        self.disp_flush_id = None
+        if len(self.disp_pending) > 0:
+            t0 = time.perf_counter()
+            self.Disp_text.config(state='normal')
+            self.Disp_text.insert('end-1c', ''.join(self.disp_pending))
+            self.Disp_text.config(state='disabled')
+            self.disp_pending = []
+            CalcGui.trim_Disp_text(self)
+            self.Disp_text.see('end')
+            if self.profiler is not None:
+                self.profiler.display(time.perf_counter() - t0)
+
+    def remove_Disp_text(self, old_logs):
+        # Remove only the last segment.
+        if len(self.disp_pending) > 0:
+            self.disp_pending.pop()
+        else:
+            self.Disp_text.config(state='normal')
+            self.Disp_text.delete('end-' + str(len(old_logs) + 1) + 'c', 'end-1c')
+            self.Disp_text.config(state='disabled')
+            self.Disp_text.see('end')
+
+    def get_disp_logs(self):
+        return rho_cell.logs()
 
     ####### Display #######
 
     ####### Edit #######
     def Undo_button(self, event):
+        if self.engine.busy(): # Undo the pending operations first
+            CalcGui.Cancel_button(self, event)
+            return
         if len(rho_cell) > 1:
-            len_tmp = len(rho_cell[-1].logs) - len(rho_cell[-2].logs)
-            self.disp_logs = self.disp_logs[:-len_tmp-1]# Include \n
-            if len(rho_cell) == 2: # Initial condition
-                self.prev_logs = rho_cell[-2].logs
-            else:
-                self.prev_logs = rho_cell[-3].logs
-            exec('rho = rho_cell[-2]', locals(), globals()) # Update rho. exec() should be used.
-            exec('rho_cell = rho_cell[:-1]', locals(), globals()) # Delete the last element of rho_cell. exec() should be used.
-            # ele = rho_cell.pop() # Delete the last element, this line also works.
-            CalcGui.reset_Disp_text(self)
+            CalcGui.remove_Disp_text(self, '\n' + rho_cell.pop())
+            CalcGui.load_State(self)
+            CalcGui.update_Branch(self)
+
+    def Redo_button(self, event):
+        if self.engine.busy():
+            return
+        segment = rho_cell.redo()
+        if segment is not None:
+            CalcGui.load_State(self)
+            CalcGui.update_Disp_text(self, segment)
+
+    def Prev_Branch_button(self, event):
+        CalcGui.switch_Branch(self, -1)
+
+    def Next_Branch_button(self, event):
+        CalcGui.switch_Branch(self, 1)
+
+    def switch_Branch(self, step):
+        # Switch to a sibling branch. Shared steps are not recomputed.
+        global rho
+        self.engine.cancel()
+        self.recovering = []
+        CalcGui.update_Status(self)
+        rho_cell.switch_sibling(step, compute=False)
+        CalcGui.load_State(self)
+        self.disp_pending = []
+        CalcGui.reset_Disp_text(self)
+        CalcGui.update_Branch(self)
 
     def Clear_button(self, event):
-            self.prev_logs = rho_cell[0].logs
-            self.disp_logs = str(self.prev_logs) # Initilize self.disp_logs
-            exec('rho = rho_cell[0]', locals(), globals()) # Update rho as globals
-            exec('rho_cell = [rho]', locals(), globals())
+            global rho
+            self.disp_pending = []
+            self.recovering = []
+            rho_cell.clear()
+            rho = rho_cell[0]
+            self.engine.reset(rho)
+            CalcGui.update_Status(self)
             CalcGui.reset_Disp_text(self)
+            CalcGui.update_Branch(self)
+
+    def Simplify_button(self, event):
+        # Batch simplification of the current rho (lazy simplification).
+        if rho_cell.nodes[rho_cell.current()].op != ('simplify', (Lazy_method,)):
+            CalcGui.submit_operation(self, ('simplify', (Lazy_method,)))
 
     def Save_button(self, event):
+        if Lazy_switch == 1: # Simplify before saving
+            CalcGui.Simplify_button(self, event)
+        if self.engine.busy():
+            self.save_pending = True
+        else:
+            CalcGui.save_file(self)
+        return "break"# Without this line, Save_button has been sunken
+
+    def save_file(self):
         file = filedialog.asksaveasfilename(
-                            filetypes=[("txt file", ".txt")],
+                            filetypes=[("txt file", ".txt"), ("PO_GUI session", ".pogui")],
                             defaultextension=".txt",
                             initialfile="PO_Result.txt")
+        if len(file) == 0:
+            return
+        if file.endswith('.pogui'): # History with its states, for Open in the setup window
+            rho_cell.save(file, {'SpinLabel': SpinLabel, 'simp': simp, 'rho_str': rho_str,
+                                 'backend': Backend, 'values': Values})
+            return
         fob=open(file,'w')
-        fob.write('Simplification: ' + simp + '\n' + 'Initial Density Operator: ' + self.disp_logs)
+        fob.write('Simplification: ' + simp + '\n' + 'Initial Density Operator: ' + CalcGui.get_disp_logs(self))
         fob.close()
-        return "break"# Without this line, Save_button has been sunken
         
     ####### Edit #######
 
+    ####### Numeric #######
+    def Sweep_button(self, event):
+        SweepGui(self.app, rho)
+        return "break"
+
+    def Acquire_button(self, event):
+        AcquireGui(self.app, rho)
+        return "break"
+
+    def PhaseCycle_button(self, event):
+        if not self.engine.busy():
+            PhaseCycleGui(self)
+        return "break"
+
+    def Profile_button(self, event):
+        # Shows or hides the Profile panel. Profiling is off until it is first opened.
+        if self.profile_gui is None:
+            self.profile_gui = ProfileGui(self)
+        else:
+            self.profile_gui.toggle()
+        return "break"
+
+    def submit_PhaseCycle(self, prefix, op):
+        # The cycle replaces the steps after prefix as a new branch.
+        # It runs on the engine like other operations, so Cancel stops it.
+        self.engine.cancel()
+        self.recovering = []
+        rho_cell.switch(prefix, compute=False)
+        CalcGui.load_State(self)
+        self.disp_pending = []
+        CalcGui.reset_Disp_text(self)
+        CalcGui.update_Branch(self)
+        CalcGui.submit_operation(self, op)
+    ####### Numeric #######
+
     ####### Utility #######
     def reset_Disp_text(self):
+        t0 = time.perf_counter()
         self.Disp_text.config(state='normal')
         self.Disp_text.delete('1.0',self.Disp_text.index(tk.END))
-        self.Disp_text.insert('1.0', 'Simplification: ' + simp + '\n' + 'Initial Density Operator: ' + self.disp_logs)
+        self.Disp_text.insert('1.0', 'Simplification: ' + simp + '\n' + 'Initial Density Operator: ' + CalcGui.get_disp_logs(self))
         self.Disp_text.config(state='disabled')
+        CalcGui.trim_Disp_text(self)
         self.Disp_text.see('end')
+        if self.profiler is not None:
+            self.profiler.add_display('reset_Disp_text', time.perf_counter() - t0)
+
+    def trim_Disp_text(self):
+        # With the journal, only the last Disp_max_chars characters stay in the
+        # display; it is trimmed to 3/4 of that so that it is not trimmed at every step.
+        if self.journal is None or Disp_max_chars <= 0:
+            return
+        nchars = self.Disp_text.count('1.0', 'end', 'chars')[0]
+        if nchars <= Disp_max_chars:
+            return
+        note = '[Earlier steps: ' + self.journal.file + ']\n'
+        self.Disp_text.config(state='normal')
+        self.Disp_text.delete('1.0', '1.0 + ' + str(nchars - Disp_max_chars*3//4) + ' chars')
+        self.Disp_text.insert('1.0', note)
+        self.Disp_text.config(state='disabled')
     ####### Utility #######
 
+class DialogJob(object):
+    # Export job of a numeric dialog (Sweep, Acquire): func(*args) returns the
+    # list of files written. It runs in a process that Cancel or closing the
+    # window terminates, or on a thread when Engine_process is False (Cancel
+    # then abandons it). Progress and errors go to status_var.
+    def __init__(self, win, status_var):
+        self.win = win
+        self.status_var = status_var
+        self.job = None
+        win.protocol('WM_DELETE_WINDOW', self.close)
+
+    def start(self, func, args):
+        if self.job is not None:
+            self.status_var.set('Busy')
+            return
+        self.t0 = time.perf_counter()
+        if Engine_process:
+            try:
+                self.job = CallProcess(func, args)
+            except (OSError, ValueError) as e:
+                print('PO_GUI: process is not available (' + repr(e) + '), using a thread.')
+        if self.job is None:
+            self.job = CallThread(func, args)
+        self.status_var.set('Running ...')
+        self.win.after(Poll_interval, self.check)
+
+    def check(self):
+        if self.job is None: # Cancelled
+            return
+        if not self.job.poll():
+            self.win.after(Poll_interval, self.check)
+            return
+        status, result = self.job.recv()
+        self.job = None
+        if status == 'done':
+            self.status_var.set('Saved in %.2f s: ' % (time.perf_counter() - self.t0) + ', '.join(os.path.basename(f) for f in result))
+        else:
+            self.status_var.set('Error: ' + result)
+
+    def cancel(self):
+        if self.job is not None:
+            self.job.terminate()
+            self.job = None
+            self.status_var.set('Cancelled')
+
+    def close(self):
+        self.cancel()
+        self.win.destroy()
+
+    def add_buttons(self, row, column, export, font_size, padx_v, pady_v):
+        # Export and Cancel buttons at (row, column) and (row, column+1).
+        for x, (num, func) in enumerate([('Export', export), ('Cancel', self.click_Cancel_button)]):
+            button = tk.Button(self.win, text=num, font=('Helvetica', font_size), width=8, height=2)
+            button.grid(row=row, column=column+x, padx=padx_v, pady=pady_v)
+            button.bind('<Button-1>', func)
+
+    def click_Cancel_button(self, event):
+        self.cancel()
+        return "break"
+
+class SweepGui(object):
+    # Numeric sweep of the current rho over a grid of its symbols (PO_Numeric.py).
+    def __init__(self, app, rho):
+        from PO_Numeric import free_symbols
+        self.rho = rho
+        self.app = app
+        self.win = tk.Toplevel(app)
+        self.win.title('Numeric Sweep')
+        font_size = 10
+        padx_v = 5
+        pady_v = 5
+
+        self.params = free_symbols(rho)
+        for x, num in enumerate(['Symbol', 'Start', 'Stop', 'Points']):
+            label = tk.Label(self.win, text=num, font=('Helvetica', font_size))
+            label.grid(row=0, column=x, padx=padx_v, pady=pady_v)
+
+        # Range of each symbol. Points = 1 keeps the symbol at Start.
+        self.vars = []
+        for ii, name in enumerate(self.params):
+            label = tk.Label(self.win, text=name, font=('Helvetica', font_size))
+            label.grid(row=ii+1, column=0, padx=padx_v)
+            row_vars = []
+            for x, default in enumerate(['0', '1', '101']):
+                var = tk.StringVar()
+                var.set(default)
+                entry = tk.Entry(self.win, textvariable=var, font=('Helvetica', font_size), width=10)
+                entry.grid(row=ii+1, column=x+1, padx=padx_v)
+                row_vars.append(var)
+            self.vars.append(row_vars)
+
+        nrow = len(self.params) + 1
+        label = tk.Label(self.win, text='Chunk Points', font=('Helvetica', font_size))
+        label.grid(row=nrow, column=0, padx=padx_v, pady=pady_v)
+        self.chunk_var = tk.StringVar()
+        self.chunk_var.set(str(2**20))
+        entry = tk.Entry(self.win, textvariable=self.chunk_var, font=('Helvetica', font_size), width=10)
+        entry.grid(row=nrow, column=1, padx=padx_v, pady=pady_v)
+
+        self.status_var = tk.StringVar()
+        self.status_var.set('')
+        label = tk.Label(self.win, textvariable=self.status_var, font=('Helvetica', font_size))
+        label.grid(row=nrow+1, column=0, columnspan=3, sticky=tk.W, padx=padx_v, pady=pady_v)
+
+        self.job = DialogJob(self.win, self.status_var)
+        self.job.add_buttons(nrow+1, 3, self.click_Export_button, font_size, padx_v, pady_v)
+
+    def get_grid(self):
+        import numpy as np
+        grid = {}
+        for name, (start, stop, points) in zip(self.params, self.vars):
+            start = float(table.parse(start.get()))
+            stop = float(table.parse(stop.get()))
+            points = int(points.get())
+            if points < 1:
+                raise ValueError('Points of ' + name + ' must be 1 or more')
+            grid[name] = np.linspace(start, stop, points)
+        return grid
+
+    def click_Export_button(self, event):
+        file = filedialog.asksaveasfilename(
+                            parent=self.win,
+                            filetypes=[("NumPy file", ".npz .npy")],
+                            defaultextension=".npz",
+                            initialfile="PO_Sweep.npz")
+        if len(file) == 0:
+            return "break"
+        try:
+            grid = self.get_grid()
+            chunk_points = int(self.chunk_var.get())
+        except (ValueError, TypeError, SyntaxError) as e:
+            self.status_var.set('Error: ' + str(e))
+            return "break"
+        from PO_Numeric import sweep_to_file
+        self.job.start(sweep_to_file, (self.rho, grid, file, SpinLabel, chunk_points))
+        return "break"
+
+class AcquireGui(object):
+    # FID and spectrum of the observed spins from the current rho (PO_Numeric.py).
+    # Offsets oI (rad/s) and couplings JIS (Hz) act during the acquisition.
+    # A t1 symbol gives a 2D FID over its range.
+    def __init__(self, app, rho):
+        from PO_Numeric import free_symbols, acquisition_symbols
+        self.rho = rho
+        self.app = app
+        self.win = tk.Toplevel(app)
+        self.win.title('Acquisition')
+        font_size = 10
+        padx_v = 5
+        pady_v = 5
+
+        # Observed spins
+        frame = ttk.Frame(self.win)
+        frame.grid(row=0, column=0, columnspan=4, sticky=tk.W, padx=padx_v, pady=pady_v)
+        label = tk.Label(frame, text='Observe', font=('Helvetica', font_size))
+        label.grid(row=0, column=0)
+        self.observe_vars = []
+        for x, num in enumerate(SpinLabel):
+            var = tk.IntVar()
+            var.set(1 if x == 0 else 0)
+            button = tk.Checkbutton(frame, text=num, variable=var, font=('Helvetica', font_size))
+            button.grid(row=0, column=x+1)
+            self.observe_vars.append(var)
+
+        # Values of the symbols
+        names = free_symbols(rho)
+        names = names + [name for name in acquisition_symbols(SpinLabel) if name not in names]
+        self.value_vars = {}
+        for ii, name in enumerate(names):
+            label = tk.Label(self.win, text=name, font=('Helvetica', font_size))
+            label.grid(row=ii//2+1, column=(ii%2)*2, sticky=tk.E, padx=padx_v)
+            var = tk.StringVar()
+            var.set('0')
+            entry = tk.Entry(self.win, textvariable=var, font=('Helvetica', font_size), width=12)
+            entry.grid(row=ii//2+1, column=(ii%2)*2+1, padx=padx_v)
+            self.value_vars[name] = var
+
+        # Acquisition parameters
+        nrow = (len(names)+1)//2 + 1
+        self.acq_vars = {}
+        for ii, (name, default) in enumerate([('Dwell (s)', '1e-3'), ('Points', '4096'), ('T2 (s)', '0.1'),
+                                              ('t1 Symbol', ''), ('t1 Increment (s)', '1e-3'), ('t1 Points', '128')]):
+            label = tk.Label(self.win, text=name, font=('Helvetica', font_size))
+            label.grid(row=nrow+ii//2, column=(ii%2)*2, sticky=tk.E, padx=padx_v, pady=pady_v)
+            var = tk.StringVar()
+            var.set(default)
+            if name == 't1 Symbol':
+                entry = ttk.Combobox(self.win, textvariable=var, values=[''] + names, width=10)
+            else:
+                entry = tk.Entry(self.win, textvariable=var, font=('Helvetica', font_size), width=12)
+            entry.grid(row=nrow+ii//2, column=(ii%2)*2+1, padx=padx_v, pady=pady_v)
+            self.acq_vars[name] = var
+
+        nrow = nrow + 3
+        self.status_var = tk.StringVar()
+        self.status_var.set('')
+        label = tk.Label(self.win, textvariable=self.status_var, font=('Helvetica', font_size))
+        label.grid(row=nrow, column=0, columnspan=3, sticky=tk.W, padx=padx_v, pady=pady_v)
+
+        self.job = DialogJob(self.win, self.status_var)
+        self.job.add_buttons(nrow, 3, self.click_Export_button, font_size, padx_v, pady_v)
+
+    def click_Export_button(self, event):
+        import numpy as np
+        file = filedialog.asksaveasfilename(
+                            parent=self.win,
+                            filetypes=[("NumPy file", ".npz .npy")],
+                            defaultextension=".npz",
+                            initialfile="PO_FID.npz")
+        if len(file) == 0:
+            return "break"
+        try:
+            observe = [SL for SL, var in zip(SpinLabel, self.observe_vars) if var.get() == 1]
+            values = dict((name, float(table.parse(var.get()))) for name, var in self.value_vars.items())
+            dwell = float(table.parse(self.acq_vars['Dwell (s)'].get()))
+            npoints = int(self.acq_vars['Points'].get())
+            T2 = float(table.parse(self.acq_vars['T2 (s)'].get()))
+            t1 = None
+            t1_name = self.acq_vars['t1 Symbol'].get()
+            if len(t1_name) > 0:
+                t1_inc = float(table.parse(self.acq_vars['t1 Increment (s)'].get()))
+                t1 = (t1_name, np.arange(int(self.acq_vars['t1 Points'].get()))*t1_inc)
+        except (ValueError, TypeError, SyntaxError) as e:
+            self.status_var.set('Error: ' + str(e))
+            return "break"
+        from PO_Numeric import acquire_to_file
+        self.job.start(acquire_to_file, (self.rho, SpinLabel, observe, values, dwell, npoints, file, T2, t1))
+        return "break"
+
+class ProfileGui(object):
+    # Per-operation profile (PO_Profile.py). Closing the window only hides it;
+    # Record switches the measurements on and off.
+    def __init__(self, calc):
+        self.calc = calc
+        self.win = tk.Toplevel(calc.app)
+        self.win.title('Profile')
+        self.win.protocol('WM_DELETE_WINDOW', self.toggle)
+        font_size = 10
+        padx_v = 5
+        pady_v = 5
+
+        self.tree = ttk.Treeview(self.win, columns=Profile_fields, show='headings', height=15)
+        for name in Profile_fields:
+            self.tree.heading(name, text=name)
+            self.tree.column(name, width=160 if name == 'op' else 70, anchor=tk.W if name == 'op' else tk.E)
+        self.tree.grid(row=0, column=0, columnspan=5, padx=padx_v, pady=pady_v)
+        scrollbar = tk.Scrollbar(self.win, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree['yscrollcommand'] = scrollbar.set
+        scrollbar.grid(row=0, column=5, sticky=(tk.N, tk.S))
+
+        self.record_var = tk.IntVar()
+        self.record_var.set(1)
+        button = tk.Checkbutton(self.win, text='Record', variable=self.record_var, font=('Helvetica', font_size), command=self.set_record)
+        button.grid(row=1, column=0, sticky=tk.W, padx=padx_v, pady=pady_v)
+        for x, (num, func) in enumerate([('Export CSV', self.click_CSV_button), ('Export JSON', self.click_JSON_button),
+                                         ('Clear', self.click_Clear_button)]):
+            button = tk.Button(self.win, text=num, font=('Helvetica', font_size), width=10)
+            button.grid(row=1, column=x+2, padx=padx_v, pady=pady_v)
+            button.bind('<Button-1>', func)
+        self.shown = 0
+        self.profiler = Profiler()
+        self.set_record()
+
+    def set_record(self):
+        on = self.record_var.get() == 1
+        self.calc.profiler = self.profiler if on else None
+        self.calc.engine.profile = on
+        if not on:
+            self.profiler.reset()
+
+    def toggle(self):
+        if self.win.state() == 'withdrawn':
+            self.win.deiconify()
+            self.refresh()
+        else:
+            self.win.withdraw()
+
+    def refresh(self):
+        # Add the rows of the new records.
+        for r in self.profiler.records[self.shown:]:
+            values = []
+            for name in Profile_fields:
+                v = r.get(name)
+                values.append('%.4f' % v if isinstance(v, float) else ('' if v is None else str(v)))
+            self.tree.insert('', 'end', values=values)
+        self.shown = len(self.profiler.records)
+        if self.shown > 0:
+            self.tree.see(self.tree.get_children()[-1])
+
+    def click_CSV_button(self, event):
+        file = filedialog.asksaveasfilename(parent=self.win, filetypes=[("CSV file", ".csv")],
+                                            defaultextension=".csv", initialfile="PO_Profile.csv")
+        if len(file) > 0:
+            self.profiler.to_csv(file)
+        return "break"
+
+    def click_JSON_button(self, event):
+        file = filedialog.asksaveasfilename(parent=self.win, filetypes=[("JSON file", ".json")],
+                                            defaultextension=".json", initialfile="PO_Profile.json")
+        if len(file) > 0:
+            self.profiler.to_json(file)
+        return "break"
+
+    def click_Clear_button(self, event):
+        self.profiler.clear()
+        self.tree.delete(*self.tree.get_children())
+        self.shown = 0
+        return "break"
+
+class PhaseCycleGui(object):
+    # Phase cycle over the steps of the current branch (PO_Cycle.py).
+    # Each pulse takes a table of phases, e.g. 'x -x' or 'x y -x -y'; the cycle
+    # starts at the first pulse whose table differs from its recorded phase.
+    # Step k of the cycle uses entry k % length of each table and of the receiver table.
+    def __init__(self, calc):
+        self.calc = calc
+        self.app = calc.app
+        self.win = tk.Toplevel(self.app)
+        self.win.title('Phase Cycle')
+        font_size = 10
+        padx_v = 5
+        pady_v = 5
+
+        self.nodes = rho_cell.path[1:]
+        self.ops = [rho_cell.nodes[idx].op for idx in self.nodes]
+        self.vars = {}
+        self.recorded = {} # Phase of each pulse in the history
+        for x, num in enumerate(['Step', 'Operation', 'Phases']):
+            label = tk.Label(self.win, text=num, font=('Helvetica', font_size))
+            label.grid(row=0, column=x, padx=padx_v, pady=pady_v)
+        for ii, op in enumerate(self.ops):
+            label = tk.Label(self.win, text=str(ii+1), font=('Helvetica', font_size))
+            label.grid(row=ii+1, column=0, padx=padx_v)
+            label = tk.Label(self.win, text=op_label(op), font=('Helvetica', font_size), anchor=tk.W)
+            label.grid(row=ii+1, column=1, sticky=tk.W, padx=padx_v)
+            if op[0] in ('pulse', 'pulse_phshift'):
+                var = tk.StringVar()
+                var.set(str(op[1][1][0]))
+                self.recorded[ii] = var.get()
+                entry = tk.Entry(self.win, textvariable=var, font=('Helvetica', font_size), width=16)
+                entry.grid(row=ii+1, column=2, padx=padx_v)
+                self.vars[ii] = var
+
+        # The steps run on the process pool of CalcEngine (Parallel > 0).
+        nrow = len(self.ops) + 1
+        self.receiver_var = tk.StringVar()
+        self.receiver_var.set('x')
+        label = tk.Label(self.win, text='Receiver', font=('Helvetica', font_size))
+        label.grid(row=nrow, column=1, sticky=tk.E, padx=padx_v, pady=pady_v)
+        entry = tk.Entry(self.win, textvariable=self.receiver_var, font=('Helvetica', font_size), width=16)
+        entry.grid(row=nrow, column=2, padx=padx_v, pady=pady_v)
+
+        self.status_var = tk.StringVar()
+        self.status_var.set('')
+        label = tk.Label(self.win, textvariable=self.status_var, font=('Helvetica', font_size))
+        label.grid(row=nrow+1, column=0, columnspan=3, sticky=tk.W, padx=padx_v, pady=pady_v)
+
+        frame = ttk.Frame(self.win)
+        frame.grid(row=nrow+2, column=0, columnspan=3, sticky=tk.E, padx=padx_v, pady=pady_v)
+        for x, (num, func) in enumerate([('Run', self.click_Run_button), ('Cancel', self.click_Cancel_button)]):
+            button = tk.Button(frame, text=num, font=('Helvetica', font_size), width=8, height=2)
+            button.grid(row=0, column=x, padx=padx_v)
+            button.bind('<Button-1>', func)
+
+    def parse_phases(self, text):
+        from PO_Cycle import Quadrature_phases
+        return [ph if ph in Quadrature_phases else table.parse(ph) for ph in text.replace(',', ' ').split()]
+
+    def click_Run_button(self, event):
+        try:
+            tables = dict((ii, self.parse_phases(var.get())) for ii, var in self.vars.items())
+            receiver = self.parse_phases(self.receiver_var.get())
+        except (ValueError, TypeError, SyntaxError) as e:
+            self.status_var.set('Error: ' + str(e))
+            return "break"
+        # A single edited phase (e.g. x -> y) is part of the cycle as well.
+        cycled = [ii for ii, t in tables.items()
+                  if len(t) > 1 or t != self.parse_phases(self.recorded[ii])]
+        if len(cycled) == 0 and receiver == ['x']:
+            self.status_var.set('No phase was changed')
+            return "break"
+        if self.calc.engine.busy():
+            self.status_var.set('Busy')
+            return "break"
+        from PO_Cycle import cycle_operation
+        # Steps before the first cycled pulse are shared by all cycle steps.
+        start = min(cycled) if len(cycled) > 0 else len(self.ops)
+        prefix = ([rho_cell.path[0]] + self.nodes)[start]
+        tables = dict((ii-start, tables[ii]) for ii in cycled)
+        self.op = cycle_operation(self.ops[start:], tables, receiver, SpinLabel, PO_simp)
+        self.status_var.set('Running ...')
+        self.t0 = time.perf_counter()
+        CalcGui.submit_PhaseCycle(self.calc, prefix, self.op)
+        self.app.after(Poll_interval, self.check_run)
+        return "break"
+
+    def click_Cancel_button(self, event):
+        if self.calc.engine.busy():
+            CalcGui.Cancel_button(self.calc, event)
+        return "break"
+
+    def check_run(self):
+        # The result is appended to the history by CalcGui.poll_engine.
+        if self.calc.engine.busy():
+            self.app.after(Poll_interval, self.check_run)
+        elif rho_cell.nodes[rho_cell.current()].op == self.op:
+            steps = self.op[1][0]
+            self.status_var.set('Done in %.2f s (%d steps, %d distinct)' % (time.perf_counter() - self.t0, sum(n for ops, rec, sl, n in steps), len(steps)))
+        else:
+            self.status_var.set(self.calc.Status_var.get()) # Cancelled or Error
+
 ####### Main #######
 def main():
     # Window Setting
@@ -548,7 +1602,11 @@ def main():
 
     # Window size non resizable
     app.resizable(width=False, height=False)
-    CalcGui(app)
+    if Setup_dialog == 1:
+        SetupGui(app)
+    else:
+        setup_session(*console_setup())
+        CalcGui(app)
 
     # Display
     app.mainloop()
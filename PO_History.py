@@ -0,0 +1,291 @@
+#  ------------------------------------------------------------------------
+#  File Name   : PO_History.py
+#  Description : History of density operators for PO_GUI (rho_cell)
+#  Developer   : Dr. Kosuke Ohgo
+#  ULR         : https://github.com/ohgo1977/PO_GUI_Python
+#
+#  MIT License, Copyright (c) 2023 Kosuke Ohgo. See LICENSE for details.
+#  ------------------------------------------------------------------------
+
+import collections
+import os
+import pickle
+import shutil
+import tempfile
+import zipfile
+
+from PO_Engine import apply_operation, state_bytes, strip_logs
+
+Session_format = 1 # Change when the contents of a session file change
+
+class Node(object):
+    # One step: the operation applied to the parent state and its log segment.
+    __slots__ = ('parent', 'op', 'segment', 'size', 'children')
+
+    def __init__(self, parent, op, segment, size=0):
+        self.parent = parent
+        self.op = op
+        self.segment = segment
+        self.size = size
+        self.children = []
+
+class History(object):
+    # Replacement of the list rho_cell.
+    # The steps form a tree. Undo keeps the undone branch, so going back to it
+    # or applying the same operation again reuses the stored states, and the
+    # shared prefix of two branches is never recomputed. path is the active branch.
+    # Each step is stored as (parent, operation, log segment). Full states are
+    # kept in memory up to budget bytes (estimated by state_bytes); older states
+    # are spilled to disk (spill=True) or dropped and recomputed from the nearest
+    # stored ancestor. PO_GUI recomputes them on CalcEngine (missing() and fill()).
+    # history[0] is the initial density operator and history[-1] the current one.
+    def __init__(self, rho, budget=64*2**20, spill=True):
+        self.budget = budget
+        self.spill = spill
+        self.spill_dir = None
+        self.nodes = []
+        self.path = [] # Node indices from the initial state to the current state
+        self.states = collections.OrderedDict() # Node index -> state, in LRU order
+        self.spilled = {} # Node index -> file
+        self.archive = None # Session file the states are read from (load)
+        self.archived = {} # Node index -> name in archive
+        self.journal = None # PO_Journal.Journal: steps and moves are written as they happen
+        self.total = 0
+        if rho is not None:
+            self._add(None, None, str(rho.logs), strip_logs(rho))
+
+    ####### Access #######
+    def __len__(self):
+        return len(self.path)
+
+    def __getitem__(self, ii):
+        return self.state(self.path[ii])
+
+    def segments(self):
+        # Log segments from the initial state to the current state.
+        return [self.nodes[idx].segment for idx in self.path]
+
+    def logs(self):
+        return '\n'.join(self.segments())
+
+    def state(self, idx):
+        if idx in self.states:
+            self.states.move_to_end(idx)
+            return self.states[idx]
+        if idx in self.spilled:
+            with open(self.spilled.pop(idx), 'rb') as fob:
+                state = pickle.load(fob)
+        elif idx in self.archived:
+            state = pickle.loads(self.archive.read(self.archived.pop(idx)))
+        else: # Recompute from the nearest stored ancestor
+            chain = [idx]
+            while not self._stored(self.nodes[chain[-1]].parent):
+                chain.append(self.nodes[chain[-1]].parent)
+            state = self.state(self.nodes[chain[-1]].parent)
+            for jj in reversed(chain[1:]):
+                state = strip_logs(apply_operation(state, self.nodes[jj].op))
+                self._keep(jj, state)
+            state = strip_logs(apply_operation(state, self.nodes[idx].op))
+        self._keep(idx, state)
+        return state
+    ####### Access #######
+
+    ####### Edit #######
+    def append(self, op, rho, seconds=None):
+        # rho: result of op applied to self[-1]. The stored states have no logs,
+        # so rho.logs is the log segment of op (CalcEngine keeps its state the same way).
+        idx = self.child(op)
+        if idx is not None:
+            segment = self.advance(idx)
+            if not self._stored(idx):
+                self._keep(idx, strip_logs(rho))
+            return segment
+        segment = rho.logs
+        self._add(self.path[-1], op, segment, strip_logs(rho))
+        if self.journal is not None:
+            self.journal.node(self.path[-1], self.path[-2], op, segment, seconds)
+        return segment
+
+    def attach(self, parent, op, segment):
+        # Add a step without its state (replay of a journal). Returns its index.
+        idx = len(self.nodes)
+        self.nodes.append(Node(parent, op, segment))
+        self.nodes[parent].children.append(idx)
+        return idx
+
+    def pop(self):
+        # Step back to the parent. The branch stays in the tree. Returns its log segment.
+        idx = self.path.pop()
+        self._moved()
+        return self.nodes[idx].segment
+
+    def clear(self):
+        # Back to the initial density operator.
+        del self.path[1:]
+        self._moved()
+
+    def close(self):
+        if self.spill_dir is not None:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+            self.spill_dir = None
+        if self.archive is not None:
+            self.archive.close()
+            self.archive = None
+    ####### Edit #######
+
+    ####### Session #######
+    # A session file is a zip archive: session.pkl holds the settings and the
+    # tree (parent, operation, log segment, size of each step, and the path),
+    # states/<index>.pkl the stored states, each deflated on its own.
+    # load() reads only session.pkl; states are read when they are needed.
+    def save(self, file, settings):
+        tmp = file + '.tmp'
+        with zipfile.ZipFile(tmp, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for idx in range(len(self.nodes)):
+                name = 'states/' + str(idx) + '.pkl'
+                if idx in self.states:
+                    zf.writestr(name, pickle.dumps(self.states[idx], pickle.HIGHEST_PROTOCOL))
+                elif idx in self.spilled:
+                    zf.write(self.spilled[idx], name)
+                elif idx in self.archived:
+                    zf.writestr(name, self.archive.read(self.archived[idx]))
+            tree = [(node.parent, node.op, node.segment, node.size) for node in self.nodes]
+            zf.writestr('session.pkl', pickle.dumps({'format': Session_format, 'settings': settings,
+                                                     'nodes': tree, 'path': self.path}, pickle.HIGHEST_PROTOCOL))
+        if self.archive is not None and os.path.abspath(self.archive.filename) == os.path.abspath(file):
+            self._reopen(tmp, file)
+        else:
+            os.replace(tmp, file)
+
+    def _reopen(self, tmp, file):
+        # Saving over the open session file: read the remaining states from the new file.
+        self.archive.close()
+        os.replace(tmp, file)
+        self.archive = zipfile.ZipFile(file)
+
+    @classmethod
+    def load(cls, file, budget=64*2**20, spill=True):
+        # Returns (history, settings).
+        archive = zipfile.ZipFile(file)
+        session = pickle.loads(archive.read('session.pkl'))
+        if session.get('format') != Session_format:
+            archive.close()
+            raise ValueError('Unknown session format: ' + str(session.get('format')))
+        history = cls(None, budget, spill)
+        history.archive = archive
+        names = set(archive.namelist())
+        for idx, (parent, op, segment, size) in enumerate(session['nodes']):
+            history.nodes.append(Node(parent, op, segment, size))
+            if parent is not None:
+                history.nodes[parent].children.append(idx)
+            if 'states/' + str(idx) + '.pkl' in names:
+                history.archived[idx] = 'states/' + str(idx) + '.pkl'
+        history.path = list(session['path'])
+        return history, session['settings']
+    ####### Session #######
+
+    ####### Branch #######
+    def current(self):
+        return self.path[-1]
+
+    def child(self, op):
+        # Node index of op already applied to the current state, or None.
+        for idx in self.nodes[self.path[-1]].children:
+            if self.nodes[idx].op == op:
+                return idx
+        return None
+
+    def advance(self, idx):
+        # Move to a child of the current state. Returns its log segment.
+        # Its state may be missing (see missing() and fill()).
+        self.path.append(idx)
+        self._moved()
+        return self.nodes[idx].segment
+
+    def redo(self):
+        # Move to the latest child of the current state. Returns its log segment or None.
+        children = self.nodes[self.path[-1]].children
+        if len(children) == 0:
+            return None
+        return self.advance(children[-1])
+
+    def siblings(self):
+        # Branches at the current step (children of the parent).
+        parent = self.nodes[self.path[-1]].parent
+        if parent is None:
+            return [self.path[-1]]
+        return self.nodes[parent].children
+
+    def switch(self, idx, compute=True):
+        # Make node idx the current state. The path follows the parents.
+        # compute=False leaves missing states to the caller (see missing() and fill()).
+        path = [idx]
+        while self.nodes[path[-1]].parent is not None:
+            path.append(self.nodes[path[-1]].parent)
+        self.path = path[::-1]
+        if compute:
+            self.state(idx)
+        self._moved()
+
+    def switch_sibling(self, step, compute=True):
+        # step = +1 or -1: next or previous branch at the current step.
+        siblings = self.siblings()
+        ii = (siblings.index(self.path[-1]) + step) % len(siblings)
+        self.switch(siblings[ii], compute)
+
+    def missing(self):
+        # Nodes of the current path after the last stored state, in order.
+        ii = len(self.path) - 1
+        while not self._stored(self.path[ii]):
+            ii -= 1
+        return self.path[ii+1:]
+
+    def fill(self, idx, rho):
+        # Store the state of node idx computed elsewhere (e.g. on CalcEngine). Returns it.
+        state = strip_logs(rho)
+        self._keep(idx, state)
+        return state
+
+    def _moved(self):
+        if self.journal is not None:
+            self.journal.current(self.path[-1])
+    ####### Branch #######
+
+    ####### Memory #######
+    def _stored(self, idx):
+        return idx in self.states or idx in self.spilled or idx in self.archived
+
+    def _add(self, parent, op, segment, state):
+        idx = len(self.nodes)
+        self.nodes.append(Node(parent, op, segment))
+        if parent is not None:
+            self.nodes[parent].children.append(idx)
+        self.path.append(idx)
+        self._keep(idx, state)
+
+    def _keep(self, idx, state):
+        node = self.nodes[idx]
+        if node.size == 0:
+            node.size = state_bytes(state)
+        self.states[idx] = state
+        self.total += node.size
+        self._evict()
+
+    def _evict(self):
+        # The initial and the current states always stay in memory.
+        protected = (self.path[0], self.path[-1])
+        for idx in list(self.states):
+            if self.total <= self.budget:
+                break
+            if idx in protected:
+                continue
+            state = self.states.pop(idx)
+            self.total -= self.nodes[idx].size
+            if self.spill:
+                if self.spill_dir is None:
+                    self.spill_dir = tempfile.mkdtemp(prefix='PO_GUI_')
+                file = os.path.join(self.spill_dir, str(idx) + '.pkl')
+                with open(file, 'wb') as fob:
+                    pickle.dump(state, fob, pickle.HIGHEST_PROTOCOL)
+                self.spilled[idx] = file
+    ####### Memory #######
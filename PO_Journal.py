@@ -0,0 +1,127 @@
+#  ------------------------------------------------------------------------
+#  File Name   : PO_Journal.py
+#  Description : Append-only journal of a PO_GUI session
+#                Each step is written as one JSON line when it is produced,
+#                so a session can be replayed after a crash.
+#  Developer   : Dr. Kosuke Ohgo
+#  ULR         : https://github.com/ohgo1977/PO_GUI_Python
+#
+#  MIT License, Copyright (c) 2023 Kosuke Ohgo. See LICENSE for details.
+#  ------------------------------------------------------------------------
+
+import json
+import os
+import time
+
+# Lines of a journal file:
+#   {"settings": {...}}                                  first line
+#   {"node": 3, "parent": 2, "op": ..., "segment": "...", "seconds": 0.12, "time": ...}
+#                                                        a new step, which becomes the current state
+#   {"current": 2, "time": ...}                          Undo, Redo, Clear, branch switch
+# Angles and phases are stored with sympy.srepr.
+
+def encode(v):
+    if isinstance(v, tuple):
+        return {'t': [encode(a) for a in v]}
+    if isinstance(v, list):
+        return {'l': [encode(a) for a in v]}
+    if isinstance(v, (str, int, float)) or v is None:
+        return v
+    import sympy
+    return {'e': sympy.srepr(v)}
+
+def decode(v):
+    if isinstance(v, dict):
+        if 't' in v:
+            return tuple(decode(a) for a in v['t'])
+        if 'l' in v:
+            return [decode(a) for a in v['l']]
+        import sympy
+        return sympy.sympify(v['e'])
+    return v
+
+class Journal(object):
+    # Lines are buffered and written with fsync every interval seconds
+    # (and on flush()/close()), so at most interval seconds of work are lost.
+    def __init__(self, file, settings, interval=2.0):
+        self.file = file
+        self.interval = interval
+        folder = os.path.dirname(file)
+        if len(folder) > 0 and not os.path.isdir(folder):
+            os.makedirs(folder)
+        self.fob = open(file, 'a', encoding='utf-8')
+        self.buffer = []
+        self.last_sync = time.time()
+        self.write({'settings': settings})
+        self.flush()
+
+    def write(self, record):
+        self.buffer.append(json.dumps(record) + '\n')
+        if time.time() - self.last_sync >= self.interval:
+            self.flush()
+
+    def node(self, idx, parent, op, segment, seconds=None):
+        self.write({'node': idx, 'parent': parent, 'op': encode(op), 'segment': segment,
+                    'seconds': seconds, 'time': time.time()})
+
+    def current(self, idx):
+        self.write({'current': idx, 'time': time.time()})
+
+    def start(self, history):
+        # Record an existing history (e.g. a replayed or opened session).
+        for idx, node in enumerate(history.nodes):
+            if idx > 0:
+                self.node(idx, node.parent, node.op, node.segment)
+        self.current(history.current())
+        self.flush()
+
+    def flush(self):
+        if len(self.buffer) > 0:
+            self.fob.write(''.join(self.buffer))
+            self.buffer = []
+            self.fob.flush()
+            os.fsync(self.fob.fileno())
+        self.last_sync = time.time()
+
+    def close(self):
+        if self.fob is not None:
+            self.flush()
+            self.fob.close()
+            self.fob = None
+
+def read_journal(file):
+    # Returns (settings, nodes, current). nodes: list of (parent, op, segment).
+    # A line cut off by a crash is ignored.
+    settings = None
+    nodes = []
+    current = 0
+    with open(file, encoding='utf-8') as fob:
+        for line in fob:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            if 'settings' in record:
+                if settings is None:
+                    settings = record['settings']
+            elif 'node' in record:
+                if record['node'] == len(nodes) + 1:
+                    nodes.append((record['parent'], decode(record['op']), record['segment']))
+                    current = record['node'] # A new step is the current state
+            elif 'current' in record:
+                current = record['current']
+    if settings is None:
+        raise ValueError('No settings in ' + file)
+    return settings, nodes, min(current, len(nodes))
+
+def replay(file, rho, budget=64*2**20, spill=True):
+    # History of a journal. rho: initial density operator of its settings.
+    # The steps are not evaluated here: history.missing() lists the states of
+    # the current path, which the caller computes (PO_GUI: on CalcEngine).
+    from PO_History import History
+    settings, nodes, current = read_journal(file)
+    history = History(rho, budget, spill)
+    for parent, op, segment in nodes:
+        history.attach(parent, op, segment)
+    history.switch(current, compute=False)
+    return history
@@ -0,0 +1,242 @@
+#  ------------------------------------------------------------------------
+#  File Name   : PO_Numeric.py
+#  Description : Numeric evaluation of rho over parameter grids
+#                Each coefficient is compiled once with lambdify and
+#                evaluated on NumPy arrays.
+#  Developer   : Dr. Kosuke Ohgo
+#  ULR         : https://github.com/ohgo1977/PO_GUI_Python
+#
+#  MIT License, Copyright (c) 2023 Kosuke Ohgo. See LICENSE for details.
+#  ------------------------------------------------------------------------
+
+import numpy as np
+import sympy
+
+from PO_Engine import term_items, term_label
+
+Chunk_points = 2**20 # Grid points evaluated at once
+Memory_limit = 512*2**20 # Bytes; larger results are written chunk by chunk to a .npy file
+
+def free_symbols(rho):
+    # Names of the symbols in the coefficients of rho, sorted.
+    names = set()
+    for axis, coef in term_items(rho):
+        names.update(str(v) for v in sympy.sympify(coef).free_symbols)
+    return sorted(names)
+
+class CompiledState(object):
+    # Coefficients of rho compiled to NumPy functions of params (symbol names).
+    def __init__(self, rho, params, spin_label=None):
+        if spin_label is None:
+            spin_label = getattr(rho, 'spin_label', None)
+        items = term_items(rho)
+        coefs = [sympy.sympify(coef) for axis, coef in items]
+        missing = set(str(v) for c in coefs for v in c.free_symbols) - set(params)
+        if len(missing) > 0:
+            raise ValueError('No values for ' + ', '.join(sorted(missing)))
+        symbols = [sympy.Symbol(name) for name in params]
+        self.params = list(params)
+        self.labels = [term_label(axis, spin_label) if spin_label is not None else str(axis) for axis, coef in items]
+        self.funcs = [sympy.lambdify(symbols, c, 'numpy') for c in coefs]
+        self.dtype = np.complex128 if any(c.has(sympy.I) for c in coefs) else np.float64
+
+    def __call__(self, values):
+        # values: list of arrays (one per param) of the same shape.
+        # Returns an array of shape (number of terms,) + shape.
+        shape = np.broadcast(*values).shape if len(values) > 0 else ()
+        out = np.empty((len(self.funcs),) + shape, dtype=self.dtype)
+        for ii, func in enumerate(self.funcs):
+            out[ii] = np.broadcast_to(func(*values), shape)
+        return out
+
+def sweep(rho, grid, spin_label=None):
+    # grid: dict of symbol name -> 1D array. Returns (labels, values) with
+    # values[term, i0, i1, ...] on the grid (axes in the order of grid).
+    state = CompiledState(rho, list(grid), spin_label)
+    mesh = np.meshgrid(*[np.asarray(v) for v in grid.values()], indexing='ij')
+    return state.labels, state(mesh)
+
+def sweep_chunks(state, axes, chunk_points=Chunk_points):
+    # Yields (start, stop, values) over the flattened grid.
+    # Without axes (rho has no symbols) the grid is one point.
+    if len(axes) == 0:
+        yield 0, 1, state([]).reshape(-1, 1)
+        return
+    shape = tuple(len(v) for v in axes)
+    total = int(np.prod(shape))
+    for start in range(0, total, chunk_points):
+        stop = min(start + chunk_points, total)
+        index = np.unravel_index(np.arange(start, stop), shape)
+        yield start, stop, state([np.asarray(v)[ii] for v, ii in zip(axes, index)])
+
+def sweep_to_file(rho, grid, file, spin_label=None, chunk_points=Chunk_points, memory_limit=Memory_limit):
+    # Write the sweep to file. Small results go to one .npz (values, labels,
+    # params and the grid axes). Results above memory_limit are written chunk
+    # by chunk to a .npy file, with the labels and axes in <file>_axes.npz.
+    # Returns the list of files written.
+    state = CompiledState(rho, list(grid), spin_label)
+    axes = [np.asarray(v) for v in grid.values()]
+    shape = tuple(len(v) for v in axes)
+    nbytes = len(state.funcs)*int(np.prod(shape))*np.dtype(state.dtype).itemsize
+    base = file[:-4] if file.endswith('.npz') or file.endswith('.npy') else file
+    meta = {'labels': np.array(state.labels), 'params': np.array(state.params)}
+    for name, v in zip(state.params, axes):
+        meta['axis_' + name] = v
+
+    if nbytes <= memory_limit and not file.endswith('.npy'):
+        values = np.empty((len(state.funcs),) + shape, dtype=state.dtype)
+        flat = values.reshape(len(state.funcs), -1)
+        for start, stop, chunk in sweep_chunks(state, axes, chunk_points):
+            flat[:, start:stop] = chunk
+        np.savez_compressed(base + '.npz', values=values, **meta)
+        return [base + '.npz']
+
+    values = np.lib.format.open_memmap(base + '.npy', mode='w+', dtype=state.dtype,
+                                       shape=(len(state.funcs),) + shape)
+    flat = values.reshape(len(state.funcs), -1)
+    for start, stop, chunk in sweep_chunks(state, axes, chunk_points):
+        flat[:, start:stop] = chunk
+    values.flush()
+    del values
+    np.savez(base + '_axes.npz', **meta)
+    return [base + '.npy', base + '_axes.npz']
+
+####### Acquisition #######
+# Free precession during acquisition, as in the GUI: the offset of spin I is
+# 'oI' (rad/s, CS angle oI*t) and the coupling of I and S is 'JIS' (Hz, JC
+# angle pi*JIS*t). The signal is Mx + iMy of the observed spins.
+def offset_name(SL):
+    return 'o' + SL
+
+def coupling_name(SL1, SL2):
+    return 'J' + SL1[-1] + SL2[-1]
+
+def acquisition_symbols(spin_label):
+    names = [offset_name(SL) for SL in spin_label]
+    for ii, SL1 in enumerate(spin_label):
+        for jj, SL2 in enumerate(spin_label):
+            if jj > ii:
+                names.append(coupling_name(SL1, SL2))
+    return names
+
+def observable_terms(rho, spin_label, observe):
+    # Terms of rho that give signal on the spins in observe:
+    # x or y on one observed spin and E or z on all the other spins.
+    # Returns a list of (index of the observed spin, axis, coef).
+    terms = []
+    for axis, coef in term_items(rho):
+        transverse = [kk for kk, code in enumerate(axis) if code in (1, 2)]
+        if len(transverse) != 1 or any(code > 3 for code in axis):
+            continue
+        kk = transverse[0]
+        if spin_label[kk] in observe:
+            terms.append((kk, axis, coef))
+    return terms
+
+def evolution_basis(terms, spin_label, values, t2, T2=None):
+    # Signal of each term (with coefficient 1) at the times t2.
+    # x: 1, y: i; exp(i*o*t) for the offset; cos(pi*J*t) for each coupled spin
+    # in E, and i*sin(pi*J*t) for each coupled spin in z (antiphase).
+    F = np.empty((len(terms), len(t2)), dtype=np.complex128)
+    for ii, (kk, axis, coef) in enumerate(terms):
+        SL = spin_label[kk]
+        f = (1.0 if axis[kk] == 1 else 1j)*np.exp(1j*values.get(offset_name(SL), 0.0)*t2)
+        for jj, code in enumerate(axis):
+            if jj == kk:
+                continue
+            pair = (SL, spin_label[jj]) if kk < jj else (spin_label[jj], SL)
+            J = values.get(coupling_name(*pair), 0.0)
+            f = f*(np.cos(np.pi*J*t2) if code == 0 else 1j*np.sin(np.pi*J*t2))
+        if T2 is not None and T2 > 0:
+            f = f*np.exp(-t2/T2)
+        F[ii] = f
+    return F
+
+def fid(rho, spin_label, observe, values, dwell, npoints, T2=None, t1=None, chunk_rows=256, out=None):
+    # FID of the observed spins without per-point SymPy substitution.
+    # values: numbers for all the symbols of rho and of the acquisition.
+    # t1 = (symbol name, 1D array) gives a 2D FID of shape (len(array), npoints),
+    # computed chunk_rows rows at a time into out (a new array or e.g. a memmap).
+    t2 = np.arange(npoints)*dwell
+    terms = observable_terms(rho, spin_label, observe)
+    if len(terms) == 0:
+        shape = (npoints,) if t1 is None else (len(t1[1]), npoints)
+        if out is None:
+            return t2, np.zeros(shape, dtype=np.complex128)
+        out[...] = 0
+        return t2, out
+    F = evolution_basis(terms, spin_label, values, t2, T2)
+    coefs = [sympy.sympify(coef) for kk, axis, coef in terms]
+    missing = set(str(v) for c in coefs for v in c.free_symbols) - set(values) - set(t1[:1] if t1 else [])
+    if len(missing) > 0:
+        raise ValueError('No values for ' + ', '.join(sorted(missing)))
+    if t1 is None:
+        C = np.array([complex(c.subs(values)) for c in coefs])
+        return t2, C @ F
+
+    name, axis1 = t1
+    fixed = dict((k, v) for k, v in values.items() if k != name)
+    symbol = sympy.Symbol(name)
+    funcs = [sympy.lambdify([symbol], c.subs(fixed), 'numpy') for c in coefs]
+    axis1 = np.asarray(axis1, dtype=float)
+    if out is None:
+        out = np.empty((len(axis1), npoints), dtype=np.complex128)
+    for start in range(0, len(axis1), chunk_rows):
+        rows = axis1[start:start+chunk_rows]
+        C = np.array([np.broadcast_to(f(rows), rows.shape) for f in funcs], dtype=np.complex128)
+        out[start:start+len(rows)] = C.T @ F
+    return t2, out
+
+def spectrum(signal, dwell):
+    # FFT along the last axis (and the first axis of a 2D FID), centered.
+    # Returns (frequency axis in Hz, spectrum).
+    freq = np.fft.fftshift(np.fft.fftfreq(signal.shape[-1], dwell))
+    spec = np.fft.fftshift(np.fft.fft(signal, axis=-1), axes=-1)
+    if signal.ndim == 2:
+        spec = np.fft.fftshift(np.fft.fft(spec, axis=0), axes=0)
+    return freq, spec
+
+def spectrum_to_file(signal, dwell, file, chunk_points=Chunk_points):
+    # spectrum() of a 2D FID (e.g. a memmap) into a .npy file, without holding
+    # either in memory: FFT of blocks of rows, then of blocks of columns.
+    # Returns the frequency axis in Hz.
+    n1, n2 = signal.shape
+    spec = np.lib.format.open_memmap(file, mode='w+', dtype=np.complex128, shape=signal.shape)
+    rows = max(1, chunk_points//n2)
+    for start in range(0, n1, rows):
+        spec[start:start+rows] = np.fft.fftshift(np.fft.fft(signal[start:start+rows], axis=-1), axes=-1)
+    cols = max(1, chunk_points//n1)
+    for start in range(0, n2, cols):
+        spec[:, start:start+cols] = np.fft.fftshift(np.fft.fft(spec[:, start:start+cols], axis=0), axes=0)
+    spec.flush()
+    del spec
+    return np.fft.fftshift(np.fft.fftfreq(n2, dwell))
+
+def acquire_to_file(rho, spin_label, observe, values, dwell, npoints, file, T2=None, t1=None,
+                    chunk_points=Chunk_points, memory_limit=Memory_limit):
+    # FID and spectrum in one .npz. A 2D FID and its spectrum above memory_limit
+    # are written chunk by chunk to <file>_fid.npy and <file>_spectrum.npy, with
+    # the axes in <file>_axes.npz, as in sweep_to_file. Returns the list of files written.
+    base = file[:-4] if file.endswith('.npz') or file.endswith('.npy') else file
+    meta = {'observe': np.array(list(observe))}
+    if t1 is not None:
+        meta['t1'] = np.asarray(t1[1])
+        meta['t1_symbol'] = np.array(t1[0])
+    nbytes = 2*len(t1[1])*npoints*np.dtype(np.complex128).itemsize if t1 is not None else 0
+
+    if nbytes <= memory_limit and not file.endswith('.npy'):
+        t2, signal = fid(rho, spin_label, observe, values, dwell, npoints, T2=T2, t1=t1)
+        freq, spec = spectrum(signal, dwell)
+        np.savez_compressed(base + '.npz', fid=signal, spectrum=spec, t2=t2, freq=freq, **meta)
+        return [base + '.npz']
+
+    signal = np.lib.format.open_memmap(base + '_fid.npy', mode='w+', dtype=np.complex128,
+                                       shape=(len(t1[1]), npoints))
+    rows = max(1, chunk_points//npoints)
+    t2, signal = fid(rho, spin_label, observe, values, dwell, npoints, T2=T2, t1=t1, chunk_rows=rows, out=signal)
+    signal.flush()
+    freq = spectrum_to_file(signal, dwell, base + '_spectrum.npy', chunk_points)
+    del signal
+    np.savez(base + '_axes.npz', t2=t2, freq=freq, **meta)
+    return [base + '_fid.npy', base + '_spectrum.npy', base + '_axes.npz']
+####### Acquisition #######
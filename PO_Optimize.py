@@ -0,0 +1,123 @@
+#  ------------------------------------------------------------------------
+#  File Name   : PO_Optimize.py
+#  Description : Optimization of recorded operation lists for PO_GUI
+#                Fuses commuting CS/JC steps and removes identity rotations.
+#  Developer   : Dr. Kosuke Ohgo
+#  ULR         : https://github.com/ohgo1977/PO_GUI_Python
+#
+#  Usage:
+#    python PO_Optimize.py INEPT.json
+#  prints the optimized steps and the time of the sequence with and without
+#  the optimization. PO_Batch.py --optimize runs optimized sequences.
+#
+#  MIT License, Copyright (c) 2023 Kosuke Ohgo. See LICENSE for details.
+#  ------------------------------------------------------------------------
+
+import argparse
+import collections
+import time
+
+import sympy
+
+# Chemical shift (Iz) and J-coupling (2IzSz) rotations commute with each
+# other, so a run of consecutive cs/jc operations (a free-evolution block)
+# is one rotation per spin and one per pair with the summed angles.
+Evolution_methods = ('cs', 'jc')
+
+def reduce_angle(q):
+    # q modulo 2*pi. In a symbolic angle only the numeric part is reduced,
+    # e.g. a + 5*pi/2 -> a + pi/2.
+    q = sympy.sympify(q)
+    number = sum((t for t in sympy.Add.make_args(q) if t.is_number), sympy.S.Zero)
+    n = sympy.nsimplify(number/(2*sympy.pi))
+    if n.is_Rational:
+        return q - number + 2*sympy.pi*(n - sympy.floor(n))
+    return q
+
+def is_identity(q):
+    # True for rotations by a multiple of 2*pi.
+    return reduce_angle(q) == 0
+
+def fuse_block(block):
+    # block: consecutive cs/jc operations. Returns at most one cs and one jc
+    # operation with the summed angle of each spin and pair, in the order of
+    # their first appearance. Rotations by a multiple of 2*pi are dropped.
+    angles = collections.OrderedDict() # (method, spin or pair) -> angle
+    for method, (sp_cell, q_cell) in block:
+        for sp, q in zip(sp_cell, q_cell):
+            angles[(method, sp)] = angles.get((method, sp), 0) + q
+    ops = []
+    for method in Evolution_methods:
+        items = [(sp, reduce_angle(q)) for (m, sp), q in angles.items() if m == method]
+        items = [(sp, q) for sp, q in items if not is_identity(q)]
+        if len(items) > 0:
+            ops.append((method, ([sp for sp, q in items], [q for sp, q in items])))
+    return ops
+
+def drop_identity_pulse(op):
+    # Pulse without the spins rotated by a multiple of 2*pi, or None.
+    method, (sp_cell, ph_cell, q_cell) = op
+    keep = [ii for ii, q in enumerate(q_cell) if not is_identity(q)]
+    if len(keep) == 0:
+        return None
+    if len(keep) == len(q_cell):
+        return op
+    return (method, ([sp_cell[ii] for ii in keep], [ph_cell[ii] for ii in keep], [q_cell[ii] for ii in keep]))
+
+def optimize_sequence(ops):
+    # Returns (optimized operations, number of operations saved).
+    # The result of the optimized list is the same state as that of ops.
+    out = []
+    block = []
+    for op in ops:
+        if op[0] in Evolution_methods:
+            block.append(op)
+            continue
+        if op[0] in ('pulse', 'pulse_phshift'):
+            op = drop_identity_pulse(op)
+            if op is None:
+                continue # The block goes on across a pulse that is dropped
+        out.extend(fuse_block(block))
+        block = []
+        if op[0] == 'simplify' and len(out) > 0 and out[-1] == op:
+            continue # Simplifying twice with the same method
+        out.append(op)
+    out.extend(fuse_block(block))
+    return out, len(ops) - len(out)
+
+def compare_sequence(seq):
+    # Run seq with and without the optimization.
+    # Returns a dict of the numbers of operations, the seconds of both runs,
+    # the gain (1 - optimized/original) and whether both results agree.
+    from PO_Batch import run_sequence
+    t0 = time.perf_counter()
+    text, timing, saved, rho = run_sequence(dict(seq, optimize=False), final_state=True)
+    t_orig = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    text, timing, saved, rho_opt = run_sequence(dict(seq, optimize=True), final_state=True)
+    t_opt = time.perf_counter() - t0
+    from PO_Engine import same_state
+    return {'operations': len(timing) + saved, 'optimized': len(timing), 'saved': saved,
+            'seconds': t_orig, 'optimized_seconds': t_opt,
+            'gain': 1 - t_opt/t_orig if t_orig > 0 else 0.0, 'same': same_state(rho, rho_opt)}
+
+def main():
+    from PO_Batch import build_operation, read_sequence
+    from PO_Engine import PO_namespace, op_label
+    parser = argparse.ArgumentParser(description='Optimize PO_GUI pulse-sequence files.')
+    parser.add_argument('files', nargs='+', help='Sequence files (.json)')
+    args = parser.parse_args()
+
+    for file in args.files:
+        seq = read_sequence(file)
+        table = PO_namespace(seq['spin_label'], seq['simp'])
+        ops, saved = optimize_sequence([build_operation(step, table) for step in seq['steps']])
+        print(file)
+        for op in ops:
+            print('  ' + op_label(op))
+        r = compare_sequence(seq)
+        print('  %d -> %d operations, %.3f s -> %.3f s (%.0f %% faster), same result: %s' %
+              (r['operations'], r['optimized'], r['seconds'], r['optimized_seconds'], 100*r['gain'], r['same']))
+
+if __name__ == '__main__':
+    main()
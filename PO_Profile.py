@@ -0,0 +1,128 @@
+#  ------------------------------------------------------------------------
+#  File Name   : PO_Profile.py
+#  Description : Per-operation profiling for PO_GUI
+#                Phase times, number of terms, expression size and memory
+#                of each operation, exported as CSV or JSON.
+#  Developer   : Dr. Kosuke Ohgo
+#  ULR         : https://github.com/ohgo1977/PO_GUI_Python
+#
+#  MIT License, Copyright (c) 2023 Kosuke Ohgo. See LICENSE for details.
+#  ------------------------------------------------------------------------
+
+import collections
+import csv
+import json
+import time
+
+from PO_Engine import Lazy_simp, apply_operation, segment_head, simplify_state, state_size, term_items
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+# Columns of a record:
+#   op        label of the operation
+#   parse     s to parse the angle/phase of the input
+#   queue     s waiting behind earlier operations
+#   compute   s in the worker (rotate + simp, or the simplification of a simplify step)
+#   rotate    s of the rotation with PO.simp off
+#   simp      s of PO.simp on the rotated coefficients
+#   wall      s from the submission to the result, as seen by the GUI
+#   display   s to render the log segment
+#   terms_in, terms_out       number of product-operator terms
+#   ops_in, ops_rotated, ops_out
+#             count_ops of all coefficients before the operation, after the
+#             rotation (before PO.simp) and after PO.simp
+#   mem_kb    growth of the peak memory (max RSS) of the worker in kB
+#   cache     'hit' when the result came from the result cache
+# rotate, simp and ops_rotated are empty when PO.simp does not simplify
+# (lazy simplification, the numeric backend) and for simplify steps.
+Profile_fields = ['op', 'parse', 'queue', 'compute', 'rotate', 'simp', 'wall', 'display',
+                  'terms_in', 'terms_out', 'ops_in', 'ops_rotated', 'ops_out', 'mem_kb', 'cache']
+
+Rotations = ('pulse', 'pulse_phshift', 'cs', 'jc')
+
+def max_rss():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def profile_operation(rho, op):
+    # apply_operation with measurements, in the worker.
+    # The record is handed back as result.profile (removed by CalcEngine).
+    # As in race mode, a rotation runs with PO.simp = Lazy_simp, and its
+    # coefficients are simplified afterwards with the method of PO.simp, so
+    # that the time of the rotation and the time of PO.simp are measured apart.
+    terms_in = len(term_items(rho))
+    ops_in = state_size(rho)
+    cls = type(rho)
+    simp = getattr(cls, 'simp', Lazy_simp)
+    record = {}
+    mem0 = max_rss()
+    if op[0] in Rotations and simp != Lazy_simp:
+        t0 = time.perf_counter()
+        cls.simp = Lazy_simp
+        try:
+            rotated = apply_operation(rho, op)
+        finally:
+            cls.simp = simp
+        record['rotate'] = time.perf_counter() - t0
+        record['ops_rotated'] = state_size(rotated)
+        t0 = time.perf_counter()
+        result = simplify_state(rotated, simp)
+        record['simp'] = time.perf_counter() - t0
+        result.logs = rho.logs + segment_head(rho, rotated, op) + str(result)
+        record['compute'] = record['rotate'] + record['simp']
+    else:
+        t0 = time.perf_counter()
+        result = apply_operation(rho, op)
+        record['compute'] = time.perf_counter() - t0
+    mem1 = max_rss()
+    record.update(terms_in=terms_in, terms_out=len(term_items(result)), ops_in=ops_in, ops_out=state_size(result),
+                  mem_kb=mem1 - mem0 if mem0 is not None else None)
+    result.profile = record
+    return result
+
+class Profiler(object):
+    # Records of the GUI. parse() is called before submit(); the records of
+    # the engine arrive in the same order, and display() completes the last one.
+    def __init__(self):
+        self.records = []
+        self.parse_times = collections.deque()
+
+    def parse(self, seconds):
+        self.parse_times.append(seconds)
+
+    def add(self, record):
+        record = dict(record)
+        record['parse'] = self.parse_times.popleft() if len(self.parse_times) > 0 else None
+        self.records.append(record)
+        return record
+
+    def display(self, seconds):
+        if len(self.records) > 0:
+            self.records[-1]['display'] = seconds
+
+    def add_display(self, label, seconds):
+        # Row of a display update without an operation, e.g. the redraw of the log.
+        self.records.append({'op': label, 'display': seconds})
+
+    def reset(self):
+        # Cancelled operations
+        self.parse_times.clear()
+
+    def clear(self):
+        self.records = []
+        self.parse_times.clear()
+
+    def to_csv(self, file):
+        with open(file, 'w', newline='') as fob:
+            writer = csv.DictWriter(fob, fieldnames=Profile_fields, extrasaction='ignore')
+            writer.writeheader()
+            for r in self.records:
+                writer.writerow(r)
+
+    def to_json(self, file):
+        with open(file, 'w') as fob:
+            json.dump([dict((k, r.get(k)) for k in Profile_fields) for r in self.records], fob, indent=1)
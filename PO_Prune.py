@@ -0,0 +1,159 @@
+#  ------------------------------------------------------------------------
+#  File Name   : PO_Prune.py
+#  Description : Observable-directed pruning of product-operator terms
+#                Drops the terms of rho that cannot become the observable
+#                within the remaining steps of a sequence.
+#  Developer   : Dr. Kosuke Ohgo
+#  ULR         : https://github.com/ohgo1977/PO_GUI_Python
+#
+#  MIT License, Copyright (c) 2023 Kosuke Ohgo. See LICENSE for details.
+#  ------------------------------------------------------------------------
+
+import sympy
+
+from PO_Engine import from_terms, same_coef, term_items
+
+# Each operation only exchanges the codes of rho.axis in a few ways
+# (0: E, 1: x, 2: y, 3: z):
+#   pulse on a spin, phase x/-x: y <-> z, phase y/-y: x <-> z, other phases: x, y, z
+#   cs on a spin: x <-> y
+#   jc on a pair: (x or y, E or z) <-> (y or x, z or E), i.e. in-phase <-> antiphase
+# E never changes (coherence order and parity of the other spins are kept).
+# A term of rho can contribute to the observable only if a chain of these
+# exchanges leads from it to the observable. The exchanges are symmetric, so
+# the set of such terms is found backwards from the observable.
+# Terms with p or m (codes 4, 5) are always kept.
+
+def parse_observable(targets, spin_label):
+    # ['Ix', 'Sy'] -> [(0, 1), (1, 2)]. A spin label alone ('I') means x and y.
+    out = []
+    for text in targets:
+        if text in spin_label:
+            out.extend([(spin_label.index(text), 1), (spin_label.index(text), 2)])
+        elif text[:-1] in spin_label and text[-1] in 'xyz':
+            out.append((spin_label.index(text[:-1]), 'xyz'.index(text[-1]) + 1))
+        else:
+            raise ValueError('Unknown observable: ' + text)
+    return out
+
+def _moves(q):
+    # Codes reachable by a rotation of angle q from a code that it mixes:
+    # 'none' (q = 0 mod pi), 'swap' (q = pi/2 mod pi) or 'both'.
+    q = sympy.sympify(q)
+    s = sympy.simplify(sympy.sin(q)) != 0
+    c = sympy.simplify(sympy.cos(q)) != 0
+    return 'both' if s and c else ('swap' if s else 'none')
+
+def _tilted(q):
+    # Same for a pulse about an axis at another phase: any angle but 0 (mod 2*pi) mixes x, y and z.
+    return 'none' if sympy.simplify(sympy.cos(sympy.sympify(q)) - 1) == 0 else 'both'
+
+def _step(op, spin_label, pair_label):
+    # Function axis -> set of axes connected to it by op.
+    method, args = op
+    if method in ('pulse', 'pulse_phshift', 'cs'):
+        if method == 'cs':
+            sp_cell, q_cell = args
+            groups = [(1, 2)]*len(sp_cell)
+        else:
+            sp_cell, ph_cell, q_cell = args
+            groups = []
+            for ph in ph_cell:
+                if ph in ('x', '-x'):
+                    groups.append((2, 3))
+                elif ph in ('y', '-y'):
+                    groups.append((1, 3))
+                else:
+                    groups.append((1, 2, 3))
+        rules = [(spin_label.index(sp), g, _moves(q) if len(g) == 2 else _tilted(q))
+                 for sp, g, q in zip(sp_cell, groups, q_cell)]
+
+        def connect(axis):
+            out = {axis}
+            for kk, g, move in rules:
+                new = set()
+                for a in out:
+                    if a[kk] not in g or move == 'none':
+                        new.add(a)
+                        continue
+                    for code in g:
+                        if code != a[kk] or move == 'both':
+                            new.add(a[:kk] + (code,) + a[kk+1:])
+                out = new
+            return out
+        return connect
+
+    if method == 'jc':
+        sp_cell, q_cell = args
+        rules = [(pair_label[sp], _moves(q)) for sp, q in zip(sp_cell, q_cell)]
+
+        def connect(axis):
+            out = {axis}
+            for (kk, ll), move in rules:
+                new = set()
+                for a in out:
+                    new.add(a)
+                    if move == 'none':
+                        continue
+                    for k, l in ((kk, ll), (ll, kk)):
+                        if a[k] in (1, 2) and a[l] in (0, 3):
+                            b = list(a)
+                            b[k] = 3 - a[k]
+                            b[l] = 3 - a[l]
+                            new.add(tuple(b))
+                            if move == 'swap':
+                                new.discard(a)
+                out = new
+            return out
+        return connect
+
+    if method == 'simplify':
+        return lambda axis: {axis}
+    return None # Unknown operation: nothing can be pruned
+
+class Pruner(object):
+    # Terms that can reach the observable: reach[i] for the state before ops[i],
+    # reach[len(ops)] for the final state.
+    def __init__(self, spin_label, observable, ops):
+        self.spin_label = list(spin_label)
+        n = len(spin_label)
+        pair_label = {}
+        for ii, SL1 in enumerate(spin_label):
+            for jj, SL2 in enumerate(spin_label):
+                if jj > ii:
+                    pair_label[SL1 + SL2] = (ii, jj)
+        final = set()
+        for kk, code in parse_observable(observable, self.spin_label):
+            final.add(tuple(code if ii == kk else 0 for ii in range(n)))
+        self.reach = [None]*(len(ops) + 1)
+        self.reach[-1] = final
+        for ii in range(len(ops) - 1, -1, -1):
+            connect = _step(ops[ii], self.spin_label, pair_label)
+            if connect is None or self.reach[ii+1] is None:
+                continue
+            self.reach[ii] = set().union(*[connect(a) for a in self.reach[ii+1]])
+        self.dropped = 0
+
+    def prune(self, rho, ii):
+        # rho without the terms that cannot reach the observable from step ii.
+        keep = self.reach[ii]
+        if keep is None:
+            return rho
+        items = term_items(rho)
+        kept = [(axis, coef) for axis, coef in items if axis in keep or any(code > 3 for code in axis)]
+        if len(kept) == len(items):
+            return rho
+        self.dropped += len(items) - len(kept)
+        result = from_terms(rho, kept)
+        result.logs = rho.logs
+        return result
+
+def same_observable(rho1, rho2, spin_label, observable):
+    # True if the observable terms of rho1 and rho2 agree.
+    keep = set()
+    n = len(spin_label)
+    for kk, code in parse_observable(observable, list(spin_label)):
+        keep.add(tuple(code if ii == kk else 0 for ii in range(n)))
+    d1 = dict(item for item in term_items(rho1) if item[0] in keep)
+    d2 = dict(item for item in term_items(rho2) if item[0] in keep)
+    return all(same_coef(d1.get(axis, 0), d2.get(axis, 0)) for axis in keep)
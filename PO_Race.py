@@ -0,0 +1,191 @@
+#  ------------------------------------------------------------------------
+#  File Name   : PO_Race.py
+#  Description : Adaptive simplification for PO_GUI
+#                Races simplify, TR8 and fu in separate processes under a
+#                time budget and keeps the first (or smallest) result.
+#  Developer   : Dr. Kosuke Ohgo
+#  ULR         : https://github.com/ohgo1977/PO_GUI_Python
+#
+#  MIT License, Copyright (c) 2023 Kosuke Ohgo. See LICENSE for details.
+#  ------------------------------------------------------------------------
+
+import collections
+import copy
+import time
+
+from PO_Engine import ProcessWorker, ThreadWorker, apply_operation, mp_context, run_job, simplify_state, state_size
+
+def _race_main(conn, rho, method):
+    try:
+        result = simplify_state(rho, method)
+        result.expr_size = state_size(result)
+        conn.send(('done', result))
+    except Exception as e:
+        conn.send(('error', repr(e)))
+
+class Racer(object):
+    # Settings and statistics of the race.
+    # pick: 'first' keeps the first finished method,
+    #       'smallest' waits up to budget and keeps the smallest result.
+    # After bias_after races, a method that won bias_share of them runs alone
+    # first; the others are started only if it does not finish within budget.
+    def __init__(self, methods=('simplify', 'TR8', 'fu'), budget=30.0, pick='first',
+                 bias_after=5, bias_share=0.8):
+        self.methods = list(methods)
+        self.budget = budget
+        self.pick = pick
+        self.bias_after = bias_after
+        self.bias_share = bias_share
+        self.wins = collections.Counter()
+        self.races = 0
+        self.timeouts = 0
+
+    def candidates(self):
+        # (methods started now, methods kept as fallback)
+        order = sorted(self.methods, key=lambda m: -self.wins[m])
+        if self.races >= self.bias_after and self.wins[order[0]] >= self.bias_share*self.races:
+            return order[:1], order[1:]
+        return order, []
+
+    def record(self, method):
+        self.races += 1
+        if method is None:
+            self.timeouts += 1
+        else:
+            self.wins[method] += 1
+
+    def stats(self):
+        return {'races': self.races, 'timeouts': self.timeouts, 'wins': dict(self.wins)}
+
+class Race(object):
+    # One race on the coefficients of rho. poll() never blocks.
+    def __init__(self, rho, racer):
+        self.rho = rho
+        self.racer = racer
+        self.ctx = mp_context()[0]
+        self.procs = {} # method -> (process, connection)
+        self.results = {} # method -> simplified rho
+        methods, self.fallback = racer.candidates()
+        self._start(methods)
+
+    def _start(self, methods):
+        self.t0 = time.time()
+        for method in methods:
+            conn, child_conn = self.ctx.Pipe()
+            proc = self.ctx.Process(target=_race_main, args=(child_conn, self.rho, method), daemon=True)
+            proc.start()
+            child_conn.close()
+            self.procs[method] = (proc, conn)
+
+    def poll(self):
+        # True when the race is over.
+        for method, (proc, conn) in list(self.procs.items()):
+            if conn.poll():
+                try:
+                    status, result = conn.recv()
+                except EOFError:
+                    status = 'error'
+                if status == 'done':
+                    self.results[method] = result
+                del self.procs[method]
+                proc.join(1)
+        if len(self.results) > 0 and (self.racer.pick == 'first' or len(self.procs) == 0):
+            return True
+        if time.time() - self.t0 > self.racer.budget or len(self.procs) == 0:
+            if len(self.fallback) > 0: # The favourite did not make it.
+                methods, self.fallback = self.fallback, []
+                self._start(methods)
+                return False
+            return True
+        return False
+
+    def result(self):
+        # Winner of the race. rho itself if no method finished within budget.
+        self.terminate()
+        if len(self.results) == 0:
+            self.racer.record(None)
+            result = copy.copy(self.rho)
+            result.logs = self.rho.logs + '\nSimplification: none (time budget exceeded)'
+            return result
+        winner = min(self.results, key=lambda m: self.results[m].expr_size)
+        self.racer.record(winner)
+        return self.results[winner]
+
+    def terminate(self):
+        # Kill the losers.
+        for proc, conn in self.procs.values():
+            proc.terminate()
+            proc.join(1)
+            conn.close()
+        self.procs = {}
+
+class SerialRaceWorker(ThreadWorker):
+    # Race mode without worker processes (Engine_process = False or no process
+    # could start): the operation and then the favourite method of the racer
+    # run on the worker thread.
+    def __init__(self, spin_label, simp, racer):
+        self.racer = racer
+        ThreadWorker.__init__(self, spin_label, simp)
+
+    def apply(self, rho, op):
+        if op[0] == 'simplify':
+            return run_job(rho, op)
+        result = apply_operation(rho, op)
+        method = self.racer.candidates()[0][0]
+        self.racer.record(method)
+        record = getattr(result, 'profile', None) # ('profile', (op,))
+        result = simplify_state(result, method)
+        result.expr_size = state_size(result)
+        if record is not None:
+            result.profile = record
+        return result
+
+def race_simplify(rho, racer):
+    # Blocking race, for scripts.
+    race = Race(rho, racer)
+    while not race.poll():
+        time.sleep(0.01)
+    return race.result()
+
+class RaceWorker(object):
+    # Worker for CalcEngine: the operation runs unsimplified on a ProcessWorker
+    # (PO.simp = Lazy_simp), then its coefficients go to a Race.
+    def __init__(self, spin_label, simp, racer):
+        self.racer = racer
+        self.inner = ProcessWorker(spin_label, simp)
+        self.race = None
+        self.error = None
+
+    def send(self, rho, op):
+        self.race = None
+        self.error = None
+        self.inner.send(rho, op)
+
+    def poll(self):
+        if self.race is None and self.error is None:
+            if not self.inner.poll():
+                return False
+            status, result = self.inner.recv()
+            if status != 'done':
+                self.error = result
+                return True
+            self.race = Race(result, self.racer)
+        return self.error is not None or self.race.poll()
+
+    def recv(self):
+        if self.error is not None:
+            return ('error', self.error)
+        result = self.race.result()
+        self.race = None
+        return ('done', result)
+
+    def terminate(self):
+        if self.race is not None:
+            self.race.terminate()
+            self.race = None
+        self.inner.terminate()
+
+    def close(self):
+        if self.race is not None:
+            self.race.terminate()
+        self.inner.close()
@@ -0,0 +1,390 @@
+#  ------------------------------------------------------------------------
+#  File Name   : PO_Server.py
+#  Description : Local compute service for PO_GUI
+#                Runs the operations of several GUI clients on one worker
+#                pool with a shared result cache (PO_Cache.py).
+#  Developer   : Dr. Kosuke Ohgo
+#  ULR         : https://github.com/ohgo1977/PO_GUI_Python
+#
+#  Usage:
+#    python PO_Server.py                        Unix socket ~/.PO_GUI/server.sock
+#    python PO_Server.py -a 127.0.0.1:5791 -n 8 localhost TCP, 8 processes
+#    python PO_Server.py --stats                statistics of a running server
+#  In PO_GUI.py, set Server_switch = 1 (and Server_address for TCP).
+#  Clients authenticate with the key in Server_key_file, which the server
+#  creates (readable by its user only) if it does not exist.
+#
+#  MIT License, Copyright (c) 2023 Kosuke Ohgo. See LICENSE for details.
+#  ------------------------------------------------------------------------
+
+import argparse
+import copy
+import multiprocessing
+import os
+import queue
+import secrets
+import socket
+import threading
+from multiprocessing.connection import Client, Listener, wait
+
+from PO_Cache import ResultCache, cache_key
+from PO_Engine import ProcessWorker, ThreadWorker, init_PO, mp_context, run_job
+
+Server_dir = os.path.join(os.path.expanduser('~'), '.PO_GUI')
+Server_key_file = os.path.join(Server_dir, 'server.key')
+Server_cache_file = os.path.join(Server_dir, 'server_cache.sqlite')
+
+# Messages (pickled, over multiprocessing.connection):
+#   client -> server  ('run', spin_label, simp, rho, op)
+#                     ('stats',)
+#   server -> client  ('done', result), ('error', text) or ('stats', dict)
+# One connection runs one job at a time, as CalcEngine does.
+
+def default_address():
+    if hasattr(socket, 'AF_UNIX'):
+        return os.path.join(Server_dir, 'server.sock')
+    return '127.0.0.1:5791'
+
+def parse_address(address):
+    # 'host:port' -> (host, port) for TCP, other texts are Unix socket paths.
+    if address is None:
+        address = default_address()
+    host, sep, port = address.rpartition(':')
+    if sep and port.isdigit() and '/' not in address:
+        return (host, int(port))
+    return address
+
+def read_key(file=None, create=False):
+    file = file or Server_key_file
+    if create and not os.path.exists(file):
+        folder = os.path.dirname(file)
+        if len(folder) > 0 and not os.path.isdir(folder):
+            os.makedirs(folder)
+        fd = os.open(file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'w') as fob:
+            fob.write(secrets.token_hex(32))
+    with open(file) as fob:
+        return fob.read().strip().encode('ascii')
+
+####### Server #######
+class Job(object):
+    # One evaluation on the pool and the clients waiting for it.
+    # Identical requests (same cache key) share the job.
+    def __init__(self, key, rho, op, spin_label, simp, async_result):
+        self.key = key # None: not cached or shared
+        self.rho = rho
+        self.op = op
+        self.spin_label = spin_label
+        self.simp = simp
+        self.async_result = async_result
+        self.waiters = [] # (conn, rho)
+
+class Sender(object):
+    # Replies to one client, sent on a thread of their own. A client that
+    # does not read (or a large state on a full socket buffer) blocks only
+    # this thread, not the serving loop and the other clients.
+    def __init__(self, conn, failed):
+        self.conn = conn
+        self.failed = failed # Called with conn when a send fails
+        self.messages = queue.Queue()
+        self.thread = threading.Thread(target=self._main, daemon=True)
+        self.thread.start()
+
+    def _main(self):
+        ok = True
+        while True:
+            message = self.messages.get()
+            if message is None:
+                break
+            if not ok: # Dropped by the serving loop soon
+                continue
+            try:
+                self.conn.send(message)
+            except (OSError, ValueError):
+                ok = False
+                self.failed(self.conn)
+        self.conn.close()
+
+    def send(self, message):
+        self.messages.put(message)
+
+    def close(self):
+        # The connection is closed after the queued replies (on the sender thread).
+        self.messages.put(None)
+
+class ComputeServer(object):
+    # All requests, the cache and the jobs are handled on one thread;
+    # the accept thread only hands new connections over, and the replies
+    # go out on a Sender thread per connection.
+    def __init__(self, address=None, processes=None, key_file=None, cache_file=None,
+                 mem_entries=256, disk_bytes=1024*2**20):
+        self.address = parse_address(address)
+        if isinstance(self.address, str):
+            folder = os.path.dirname(self.address)
+            if len(folder) > 0 and not os.path.isdir(folder):
+                os.makedirs(folder)
+            if os.path.exists(self.address):
+                os.remove(self.address) # Socket of a server that did not exit cleanly
+        self.listener = Listener(self.address, authkey=read_key(key_file, create=True))
+        self.processes = processes
+        self.cache_file = cache_file or Server_cache_file
+        self.mem_entries = mem_entries
+        self.disk_bytes = disk_bytes
+        self.caches = {} # simp -> ResultCache
+        self.pools = {} # (spin_label, simp, PO.create() needed) -> Pool
+        self.clients = []
+        self.new_clients = []
+        self.senders = {} # conn -> Sender
+        self.failed = [] # Connections whose send failed
+        self.lock = threading.Lock()
+        self.wake_r, self.wake_w = multiprocessing.Pipe(duplex=False)
+        self.jobs = {} # key -> Job
+        self.running = True
+        self.counts = {'requests': 0, 'computed': 0, 'shared': 0, 'errors': 0}
+
+    def _accept(self):
+        while self.running:
+            try:
+                conn = self.listener.accept()
+            except Exception: # Authentication failures and a closed listener
+                if not self.running:
+                    break
+                continue
+            with self.lock:
+                self.new_clients.append(conn)
+                self.wake_w.send(None)
+
+    def _failed(self, conn):
+        # On a Sender thread
+        with self.lock:
+            self.failed.append(conn)
+            self.wake_w.send(None)
+
+    def pool(self, spin_label, simp, rho):
+        # PO objects need PO.create() in the pool processes. Other states
+        # (PO_Sparse.SparsePO) carry their spin labels; their pools do not import PO.
+        init = type(rho).__module__ == 'PO'
+        key = (tuple(spin_label), simp, init)
+        if key not in self.pools:
+            ctx = mp_context()[0]
+            if init:
+                self.pools[key] = ctx.Pool(self.processes, initializer=init_PO, initargs=(list(spin_label), simp))
+            else:
+                self.pools[key] = ctx.Pool(self.processes)
+        return self.pools[key]
+
+    def cache(self, simp):
+        if simp not in self.caches:
+            self.caches[simp] = ResultCache(self.cache_file, simp, self.mem_entries, self.disk_bytes)
+        return self.caches[simp]
+
+    def serve_forever(self):
+        print('PO_Server: listening on ' + str(self.address))
+        threading.Thread(target=self._accept, daemon=True).start()
+        try:
+            while self.running:
+                for conn in wait(self.clients + [self.wake_r], timeout=0.05):
+                    if conn is self.wake_r:
+                        self.wake_r.recv()
+                        with self.lock:
+                            new_clients, self.new_clients = self.new_clients, []
+                            failed, self.failed = self.failed, []
+                        for client in new_clients:
+                            self.clients.append(client)
+                            self.senders[client] = Sender(client, self._failed)
+                        for client in failed:
+                            self._drop(client)
+                        continue
+                    try:
+                        message = conn.recv()
+                    except (EOFError, OSError):
+                        self._drop(conn)
+                        continue
+                    self._handle(conn, message)
+                self._finish_jobs()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+    def _handle(self, conn, message):
+        if message[0] == 'stats':
+            self._send(conn, ('stats', self.stats()))
+            return
+        if message[0] != 'run':
+            self._send(conn, ('error', 'Unknown request: ' + str(message[0])))
+            return
+        method, spin_label, simp, rho, op = message
+        self.counts['requests'] += 1
+        key = None
+        if op[0] != 'profile': # The measurements of a profile run are not cached or shared
+            result = self.cache(simp).get(rho, op, spin_label)
+            if result is not None:
+                self._send(conn, ('done', result))
+                return
+            try:
+                key = cache_key(rho, op, simp, spin_label)
+            except (AttributeError, TypeError):
+                pass
+        if key is None or key not in self.jobs:
+            job = Job(key, rho, op, spin_label, simp, self.pool(spin_label, simp, rho).apply_async(run_job, (rho, op)))
+            self.jobs[key if key is not None else id(job)] = job
+            self.counts['computed'] += 1
+        else:
+            job = self.jobs[key]
+            self.counts['shared'] += 1
+        job.waiters.append((conn, rho))
+
+    def _finish_jobs(self):
+        for key, job in list(self.jobs.items()):
+            if not job.async_result.ready():
+                continue
+            del self.jobs[key]
+            try:
+                result = job.async_result.get()
+            except Exception as e:
+                self.counts['errors'] += 1
+                for conn, rho in job.waiters:
+                    self._send(conn, ('error', repr(e)))
+                continue
+            if job.key is not None:
+                self.cache(job.simp).put(job.rho, job.op, result, job.spin_label)
+            segment = result.logs[len(job.rho.logs):]
+            for conn, rho in job.waiters:
+                if rho is not job.rho: # Same terms, other logs
+                    shared = copy.copy(result)
+                    shared.logs = rho.logs + segment
+                    self._send(conn, ('done', shared))
+                else:
+                    self._send(conn, ('done', result))
+
+    def _send(self, conn, message):
+        # Does not wait; a failed send (the client cancelled or exited) drops conn.
+        if conn in self.senders:
+            self.senders[conn].send(message)
+
+    def _drop(self, conn):
+        # A job of a dropped client still runs, and its result is cached.
+        if conn not in self.senders:
+            return
+        self.clients.remove(conn)
+        for job in self.jobs.values():
+            job.waiters = [(c, rho) for c, rho in job.waiters if c is not conn]
+        self.senders.pop(conn).close()
+
+    def stats(self):
+        stats = dict(self.counts, clients=len(self.clients), running=len(self.jobs), pools=len(self.pools))
+        stats['cache'] = dict((simp, cache.stats()) for simp, cache in self.caches.items())
+        return stats
+
+    def close(self):
+        self.running = False
+        self.listener.close()
+        for sender in self.senders.values():
+            sender.close()
+        for pool in self.pools.values():
+            pool.terminate()
+        for cache in self.caches.values():
+            cache.close()
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.remove(self.address)
+        print('PO_Server: ' + str(self.counts))
+####### Server #######
+
+####### Client #######
+def connect(address=None, key_file=None):
+    address = parse_address(address)
+    if isinstance(address, str) and not os.path.exists(address):
+        raise ConnectionRefusedError('No server at ' + address)
+    return Client(address, authkey=read_key(key_file))
+
+class ServerWorker(object):
+    # Worker for CalcEngine that sends the jobs to PO_Server. If the server
+    # goes away, the running job and the later ones run in-process.
+    def __init__(self, spin_label, simp, address=None, key_file=None, use_process=True):
+        self.spin_label = spin_label
+        self.simp = simp
+        self.use_process = use_process
+        self.conn = connect(address, key_file)
+        self.local = None
+        self.job = None
+        self.reply = None
+
+    def send(self, rho, op):
+        self.job = (rho, op)
+        self.reply = None
+        if self.local is not None:
+            self.local.send(rho, op)
+            return
+        try:
+            self.conn.send(('run', self.spin_label, self.simp, rho, op))
+        except (OSError, ValueError):
+            self._fallback()
+
+    def poll(self):
+        if self.local is not None:
+            return self.reply is not None or self.local.poll()
+        try:
+            if not self.conn.poll():
+                return False
+            self.reply = self.conn.recv()
+            return True
+        except (EOFError, OSError):
+            self._fallback()
+            return False
+
+    def recv(self):
+        if self.reply is not None:
+            reply, self.reply = self.reply, None
+            return reply
+        return self.local.recv()
+
+    def _fallback(self):
+        print('PO_Server: connection lost, evaluating in-process.')
+        self.conn.close()
+        try:
+            self.local = ProcessWorker(self.spin_label, self.simp) if self.use_process else None
+        except (OSError, ValueError):
+            self.local = None
+        if self.local is None:
+            self.local = ThreadWorker(self.spin_label, self.simp)
+        if self.job is not None:
+            self.local.send(*self.job)
+
+    def terminate(self):
+        # The server finishes (and caches) the job; its reply is discarded.
+        if self.local is not None:
+            self.local.terminate()
+        self.conn.close()
+
+    def close(self):
+        if self.local is not None:
+            self.local.close()
+        self.conn.close()
+
+def server_stats(address=None, key_file=None):
+    conn = connect(address, key_file)
+    try:
+        conn.send(('stats',))
+        return conn.recv()[1]
+    finally:
+        conn.close()
+####### Client #######
+
+def main():
+    parser = argparse.ArgumentParser(description='Local compute service for PO_GUI.')
+    parser.add_argument('-a', '--address', default=None,
+                        help='Unix socket path or host:port (default: ' + default_address() + ')')
+    parser.add_argument('-n', '--processes', type=int, default=None, help='Processes per spin system (default: CPU count)')
+    parser.add_argument('--key-file', default=None, help='Authentication key (default: ' + Server_key_file + ')')
+    parser.add_argument('--cache', default=None, help='Cache file (default: ' + Server_cache_file + ')')
+    parser.add_argument('--stats', action='store_true', help='Show the statistics of a running server')
+    args = parser.parse_args()
+    if args.stats:
+        print(server_stats(args.address, args.key_file))
+        return
+    ComputeServer(args.address, args.processes, args.key_file, args.cache).serve_forever()
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    main()
@@ -0,0 +1,243 @@
+#  ------------------------------------------------------------------------
+#  File Name   : PO_Sparse.py
+#  Description : Sparse numeric backend for PO_GUI
+#                rho is a sparse vector over the product-operator basis with
+#                numeric coefficients; pulse, CS and JC are vectorized NumPy
+#                rotations. For large spin systems (8-10 spins).
+#  Developer   : Dr. Kosuke Ohgo
+#  ULR         : https://github.com/ohgo1977/PO_GUI_Python
+#
+#  MIT License, Copyright (c) 2023 Kosuke Ohgo. See LICENSE for details.
+#  ------------------------------------------------------------------------
+
+import numpy as np
+
+from PO_Engine import SymbolTable, op_label, term_label
+
+# A term is stored as an integer key: code of spin k (0: E, 1: x, 2: y, 3: z)
+# times 4**k. The basis operators are normalized as in product-operator
+# notation, e.g. Ix, 2IxSz, 4IxSzKz, so the JC rotation of Ix by q gives
+# cos(q)*Ix + sin(q)*2IySz.
+Tolerance = 1e-12 # Smaller coefficients are dropped
+Print_terms = 200 # Terms shown in the logs (the largest ones)
+Dense_max = 4**11 # Basis operators summed without sorting (11 spins, 32 MB)
+Functions = ('sin', 'cos', 'sqrt', 'exp') # Functions in rho, angles and values
+
+def to_float(q):
+    # Numeric value of an angle or a phase.
+    try:
+        return float(q)
+    except TypeError:
+        import sympy
+        names = ', '.join(sorted(str(v) for v in sympy.sympify(q).free_symbols))
+        raise ValueError('The numeric backend needs values for ' + names)
+
+def norm(k):
+    # 2**(k-1) for a product of k operators
+    return 2.0**(k - 1) if k > 0 else 1.0
+
+class SparsePO(object):
+    # Stand-in for a PO object: axis, coef, logs, pulse, pulse_phshift, cs, jc.
+    def __init__(self, spin_label, keys, coef, logs=''):
+        self.spin_label = list(spin_label)
+        self.keys = np.asarray(keys, dtype=np.int64)
+        self.coef_array = np.asarray(coef, dtype=np.float64)
+        self.logs = logs
+        self._axis = None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_axis'] = None
+        return state
+
+    ####### Terms #######
+    @property
+    def axis(self):
+        # Codes of the terms, one row per term (as rho.axis of PO)
+        if self._axis is None:
+            n = len(self.spin_label)
+            self._axis = (self.keys[:, None] // (4**np.arange(n, dtype=np.int64))) % 4
+        return self._axis
+
+    @property
+    def coef(self):
+        return self.coef_array
+
+    def from_terms(self, items):
+        # Used by PO_Engine.from_terms
+        keys = [sum(int(code)*4**k for k, code in enumerate(axis)) for axis, c in items]
+        return SparsePO(self.spin_label, keys, [float(c) for axis, c in items], self.logs)
+
+    def _combine(self, keys, coef):
+        # Sum duplicate terms and drop zeros. Up to Dense_max basis operators
+        # (11 spins) the sum is a bincount over all of them, otherwise a sort.
+        size = 4**len(self.spin_label)
+        if size <= Dense_max:
+            coef = np.bincount(keys, weights=coef, minlength=size)
+            keys = np.flatnonzero(np.abs(coef) > Tolerance)
+            return SparsePO(self.spin_label, keys, coef[keys])
+        keys, inverse = np.unique(keys, return_inverse=True)
+        coef = np.bincount(inverse.ravel(), weights=coef, minlength=len(keys))
+        keep = np.abs(coef) > Tolerance
+        return SparsePO(self.spin_label, keys[keep], coef[keep])
+
+    def _new(self, keys, coef, label):
+        result = self._combine(keys, coef)
+        result.logs = self.logs + '\n' + label + '\n' + str(result)
+        return result
+    ####### Terms #######
+
+    ####### Rotations #######
+    def _rotate(self, keys, coef, k, a, b, q):
+        # Rotation of spin k: A -> A cos(q) + B sin(q), B -> B cos(q) - A sin(q).
+        c, s = np.cos(q), np.sin(q)
+        d = (keys // 4**k) % 4
+        in_a = d == a
+        in_b = d == b
+        step = (b - a)*4**k
+        new_keys = np.concatenate([keys, keys[in_a] + step, keys[in_b] - step])
+        new_coef = np.concatenate([np.where(in_a | in_b, coef*c, coef), coef[in_a]*s, -coef[in_b]*s])
+        return new_keys, new_coef
+
+    def _pulse(self, sp_cell, phases, q_cell, label):
+        keys, coef = self.keys, self.coef_array
+        for sp, ph, q in zip(sp_cell, phases, q_cell):
+            k = self.spin_label.index(sp)
+            q = to_float(q)
+            # Rz(ph) Rx(q) Rz(-ph); the quadrature phases are direct rotations.
+            if ph in ('x', '-x'):
+                keys, coef = self._rotate(keys, coef, k, 2, 3, q if ph == 'x' else -q)
+            elif ph in ('y', '-y'):
+                keys, coef = self._rotate(keys, coef, k, 3, 1, q if ph == 'y' else -q)
+            else:
+                ph = to_float(ph)
+                keys, coef = self._rotate(keys, coef, k, 1, 2, -ph)
+                keys, coef = self._rotate(keys, coef, k, 2, 3, q)
+                keys, coef = self._rotate(keys, coef, k, 1, 2, ph)
+        return self._new(keys, coef, label)
+
+    def pulse(self, sp_cell, ph_cell, q_cell):
+        return self._pulse(sp_cell, ph_cell, q_cell, op_label(('pulse', (sp_cell, ph_cell, q_cell))))
+
+    def pulse_phshift(self, sp_cell, ph_cell, q_cell):
+        return self._pulse(sp_cell, [to_float(ph) for ph in ph_cell], q_cell,
+                           op_label(('pulse_phshift', (sp_cell, ph_cell, q_cell))))
+
+    def cs(self, sp_cell, q_cell):
+        keys, coef = self.keys, self.coef_array
+        for sp, q in zip(sp_cell, q_cell):
+            keys, coef = self._rotate(keys, coef, self.spin_label.index(sp), 1, 2, to_float(q))
+        return self._new(keys, coef, op_label(('cs', (sp_cell, q_cell))))
+
+    def jc(self, sp_cell, q_cell):
+        # sp_cell: pairs as in JC_pair, e.g. 'IS'
+        keys, coef = self.keys, self.coef_array
+        for pair, q in zip(sp_cell, q_cell):
+            k, l = _pair_index(pair, self.spin_label)
+            c, s = np.cos(to_float(q)), np.sin(to_float(q))
+            new_keys = [keys]
+            new_coef = []
+            mixed = np.zeros(len(keys), dtype=bool)
+            for kk, ll in ((k, l), (l, k)):
+                dk = (keys // 4**kk) % 4
+                dl = (keys // 4**ll) % 4
+                m = ((dk == 1) | (dk == 2)) & ((dl == 0) | (dl == 3))
+                mixed |= m
+                # x -> y and y -> x on kk, E -> z and z -> E on ll; Ix -> +2IySz, Iy -> -2IxSz
+                step = np.where(dk[m] == 1, 1, -1)*4**kk + np.where(dl[m] == 0, 3, -3)*4**ll
+                new_keys.append(keys[m] + step)
+                new_coef.append(coef[m]*s*np.where(dk[m] == 1, 1.0, -1.0))
+            keys = np.concatenate(new_keys)
+            coef = np.concatenate([np.where(mixed, coef*c, coef)] + new_coef)
+        return self._new(keys, coef, op_label(('jc', (sp_cell, q_cell))))
+    ####### Rotations #######
+
+    ####### Arithmetic (initial density operator) #######
+    def __add__(self, other):
+        if not isinstance(other, SparsePO):
+            return NotImplemented
+        return SparsePO(self.spin_label, np.concatenate([self.keys, other.keys]),
+                        np.concatenate([self.coef_array, other.coef_array]))._sum()
+
+    def __sub__(self, other):
+        return self + (-1)*other
+
+    def __neg__(self):
+        return (-1)*self
+
+    def __mul__(self, other):
+        if isinstance(other, SparsePO):
+            # Product of operators on different spins, e.g. Ix*Sz = 2IxSz/2
+            keys, coef = [], []
+            for k1, c1 in zip(self.keys, self.coef_array):
+                for k2, c2 in zip(other.keys, other.coef_array):
+                    a1 = _digits(k1, len(self.spin_label))
+                    a2 = _digits(k2, len(self.spin_label))
+                    if any(x > 0 and y > 0 for x, y in zip(a1, a2)):
+                        raise ValueError('Products on the same spin are not supported')
+                    n1, n2 = sum(x > 0 for x in a1), sum(x > 0 for x in a2)
+                    keys.append(k1 + k2)
+                    coef.append(c1*c2*norm(n1)*norm(n2)/norm(n1 + n2))
+            return SparsePO(self.spin_label, keys, coef)._sum()
+        return SparsePO(self.spin_label, self.keys, self.coef_array*to_float(other))._sum()
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        return self*(1/to_float(other))
+
+    def _sum(self):
+        result = self._combine(self.keys, self.coef_array)
+        result.logs = str(result)
+        return result
+    ####### Arithmetic (initial density operator) #######
+
+    def __str__(self):
+        if len(self.keys) == 0:
+            return '0'
+        order = np.argsort(-np.abs(self.coef_array), kind='stable')[:Print_terms]
+        text = []
+        for ii in order:
+            axis = _digits(self.keys[ii], len(self.spin_label))
+            k = sum(code > 0 for code in axis)
+            prefix = str(int(norm(k))) if k > 1 else ''
+            text.append('%.6g*%s%s' % (self.coef_array[ii], prefix, term_label(axis, self.spin_label)))
+        more = len(self.keys) - len(order)
+        return ' + '.join(text).replace('+ -', '- ') + (' + ... (%d more terms)' % more if more > 0 else '')
+
+def _digits(key, n):
+    return tuple((int(key) // 4**k) % 4 for k in range(n))
+
+def _pair_index(pair, spin_label):
+    for ii, SL1 in enumerate(spin_label):
+        for jj, SL2 in enumerate(spin_label):
+            if jj > ii and SL1 + SL2 == pair:
+                return ii, jj
+    raise ValueError('Unknown spin pair: ' + pair)
+
+def parse_values(text):
+    # 'oI=100, JIS=140, t=1e-3' -> {'oI': 100.0, 'JIS': 140.0, 't': 0.001}
+    table = SymbolTable([('pi', np.pi)] + [(f, getattr(np, f)) for f in Functions])
+    values = {}
+    for item in text.replace(';', ',').split(','):
+        if '=' in item:
+            name, v = item.split('=', 1)
+            values[name.strip()] = to_float(table.parse(v.strip()))
+    return values
+
+def sparse_namespace(spin_label, values=None):
+    # SymbolTable with pi, sin, cos, sqrt, exp, the operators Ix, Iy, Iz, ...
+    # and the numeric values of the symbols, like PO_namespace() for the
+    # numeric backend.
+    import sympy
+    table = SymbolTable()
+    table['pi'] = sympy.pi
+    for name in Functions:
+        table[name] = getattr(sympy, name)
+    for k, SL in enumerate(spin_label):
+        for code, name in ((1, 'x'), (2, 'y'), (3, 'z')):
+            op = SparsePO(spin_label, [code*4**k], [1.0])
+            op.logs = SL + name
+            table[SL + name] = op
+    table.update(values or {})
+    return table
@@ -0,0 +1,52 @@
+#  Run with: python -m pytest tests
+
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PO_Batch import map_processes, run_files
+from PO_Race import Racer, race_simplify
+
+class Term(object):
+    # One product-operator term with the interface of simplify_state (axis, coef, logs).
+    def __init__(self, coef, logs=''):
+        self.axis = [[1]]
+        self.coef = [coef]
+        self.logs = logs
+
+    def __str__(self):
+        return str(self.coef[0]) + '*Ix'
+
+def test_map_processes_allows_a_race():
+    # A race starts one process per method, which a daemonic Pool worker cannot do.
+    import sympy
+    x = sympy.Symbol('x')
+    rho = Term(sympy.sin(x)**2 + sympy.cos(x)**2, 'Ix')
+    results = map_processes(race_simplify, [(rho, Racer(['simplify', 'TR8'])) for ii in range(2)], processes=2)
+    for result in results:
+        assert result.coef[0] == 1
+        assert '\nSimplification: ' in result.logs
+
+def test_map_processes_reports_errors():
+    with pytest.raises(RuntimeError):
+        map_processes(int, [('x',)])
+
+def test_run_files_race(tmp_path):
+    pytest.importorskip('PO')
+    files = []
+    for ii, angle in enumerate(['pi/2', 'pi/4']):
+        file = str(tmp_path / ('seq' + str(ii) + '.json'))
+        with open(file, 'w') as fob:
+            json.dump({'spin_label': ['I', 'S'], 'rho': 'Iz', 'simp': 'race',
+                       'steps': [{'pulse': 'I', 'phase': 'x', 'angle': angle},
+                                 {'jc': 'IS', 'angle': 'pi*JIS*t'}]}, fob)
+        files.append(file)
+    results = run_files(files, processes=2)
+    for r in results:
+        assert r['error'] == ''
+        with open(r['output']) as fob:
+            assert 'Simplification: race' in fob.read()
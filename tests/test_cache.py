@@ -0,0 +1,28 @@
+#  Run with: python -m pytest tests
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PO_Cache import ResultCache, cache_key
+
+class Term(object):
+    # Iz of the first spin; PO objects do not carry their spin labels either.
+    def __init__(self, logs=''):
+        self.axis = [[3, 0]]
+        self.coef = [1]
+        self.logs = logs
+
+def test_spin_systems_have_different_keys():
+    op = ('cs', (['I'], [1]))
+    assert cache_key(Term(), op, 'simplify', ['I', 'S']) != cache_key(Term(), op, 'simplify', ['I', 'K'])
+    assert cache_key(Term(), op, 'simplify', ['I', 'S']) == cache_key(Term('Iz'), op, 'simplify', ['I', 'S'])
+
+def test_no_hit_across_spin_systems(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache.sqlite'), 'simplify')
+    op = ('cs', (['I'], [1]))
+    cache.put(Term('Iz'), op, Term('Iz\ncs(1)'), ['I', 'S'])
+    assert cache.get(Term(), op, ['I', 'K']) is None
+    assert cache.get(Term(), op, ['I', 'S']).logs == '\ncs(1)'
+    cache.close()
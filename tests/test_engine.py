@@ -0,0 +1,93 @@
+#  Run with: python -m pytest tests
+
+import os
+import sys
+import time
+
+import sympy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PO_Engine import CalcEngine, PoolWorker, _merge_result, apply_operation, split_terms
+
+class Vec(object):
+    # a*Ix + b*Iy of one spin. cs rotates Ix -> Ix cos(q) + Iy sin(q), as PO does,
+    # and is linear, so the terms can be rotated apart and summed.
+    def __init__(self, terms, logs=''):
+        self.axis = [[code] for code, c in terms]
+        self.coef = [c for code, c in terms]
+        self.logs = logs
+
+    def cs(self, sp_cell, q_cell):
+        q = q_cell[0]
+        acc = {}
+        for (code,), c in zip(self.axis, self.coef):
+            if code == 1:
+                acc[1] = acc.get(1, 0) + c*sympy.cos(q)
+                acc[2] = acc.get(2, 0) + c*sympy.sin(q)
+            else:
+                acc[2] = acc.get(2, 0) + c*sympy.cos(q)
+                acc[1] = acc.get(1, 0) - c*sympy.sin(q)
+        result = Vec([(code, acc[code]) for code in (1, 2) if code in acc and acc[code] != 0])
+        result.logs = self.logs + '\nChemical shift of I by ' + str(q) + '\n' + str(result)
+        return result
+
+    def __str__(self):
+        return ' + '.join(str(c) + '*I' + 'xy'[code - 1] for (code,), c in zip(self.axis, self.coef))
+
+def run(engine, ops):
+    results = []
+    for op in ops:
+        engine.submit(op)
+    t0 = time.time()
+    while engine.busy():
+        assert time.time() - t0 < 30
+        for op, status, result in engine.poll():
+            assert status == 'done', result
+            results.append(result)
+        time.sleep(0.01)
+    return results
+
+def test_term_parallel_matches_serial():
+    a, b, q, r = sympy.symbols('a b q r')
+    rho = Vec([(1, a), (2, b)], 'a*Ix + b*Iy')
+    ops = [('cs', (['I'], [q])), ('cs', (['I'], [r]))]
+    engine = CalcEngine(['I'], 'none', rho, parallel=2, verify=True)
+    try:
+        assert isinstance(engine.worker, PoolWorker)
+        parallel = run(engine, ops)
+        assert engine.warnings == []
+    finally:
+        engine.close()
+    serial = rho
+    for op, result in zip(ops, parallel):
+        serial = apply_operation(serial, op)
+        assert str(result) == str(serial)
+    # Same log text as PO writes, segment by segment
+    assert rho.logs + ''.join(r.logs for r in parallel) == serial.logs
+
+def test_mismatch_keeps_the_serial_result():
+    a, b, q = sympy.symbols('a b q')
+    rho = Vec([(1, a), (2, b)])
+    op = ('cs', (['I'], [q]))
+    parts = [apply_operation(term, op) for term in split_terms(rho)]
+    wrong = Vec([(1, a)]) # Not the serial result of op
+    result = _merge_result(rho, op, parts, 'none', serial=wrong)
+    assert result is wrong and 'does not match' in result.warning
+    result = _merge_result(rho, op, parts, 'none', serial=apply_operation(rho, op))
+    assert not hasattr(result, 'warning')
+
+def test_phase_cycle_steps_run_on_the_pool():
+    a, b, q, r = sympy.symbols('a b q r')
+    rho = Vec([(1, a), (2, b)], 'a*Ix + b*Iy')
+    steps = [([('cs', (['I'], [q]))], 'x', ['I'], 1), ([('cs', (['I'], [r]))], 'y', ['I'], 2)]
+    op = ('phase_cycle', (steps, 'none'))
+    engine = CalcEngine(['I'], 'none', rho, parallel=2)
+    try:
+        assert isinstance(engine.worker, PoolWorker)
+        result, = run(engine, [op])
+    finally:
+        engine.close()
+    serial = apply_operation(rho, op)
+    assert str(result) == str(serial) and rho.logs + result.logs == serial.logs
+    assert result.expr_size > 0
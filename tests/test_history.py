@@ -0,0 +1,110 @@
+#  Run with: python -m pytest tests
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PO_Engine import CalcEngine
+from PO_History import History
+
+class Term(object):
+    # Minimal object with the interface CalcEngine and History use (logs, cs).
+    def __init__(self, angle=0, logs=''):
+        self.angle = angle
+        self.logs = logs
+        self.axis = [[1]] # One term, for the cache keys
+        self.coef = [angle]
+
+    def cs(self, sp_cell, q_cell):
+        angle = self.angle + sum(q_cell)
+        return Term(angle, self.logs + '\ncs(' + str(q_cell[0]) + ')\n' + str(angle))
+
+def run(engine, rho_cell, ops):
+    for op in ops:
+        engine.submit(op)
+    while engine.busy():
+        for op, status, result in engine.poll():
+            assert status == 'done'
+            rho_cell.append(op, result)
+        time.sleep(0.01)
+
+def test_consecutive_steps_store_segments():
+    rho = Term(0, 'Iz')
+    rho_cell = History(rho, spill=False)
+    engine = CalcEngine(['I'], 'none', rho_cell[-1], use_process=False)
+    try:
+        run(engine, rho_cell, [('cs', (['I'], [1])), ('cs', (['I'], [2])), ('cs', (['I'], [3]))])
+    finally:
+        engine.close()
+    assert rho_cell.segments() == ['Iz', '\ncs(1)\n1', '\ncs(2)\n3', '\ncs(3)\n6']
+    assert rho_cell.logs() == 'Iz\n\ncs(1)\n1\n\ncs(2)\n3\n\ncs(3)\n6'
+    assert rho_cell[-1].angle == 6
+
+def test_cache_hits_through_engine(tmp_path):
+    from PO_Cache import CacheThread
+    ops = [('cs', (['I'], [1])), ('cs', (['I'], [2]))]
+    logs = []
+    for run_no in range(2):
+        cache = CacheThread(str(tmp_path / 'cache.sqlite'), 'none')
+        rho_cell = History(Term(0, 'Iz'), spill=False)
+        engine = CalcEngine(['I'], 'none', rho_cell[-1], use_process=False, cache=cache)
+        try:
+            run(engine, rho_cell, ops)
+            stats = cache.stats()
+        finally:
+            engine.close()
+        logs.append(rho_cell.logs())
+    assert stats['hits'] == 2 and stats['misses'] == 0
+    assert logs[0] == logs[1]
+
+def test_race_without_processes_simplifies():
+    from PO_Race import Racer
+    rho_cell = History(Term(0, 'Iz'), spill=False)
+    engine = CalcEngine(['I'], 'none', rho_cell[-1], use_process=False, racer=Racer(['simplify']))
+    try:
+        run(engine, rho_cell, [('cs', (['I'], [1]))])
+    finally:
+        engine.close()
+    assert '\nSimplification: simplify\n' in rho_cell.segments()[-1]
+
+def test_replay_does_not_evaluate(tmp_path):
+    from PO_Journal import Journal, replay
+    rho = Term(0, 'Iz')
+    rho_cell = History(rho, spill=False)
+    file = str(tmp_path / 'session.pojournal')
+    journal = Journal(file, {'SpinLabel': ['I'], 'simp': 'none', 'rho_str': 'Iz'})
+    journal.start(rho_cell)
+    rho_cell.journal = journal
+    for q in (1, 2):
+        rho_cell.append(('cs', (['I'], [q])), rho_cell[-1].cs(['I'], [q]))
+    journal.close()
+
+    replayed = replay(file, Term(0, 'Iz'), spill=False)
+    assert replayed.logs() == rho_cell.logs()
+    missing = replayed.missing()
+    assert missing == replayed.path[1:]
+    state = replayed.state(0)
+    for idx in missing:
+        state = state.cs(*replayed.nodes[idx].op[1])
+        replayed.fill(idx, state)
+    assert replayed.missing() == []
+    assert replayed[-1].angle == 3
+
+def test_moves_leave_dropped_states_to_the_engine(monkeypatch):
+    import pickle
+    rho_cell = History(Term(0, 'Iz'), budget=1, spill=False)
+    engine = CalcEngine(['I'], 'none', rho_cell[-1], use_process=False)
+    monkeypatch.setattr(pickle, 'dumps', None) # Sizes are estimated, not pickled
+    try:
+        run(engine, rho_cell, [('cs', (['I'], [1])), ('cs', (['I'], [2]))])
+    finally:
+        engine.close()
+    assert rho_cell[-1].expr_size == 0 # Measured on the worker
+    assert rho_cell.nodes[rho_cell.current()].size > 0
+    monkeypatch.setattr(Term, 'cs', None) # Nothing is recomputed here
+    rho_cell.pop()
+    assert rho_cell.missing() == rho_cell.path[1:] # Dropped, budget=1
+    rho_cell.redo()
+    assert rho_cell.missing() == [] # The current state stays in memory
@@ -0,0 +1,43 @@
+#  Run with: python -m pytest tests
+
+import os
+import sys
+
+import numpy as np
+import sympy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PO_Numeric import acquire_to_file
+
+class State(object):
+    # cos(q)*Ix + sin(q)*Iy of one spin, with the attributes term_items reads.
+    def __init__(self):
+        q = sympy.Symbol('q')
+        self.axis = [[1], [2]]
+        self.coef = [sympy.cos(q), sympy.sin(q)]
+        self.logs = ''
+
+def test_large_2d_fid_goes_to_memmaps(tmp_path):
+    args = (State(), ['I'], ['I'], {'oI': 30.0}, 1e-3, 64)
+    kwargs = {'T2': 0.05, 't1': ('q', np.linspace(0, 3, 40))}
+    small = acquire_to_file(*args, str(tmp_path / 'small.npz'), **kwargs)
+    large = acquire_to_file(*args, str(tmp_path / 'large.npz'), chunk_points=100, memory_limit=0, **kwargs)
+    assert [os.path.basename(f) for f in large] == ['large_fid.npy', 'large_spectrum.npy', 'large_axes.npz']
+    with np.load(small[0]) as ref, np.load(large[2]) as axes:
+        assert np.allclose(np.load(large[0], mmap_mode='r'), ref['fid'])
+        assert np.allclose(np.load(large[1], mmap_mode='r'), ref['spectrum'])
+        assert np.allclose(axes['freq'], ref['freq']) and np.allclose(axes['t1'], ref['t1'])
+
+def test_sweep_without_symbols(tmp_path):
+    from PO_Numeric import sweep_to_file
+    rho = State()
+    rho.coef = [sympy.Integer(1), sympy.Rational(1, 2)]
+    for limit in (2**20, 0):
+        files = sweep_to_file(rho, {}, str(tmp_path / ('sweep' + str(limit) + '.npz')), memory_limit=limit)
+        if limit > 0:
+            with np.load(files[0]) as data:
+                values = data['values']
+        else:
+            values = np.load(files[0])
+        assert values.shape == (2,) and np.allclose(values, [1, 0.5])
@@ -0,0 +1,41 @@
+#  Run with: python -m pytest tests
+
+import os
+import sys
+
+import sympy
+from sympy import pi
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PO_Optimize import optimize_sequence, reduce_angle
+
+a, t = sympy.symbols('a t')
+
+def test_fuses_cs_and_jc_runs():
+    ops = [('cs', (['I'], [a])), ('jc', (['IS'], [pi*t])), ('cs', (['I', 'S'], [a, t])), ('jc', (['IS'], [pi*t]))]
+    out, saved = optimize_sequence(ops)
+    assert out == [('cs', (['I', 'S'], [2*a, t])), ('jc', (['IS'], [2*pi*t]))]
+    assert saved == 2
+
+def test_reduces_angles_modulo_2pi():
+    assert reduce_angle(5*pi/2) == pi/2
+    assert reduce_angle(-pi/2) == 3*pi/2
+    assert reduce_angle(a + 9*pi/4) == a + pi/4
+    out, saved = optimize_sequence([('cs', (['I'], [3*pi/2])), ('cs', (['I'], [pi])), ('cs', (['S'], [2*pi]))])
+    assert out == [('cs', (['I'], [pi/2]))] and saved == 2
+    out, saved = optimize_sequence([('cs', (['I'], [pi])), ('cs', (['I'], [pi]))])
+    assert out == [] and saved == 2
+
+def test_fuses_across_dropped_pulses():
+    ops = [('cs', (['I'], [a])), ('pulse', (['I'], ['x'], [2*pi])), ('cs', (['I'], [a]))]
+    assert optimize_sequence(ops) == ([('cs', (['I'], [2*a]))], 2)
+    # A pulse that rotates stops the block; only its 2*pi spins are dropped.
+    ops = [('cs', (['I'], [a])), ('pulse', (['I', 'S'], ['x', 'y'], [pi/2, 4*pi])), ('cs', (['I'], [a]))]
+    out, saved = optimize_sequence(ops)
+    assert out == [('cs', (['I'], [a])), ('pulse', (['I'], ['x'], [pi/2])), ('cs', (['I'], [a]))]
+    assert saved == 0
+
+def test_drops_repeated_simplification():
+    ops = [('simplify', ('TR8',)), ('simplify', ('TR8',)), ('simplify', ('fu',))]
+    assert optimize_sequence(ops) == ([('simplify', ('TR8',)), ('simplify', ('fu',))], 1)
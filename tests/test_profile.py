@@ -0,0 +1,58 @@
+#  Run with: python -m pytest tests
+
+import os
+import sys
+
+import sympy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PO_Engine import apply_operation
+from PO_Profile import Profiler, profile_operation
+
+class Term(object):
+    # One term c*Ix. cs multiplies c by cos(q)**2 + sin(q)**2 and, like PO,
+    # simplifies with the method in the class attribute simp.
+    simp = 'simplify'
+
+    def __init__(self, coef, logs=''):
+        self.axis = [[1]]
+        self.coef = [coef]
+        self.logs = logs
+
+    def cs(self, sp_cell, q_cell):
+        q = q_cell[0]
+        coef = self.coef[0]*(sympy.cos(q)**2 + sympy.sin(q)**2)
+        if Term.simp == 'simplify':
+            coef = sympy.simplify(coef)
+        result = Term(coef)
+        result.logs = self.logs + '\ncs(' + str(q) + ')\n' + str(result)
+        return result
+
+    def __str__(self):
+        return str(self.coef[0]) + '*Ix'
+
+def test_rotation_and_simp_are_measured_apart():
+    x, y = sympy.symbols('x y')
+    op = ('cs', (['I'], [y]))
+    result = profile_operation(Term(x, 'Ix'), op)
+    record = result.profile
+    assert Term.simp == 'simplify'
+    assert record['rotate'] >= 0 and record['simp'] >= 0
+    assert record['compute'] == record['rotate'] + record['simp']
+    assert record['ops_rotated'] > record['ops_out'] == record['ops_in'] == 0
+    assert result.coef == [x]
+    assert result.logs == apply_operation(Term(x, 'Ix'), op).logs
+
+def test_lazy_simp_is_not_split():
+    Term.simp = 'none'
+    try:
+        record = profile_operation(Term(sympy.Symbol('x')), ('cs', (['I'], [1]))).profile
+    finally:
+        Term.simp = 'simplify'
+    assert 'rotate' not in record and record['ops_out'] > 0
+
+def test_display_rows():
+    profiler = Profiler()
+    profiler.add_display('reset_Disp_text', 0.5)
+    assert profiler.records == [{'op': 'reset_Disp_text', 'display': 0.5}]
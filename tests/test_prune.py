@@ -0,0 +1,54 @@
+#  Run with: python -m pytest tests
+
+import os
+import sys
+
+import pytest
+from sympy import pi
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PO_Engine import apply_operation, term_items
+from PO_Prune import Pruner, same_observable
+from PO_Sparse import SparsePO
+
+SpinLabel = ['I', 'S', 'K']
+
+def run(rho, ops, pruner=None):
+    for ii, op in enumerate(ops):
+        if pruner is not None:
+            rho = pruner.prune(rho, ii)
+        rho = apply_operation(rho, op)
+    return rho
+
+# INEPT-like transfer I -> S with a passive spin K, and a sequence with
+# pulses at other phases and several couplings.
+Sequences = [
+    [('pulse', (['I'], ['x'], [pi/2])), ('jc', (['IS', 'IK'], [pi/2, pi/3])), ('cs', (['I', 'S'], [pi/5, pi/7])),
+     ('pulse', (['I', 'S'], ['y', 'x'], [pi/2, pi/2])), ('jc', (['IS'], [pi/2])), ('cs', (['S'], [pi/4]))],
+    [('pulse', (['I', 'S', 'K'], ['x', 'x', 'y'], [pi/3, pi/2, pi/4])), ('jc', (['IS', 'SK'], [pi/4, pi/6])),
+     ('pulse_phshift', (['S'], [pi/3], [pi/2])), ('cs', (['I', 'K'], [pi/2, pi/3])), ('jc', (['IK'], [pi/2]))],
+]
+
+@pytest.mark.parametrize('ops', Sequences)
+@pytest.mark.parametrize('observable', [['S'], ['Ix'], ['Kx', 'Ky']])
+def test_pruned_run_keeps_the_observable(ops, observable):
+    rho = SparsePO(SpinLabel, [3, 3*4, 3*16], [1.0, 1.0, 1.0]) # Iz + Sz + Kz
+    full = run(rho, ops)
+    pruner = Pruner(SpinLabel, observable, ops)
+    pruned = run(rho, ops, pruner)
+    assert same_observable(pruned, full, SpinLabel, observable)
+    # Every term of the unpruned run that can still reach the observable is kept.
+    state = rho
+    for ii, op in enumerate(ops):
+        kept = set(axis for axis, coef in term_items(pruner.prune(state, ii)))
+        assert set(axis for axis, coef in term_items(state) if axis in pruner.reach[ii]) <= kept
+        state = apply_operation(state, op)
+
+def test_terms_are_dropped():
+    ops = Sequences[0]
+    rho = SparsePO(SpinLabel, [3, 3*4, 3*16], [1.0, 1.0, 1.0])
+    pruner = Pruner(SpinLabel, ['S'], ops)
+    pruned = run(rho, ops, pruner)
+    assert pruner.dropped > 0
+    assert not same_observable(pruned, run(rho, ops[:-1]), SpinLabel, ['S']) # The comparison can fail
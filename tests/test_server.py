@@ -0,0 +1,109 @@
+#  Run with: python -m pytest tests
+#  Each test starts PO_Server on a temporary Unix socket with a temporary key.
+
+import os
+import signal
+import sys
+import time
+from multiprocessing import AuthenticationError
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PO_Engine import mp_context
+from PO_Server import ComputeServer, ServerWorker, connect, server_stats
+
+class Slow(object):
+    # cs takes delay s, so that a job is still running when others arrive.
+    def __init__(self, angle=0, logs='', delay=0.5):
+        self.angle = angle
+        self.logs = logs
+        self.delay = delay
+        self.axis = [[1]]
+        self.coef = [angle]
+
+    def cs(self, sp_cell, q_cell):
+        time.sleep(self.delay)
+        angle = self.angle + sum(q_cell)
+        return Slow(angle, self.logs + '\ncs(' + str(q_cell[0]) + ')\n' + str(angle), self.delay)
+
+def serve(address, key_file, cache_file):
+    ComputeServer(address, 2, key_file, cache_file).serve_forever()
+
+@pytest.fixture
+def server(tmp_path):
+    address = str(tmp_path / 'server.sock')
+    key_file = str(tmp_path / 'server.key')
+    proc = mp_context()[0].Process(target=serve, args=(address, key_file, str(tmp_path / 'cache.sqlite')))
+    proc.start()
+    t0 = time.time()
+    while not os.path.exists(address):
+        assert time.time() - t0 < 10 and proc.is_alive()
+        time.sleep(0.01)
+    yield address, key_file, proc
+    if proc.is_alive():
+        os.kill(proc.pid, signal.SIGINT)
+        proc.join(5)
+    if proc.is_alive():
+        proc.terminate()
+
+def test_clients_share_a_running_job(server):
+    address, key_file, proc = server
+    op = ('cs', (['I'], [1]))
+    conns = [connect(address, key_file) for ii in range(2)]
+    conns[0].send(('run', ['I'], 'none', Slow(0, 'Iz'), op))
+    conns[1].send(('run', ['I'], 'none', Slow(0, 'Iz (client 2)'), op))
+    replies = [conn.recv() for conn in conns]
+    for conn in conns:
+        conn.close()
+    assert [status for status, result in replies] == ['done', 'done']
+    assert replies[0][1].logs == 'Iz\ncs(1)\n1'
+    assert replies[1][1].logs == 'Iz (client 2)\ncs(1)\n1'
+    stats = server_stats(address, key_file)
+    assert stats['requests'] == 2 and stats['computed'] == 1 and stats['shared'] == 1
+
+def test_wrong_key_is_rejected(server, tmp_path):
+    address, key_file, proc = server
+    wrong_key = str(tmp_path / 'wrong.key')
+    with open(wrong_key, 'w') as fob:
+        fob.write('0'*64)
+    with pytest.raises(AuthenticationError):
+        connect(address, wrong_key)
+    assert server_stats(address, key_file)['requests'] == 0 # Still serving
+
+def test_worker_falls_back_when_server_is_killed(server):
+    address, key_file, proc = server
+    worker = ServerWorker(['I'], 'none', address, key_file, use_process=False)
+    try:
+        worker.send(Slow(0, 'Iz'), ('cs', (['I'], [2])))
+        time.sleep(0.1)
+        os.kill(proc.pid, signal.SIGKILL) # While the job runs on the server
+        proc.join(5)
+        t0 = time.time()
+        while not worker.poll():
+            assert time.time() - t0 < 10
+            time.sleep(0.01)
+        status, result = worker.recv()
+        assert status == 'done' and result.angle == 2
+        assert worker.local is not None # Later jobs run in-process
+        worker.send(result, ('cs', (['I'], [1])))
+        while not worker.poll():
+            time.sleep(0.01)
+        assert worker.recv()[1].angle == 3
+    finally:
+        worker.close()
+
+def test_client_that_does_not_read_blocks_no_one(server):
+    address, key_file, proc = server
+    stalled = connect(address, key_file)
+    stalled.send(('run', ['I'], 'none', Slow(0, 'x'*2**23, delay=0), ('cs', (['I'], [1])))) # 8 MB reply, never read
+    time.sleep(0.5)
+    conn = connect(address, key_file)
+    try:
+        conn.send(('run', ['I'], 'none', Slow(0, 'Iz', delay=0), ('cs', (['I'], [2]))))
+        assert conn.poll(10)
+        assert conn.recv()[1].angle == 2
+    finally:
+        conn.close()
+        stalled.close()
@@ -0,0 +1,61 @@
+#  Run with: python -m pytest tests
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PO_Sparse import SparsePO, parse_values, sparse_namespace
+
+q = 0.3
+c, s = np.cos(q), np.sin(q)
+
+def terms(rho):
+    # {label: coefficient}, e.g. {'Ix': 1.0, '2IySz': 0.5}
+    out = {}
+    for key, coef in zip(rho.keys.tolist(), rho.coef_array.tolist()):
+        codes = [(key // 4**k) % 4 for k in range(len(rho.spin_label))]
+        n = sum(code > 0 for code in codes)
+        label = ''.join(SL + 'Exyz'[code] for SL, code in zip(rho.spin_label, codes) if code > 0)
+        out[(str(2**(n-1)) if n > 1 else '') + label] = coef
+    return out
+
+def state(text):
+    return sparse_namespace(['I', 'S']).parse(text)
+
+def test_pulse():
+    assert terms(state('Iz').pulse(['I'], ['x'], [q])) == pytest.approx({'Iz': c, 'Iy': -s})
+    assert terms(state('Iz').pulse(['I'], ['y'], [q])) == pytest.approx({'Iz': c, 'Ix': s})
+    assert terms(state('Iz').pulse(['I'], ['-x'], [q])) == pytest.approx({'Iz': c, 'Iy': s})
+    # A phase of pi/2 is a y pulse.
+    assert terms(state('Iz').pulse_phshift(['I'], [np.pi/2], [q])) == pytest.approx({'Iz': c, 'Ix': s})
+    assert terms(state('Iz + Sz').pulse(['I', 'S'], ['x', 'x'], [np.pi/2, np.pi/2])) == \
+        pytest.approx({'Iy': -1.0, 'Sy': -1.0})
+
+def test_cs():
+    assert terms(state('Ix').cs(['I'], [q])) == pytest.approx({'Ix': c, 'Iy': s})
+    assert terms(state('Iy').cs(['I'], [q])) == pytest.approx({'Iy': c, 'Ix': -s})
+    assert terms(state('Sx').cs(['I'], [q])) == {'Sx': 1.0}
+
+def test_jc():
+    # Ix -> cos(q)*Ix + sin(q)*2IySz, and back from antiphase to in-phase.
+    assert terms(state('Ix').jc(['IS'], [q])) == pytest.approx({'Ix': c, '2IySz': s})
+    assert terms(state('Iy').jc(['IS'], [q])) == pytest.approx({'Iy': c, '2IxSz': -s})
+    assert terms(state('2*Ix*Sz').jc(['IS'], [q])) == pytest.approx({'2IxSz': c, 'Iy': s})
+    assert terms(state('Iz + Ix*Sx').jc(['IS'], [q])) == pytest.approx({'Iz': 1.0, '2IxSx': 0.5})
+    rho = state('Ix').jc(['IS'], [np.pi/2])
+    assert terms(rho) == pytest.approx({'2IySz': 1.0}) # The cos term is dropped
+    assert rho.logs.startswith('Ix\njc(IS, ')
+
+def test_namespace_functions():
+    values = parse_values('b=sqrt(2)/2, t=exp(0)')
+    assert values == {'b': pytest.approx(np.sqrt(2)/2), 't': 1.0}
+    table = sparse_namespace(['I', 'S'], values)
+    rho = table.parse('cos(b)*Ix + sin(pi/6)*Sz')
+    assert dict(zip(rho.keys.tolist(), rho.coef_array.tolist())) == {1: pytest.approx(np.cos(np.sqrt(2)/2)),
+                                                                    12: pytest.approx(0.5)}
+    with pytest.raises(ValueError, match='needs values for c'):
+        sparse_namespace(['I']).parse('cos(c)*Ix')
@@ -0,0 +1,31 @@
+#  Run with: python -m pytest tests
+
+import os
+import sys
+
+import pytest
+import sympy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PO_Engine import SymbolTable
+
+def test_undefined_names_become_symbols():
+    table = SymbolTable({'pi': sympy.pi})
+    value = table.parse('pi*JIS*t')
+    assert value == sympy.pi*sympy.Symbol('JIS')*sympy.Symbol('t')
+    assert table['JIS'] is sympy.Symbol('JIS') and 't' in table
+    with pytest.raises(NameError):
+        table.parse('__import__')
+
+def test_parsed_texts_are_cached():
+    table = SymbolTable({'pi': sympy.pi}, cache_size=2)
+    first = table.parse('pi/2')
+    assert table.parse(' pi / 2 ') is first # Same text without spaces: no eval
+    assert list(table.parsed) == ['pi/2']
+    table.parse('q')
+    table.parse('pi/2') # Hit: most recently used again
+    table.parse('2*q')
+    assert list(table.parsed) == ['pi/2', '2*q'] # 'q' was the least recently used
+    assert table.parse('q') == sympy.Symbol('q')
+    assert list(table.parsed) == ['2*q', 'q']